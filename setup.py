@@ -20,6 +20,12 @@ requires = [
     'waitress'
 ]
 
+extras_require = {
+    'argon2': ['argon2-cffi'],
+    'asgi': ['motor', 'uvicorn'],
+    'json': ['orjson']
+}
+
 setup(
     name='stackcite.users',
     version='0.0',
@@ -31,6 +37,7 @@ setup(
     packages=['stackcite.users'],
     namespace_packages=['stackcite'],
     install_requires=requires,
+    extras_require=extras_require,
     classifiers=[
     "Programming Language :: Python",
     "Framework :: Pyramid",
@@ -43,5 +50,10 @@ setup(
     entry_points="""\
     [paste.app_factory]
     main = stackcite.users:main
+    [console_scripts]
+    stackcite-users-backup = stackcite.users.scripts.backup:main
+    stackcite-users-import = stackcite.users.scripts.imports:main
+    stackcite-users-outbox = stackcite.users.scripts.outbox:main
+    stackcite-users-benchmark = stackcite.users.testing.benchmarks:main
     """,
 )
@@ -1,33 +1,191 @@
-import mongoengine
-
 from pyramid.config import Configurator
 from pyramid.authorization import ACLAuthorizationPolicy
-from pyramid.renderers import JSON
+from pyramid.settings import asbool
+from pyramid.tweens import EXCVIEW
 
 from stackcite import api
 
-from . import auth, resources
+from . import (
+    auth,
+    codec,
+    db,
+    hashers,
+    hashing,
+    imports,
+    instrumentation,
+    metrics,
+    models,
+    outbox,
+    resources,
+    schema
+)
 
 
 def root_factory(request=None):
     root = resources.UserCollection(None, '')
     root['auth'] = resources.AuthResource
     root['conf'] = resources.ConfirmResource
+    root['import'] = resources.ImportResource
+    settings = getattr(getattr(request, 'registry', None), 'settings', None)
+    if asbool((settings or {}).get('metrics.enabled', False)):
+        root['metrics'] = resources.MetricsResource
     return root
 
 
 def main(global_config, **settings):
     """ This function returns a Pyramid WSGI application.
     """
-    mongoengine.connect(
-        host=settings['mongo.host'],
-        db=settings['mongo.db']
-    )
+    # Request timings (the command listener must exist before connecting)
+    instrumented = asbool(settings.get('instrumentation.enabled', False))
+    if instrumented:
+        instrumentation.register_listener()
+
+    # Service metrics
+    measured = asbool(settings.get('metrics.enabled', False))
+    if measured:
+        metrics.register_listener()
+        metrics.REGISTRY.configure(
+            multiprocess_dir=settings.get('metrics.multiprocess_dir'),
+            snapshot_interval=settings.get('metrics.snapshot_interval', 5))
+        metrics.HASH_COSTS.configure(
+            settings.get('metrics.hash_costs_interval', 300))
+
+    # Database connection (opened lazily, once per process). Nothing in
+    # main() may use it: a client that connects before a pre-forking server
+    # forks its workers would be shared with them
+    db.CONNECTION.configure(
+        settings['mongo.host'],
+        settings['mongo.db'],
+        **db.client_options(settings))
+
+    # Read routing (see the README before sending reads to secondaries)
+    db.READS.configure(
+        preferences=dict(
+            (operation, settings.get('mongo.read.' + operation))
+            for operation in db.READ_OPERATIONS),
+        max_staleness=settings.get('mongo.read.max_staleness', -1),
+        fallback=asbool(settings.get('mongo.read.fallback', True)))
+
     config = Configurator(
         settings=settings,
         root_factory=root_factory)
 
+    # In-process token cache
+    auth.TOKEN_CACHE.configure(
+        size=settings.get('auth.token_cache.size', 0),
+        ttl=settings.get('auth.token_cache.ttl', 5))
+
+    # Negative token cache and coalesced token lookups
+    auth.NEGATIVE_CACHE.configure(
+        size=settings.get('auth.negative_cache.size', 0),
+        ttl=settings.get('auth.negative_cache.ttl', 5))
+    auth.TOKEN_LOOKUPS.enabled = asbool(
+        settings.get('auth.single_flight', True))
+
+    # Password hashing executor
+    hashing.HASHING_POOL.configure(
+        kind=settings.get('hashing.pool', 'none'),
+        workers=settings.get('hashing.workers', 1),
+        queue_depth=settings.get('hashing.queue_depth', 0),
+        retry_after=settings.get('hashing.retry_after', 1))
+
+    # Password hashing cost (calibrated to a target time if one is set)
+    target_ms = settings.get('hashing.target_ms')
+    if target_ms:
+        rounds = hashing.calibrate(
+            target_ms,
+            min_rounds=settings.get('hashing.min_rounds', 10),
+            max_rounds=settings.get('hashing.max_rounds', 16))
+    else:
+        rounds = settings.get('hashing.rounds', 12)
+    hashing.set_rounds(rounds)
+    hashing.set_rehash_policy(settings.get('hashing.rehash', 'upgrade'))
+
+    # Password hashing algorithm
+    hashers.HASHERS.get('scrypt').configure(
+        n=settings.get('hashing.scrypt.n', 2 ** 14),
+        r=settings.get('hashing.scrypt.r', 8),
+        p=settings.get('hashing.scrypt.p', 1))
+    hashers.HASHERS.get('argon2').configure(
+        time_cost=settings.get('hashing.argon2.time_cost', 3),
+        memory_cost=settings.get('hashing.argon2.memory_cost', 65536),
+        parallelism=settings.get('hashing.argon2.parallelism', 4))
+    hashers.HASHERS.configure(settings.get('hashing.algorithm', 'bcrypt'))
+
+    # Bulk user imports
+    imports.USER_IMPORTER.configure(
+        workers=settings.get('import.workers', 0),
+        batch_size=settings.get('import.batch_size', 500))
+
+    # Login rate limits
+    auth.LOGIN_LIMITER.configure(
+        window=settings.get('auth.rate_limit.window', 60),
+        per_email=settings.get('auth.rate_limit.per_email', 0),
+        per_address=settings.get('auth.rate_limit.per_address', 0),
+        size=settings.get('auth.rate_limit.size', 10000),
+        path=settings.get('auth.rate_limit.path') or None,
+        trusted_proxies=settings.get('auth.rate_limit.trusted_proxies', ''))
+
+    # Token mode
+    token_mode = settings.get('auth.token_mode', 'document')
+    if token_mode not in auth.TOKEN_MODES:
+        msg = 'Invalid token mode: {}'.format(token_mode)
+        raise ValueError(msg)
+    token_secret = None
+    if token_mode == 'signed':
+        token_secret = settings['auth.token_secret']
+    auth.TOKEN_SIGNER.configure(
+        secret=token_secret,
+        ttl=settings.get('auth.token_ttl', 3600))
+    auth.TOKEN_SIGNER.revocations.configure(
+        cache_size=settings.get('auth.revocations.cache_size', 10000),
+        cache_ttl=settings.get('auth.revocations.cache_ttl', 5))
+
+    # Token key filter (built and kept current by a thread in each process,
+    # started by its first token check, so nothing is read before a fork)
+    auth.TOKEN_FILTER.configure(
+        capacity=settings.get('auth.token_filter.capacity', 0),
+        error_rate=settings.get('auth.token_filter.error_rate', 0.001),
+        sync_interval=settings.get('auth.token_filter.sync_interval', 0.1),
+        rebuild_interval=settings.get(
+            'auth.token_filter.rebuild_interval', 600))
+
+    # Token issuance write concern ("0" skips waiting for an acknowledgement)
+    token_w = settings.get('auth.token_write_concern')
+    if token_w is not None:
+        token_w = str(token_w)
+        token_w = int(token_w) if token_w.isdigit() else token_w
+        models.AuthToken.WRITE_CONCERN = {'w': token_w}
+
+    # Write-behind token touches
+    models.TOUCH_COALESCER.configure(
+        interval=float(settings.get('auth.touch.interval_ms', 0)) / 1000,
+        max_batch=settings.get('auth.touch.max_batch', 500))
+
+    # Outbox delivery ("thread" delivers from every worker process, "none"
+    # leaves it to `stackcite-users-outbox`)
+    outbox.DISPATCHER.configure(
+        transport=outbox.transport_from_settings(settings),
+        background=settings.get('outbox.dispatcher', 'thread') == 'thread',
+        batch_size=settings.get('outbox.batch_size', 100),
+        interval=settings.get('outbox.interval', 1),
+        max_attempts=settings.get('outbox.max_attempts', 8),
+        delay=settings.get('outbox.retry_delay', 5),
+        max_delay=settings.get('outbox.max_retry_delay', 300),
+        lease=settings.get('outbox.lease', 60))
+
+    # Serializers
+    schema.SCHEMAS.configure(
+        enabled=asbool(settings.get('schema.cache', True)),
+        compiled=asbool(settings.get('schema.compiled', True)))
+
+    # JSON codec
+    codec.CODEC.configure(
+        name=settings.get('json.codec', 'auto'),
+        max_body_size=settings.get('json.max_body_size', codec.MAX_BODY_SIZE))
+
     # Custom request attributes
+    config.add_request_method(codec.json_body, 'json_body', reify=True)
     config.add_request_method(auth.get_token, 'token', reify=True)
     config.add_request_method(auth.get_user, 'user', reify=True)
 
@@ -37,8 +195,37 @@ def main(global_config, **settings):
     config.set_authentication_policy(authentication_policy)
     config.set_authorization_policy(authorization_policy)
 
+    # Request-scoped identity map (below the exception view, so that failed
+    # requests are not flushed)
+    if asbool(settings.get('identity_map.enabled', False)):
+        config.add_tween(
+            'stackcite.users.identity.identity_map_tween_factory',
+            under=EXCVIEW)
+
+    # Per-request timings and metrics
+    if instrumented:
+        config.add_tween(
+            'stackcite.users.instrumentation.timing_tween_factory')
+    if measured:
+        config.add_tween('stackcite.users.metrics.metrics_tween_factory')
+        cache = auth.TOKEN_CACHE
+        metrics.TOKEN_CACHE_HITS.set_function(lambda: cache.hits)
+        metrics.TOKEN_CACHE_MISSES.set_function(lambda: cache.misses)
+        metrics.TOKEN_CACHE_HIT_RATIO.set_function(
+            lambda: cache.hits / max(cache.hits + cache.misses, 1))
+        negative_cache = auth.NEGATIVE_CACHE
+        metrics.TOKEN_NEGATIVE_CACHE_HITS.set_function(
+            lambda: negative_cache.hits)
+        metrics.TOKEN_LOOKUPS_SHARED.set_function(
+            lambda: auth.TOKEN_LOOKUPS.shared)
+        metrics.TOKEN_FILTER_KEYS.set_function(
+            lambda: auth.TOKEN_FILTER.keys)
+        metrics.HASHING_QUEUE_DEPTH.set_function(
+            lambda: hashing.HASHING_POOL.pending)
+        metrics.HASHING_COST.set_function(lambda: hashing.BCRYPT_ROUNDS)
+
     # JSON response rendering
-    config.add_renderer('json', JSON())
+    config.add_renderer('json', codec.JSONRenderer())
 
     # Scan for decorators
     config.scan(api)
@@ -0,0 +1,383 @@
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+from concurrent import futures
+from urllib.parse import unquote
+
+from mongoengine import context_managers
+from pyramid.settings import asbool
+from stackcite.api.validators import keys
+
+from stackcite.users import (
+    auth, codec, db, instrumentation, metrics, models, schema)
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key.decode('latin-1').lower() == name:
+            return value.decode('latin-1')
+
+
+def build_environ(scope, body, length=None):
+    """
+    Builds a WSGI environ for an ASGI HTTP scope and its request body, given
+    as bytes or as a file positioned at the start of its `length` bytes.
+    """
+    if isinstance(body, bytes):
+        body, length = io.BytesIO(body), len(body)
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    path = scope['path']
+    root_path = scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path,
+        'PATH_INFO': unquote(path, encoding='latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope.get('headers', ()):
+        key = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[key] = value
+            continue
+        key = 'HTTP_' + key
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+
+def _iter_body(result):
+    try:
+        yield from result
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+def call_wsgi(wsgi_app, environ):
+    """
+    Calls a WSGI application and returns its status code, headers, first
+    body chunk and an iterator over the rest of its body. The rest is only
+    produced as it is iterated (e.g. a streamed import response), so the
+    iterator must be exhausted or closed.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    body = _iter_body(wsgi_app(environ, start_response))
+    # Applications may call `start_response` as late as their first chunk
+    first = next(body, b'')
+    return response['status'], response['headers'], first, body
+
+
+class AsyncTokenStore(object):
+    """
+    Looks up :class:`~AuthToken` documents with the asyncio MongoDB driver
+    (`motor`).
+    """
+
+    def __init__(self, host, db, **options):
+        self.host = host
+        self.db = db
+        self.options = options
+        self._client = None
+        self._lookups = {}
+
+    @property
+    def collection(self):
+        if self._client is None:
+            # Imported lazily; `motor` is only required for the ASGI mode
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self._client = AsyncIOMotorClient(self.host, **self.options)
+        name = models.AuthToken._get_collection_name()
+        return self._client[self.db][name]
+
+    async def _find(self, key):
+        # Same routing as :meth:`~stackcite.users.db.ReadRouter.get`
+        collection = self.collection
+        if db.READS.on_primary('token'):
+            return await collection.find_one({'_id': key})
+        preference = db.READS.read_preference('token')
+        son = await collection.with_options(
+            read_preference=preference).find_one({'_id': key})
+        if son is None and db.READS.fallback:
+            metrics.REPLICA_READ_FALLBACKS.inc(operation='token')
+            son = await collection.find_one({'_id': key})
+        return son
+
+    async def _lookup(self, key):
+        if not auth.TOKEN_FILTER.might_contain(key):
+            return None
+        son = await self._find(key)
+        if son is None:
+            auth.NEGATIVE_CACHE.set(key, True)
+            return None
+        token = models.AuthToken._from_son(son)
+        auth.TOKEN_CACHE.set(key, token, user_id=auth.get_owner_id(token))
+        # Shared by every caller waiting for this lookup (see `get()`)
+        return auth.cache.snapshot(token)
+
+    async def get(self, key):
+        """
+        Returns the token for a key, or `None`. Runs the same checks as
+        :func:`~stackcite.users.auth.get_token`: invalid keys, keys in
+        :data:`~stackcite.users.auth.NEGATIVE_CACHE` and keys ruled out by
+        :data:`~stackcite.users.auth.TOKEN_FILTER` never reach the database,
+        and concurrent lookups of the same key share one query. Every caller
+        gets its own token document.
+        """
+        try:
+            if not keys.validate_key(key):
+                return None
+        except (ValueError, TypeError):
+            return None
+        token = auth.TOKEN_CACHE.get(key)
+        if token is not None:
+            return token
+        if auth.NEGATIVE_CACHE.get(key):
+            return None
+        if not auth.TOKEN_LOOKUPS.enabled:
+            found = await self._lookup(key)
+        else:
+            lookup = self._lookups.get(key)
+            if lookup is None:
+                lookup = asyncio.ensure_future(self._lookup(key))
+                self._lookups[key] = lookup
+                lookup.add_done_callback(
+                    lambda _: self._lookups.pop(key, None))
+            # Shielded, so that a cancelled caller does not cancel the lookup
+            # for the others
+            found = await asyncio.shield(lookup)
+        return auth.cache.restore(found) if found is not None else None
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class ASGIApplication(object):
+    """
+    Serves the users service over ASGI.
+
+    Token checks (`GET /auth/`), which make up most of the traffic from
+    long-lived client connections, are answered on the event loop with an
+    asyncio MongoDB driver. Every other request is handed to the Pyramid
+    application on a bounded thread pool, so blocking database calls and
+    password hashing never run on the event loop.
+    """
+
+    AUTH_PATHS = ('/auth', '/auth/')
+
+    # Request bodies that are streamed rather than parsed as JSON, so they
+    # are not limited by `json.max_body_size`
+    STREAMED_PATHS = ('/import', '/import/')
+
+    def __init__(self, wsgi_app, token_store, workers=16,
+                 instrumented=False, measured=False):
+        self.wsgi_app = wsgi_app
+        self.token_store = token_store
+        self.instrumented = instrumented
+        self.measured = measured
+        self.executor = futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            msg = 'Unsupported ASGI scope type: {}'.format(scope['type'])
+            raise ValueError(msg)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        self.token_store.close()
+        self.executor.shutdown(wait=True)
+        models.TOUCH_COALESCER.stop()
+
+    async def _read_body(self, receive, limit):
+        """
+        Reads the request body into a temporary file (kept in memory up to
+        :data:`~stackcite.users.codec.MAX_BODY_SIZE` bytes). Returns the
+        file and the body's length, or `None` as soon as the body is larger
+        than `limit` bytes (if `limit` is set).
+        """
+        body = tempfile.SpooledTemporaryFile(max_size=codec.MAX_BODY_SIZE)
+        length = 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            length += len(chunk)
+            if limit and length > limit:
+                body.close()
+                return None
+            body.write(chunk)
+            if not message.get('more_body', False):
+                body.seek(0)
+                return body, length
+
+    async def _http(self, scope, receive, send):
+        limit = codec.CODEC.max_body_size
+        if scope['path'] in self.STREAMED_PATHS:
+            limit = 0
+        request_body = await self._read_body(receive, limit)
+        if request_body is None:
+            # Same status as the Pyramid application's check, sent without
+            # waiting for the rest of the body
+            await self._start_response(
+                send, 413, [('Content-Length', '0')])
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        body, length = request_body
+        try:
+            if scope['method'] == 'GET' and \
+                    scope['path'] in self.AUTH_PATHS:
+                response = await self._retrieve_token(scope)
+                if response is not None:
+                    status, headers, content = response
+                    await self._start_response(send, status, headers)
+                    await send(
+                        {'type': 'http.response.body', 'body': content})
+                    return
+            await self._call_wsgi(scope, body, length, send)
+        finally:
+            body.close()
+
+    @staticmethod
+    async def _start_response(send, status, headers):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers]
+        })
+
+    async def _call_wsgi(self, scope, body, length, send):
+        """
+        Streams a response from the Pyramid application. Each chunk is
+        produced on the thread pool and sent as soon as it is ready.
+        """
+        environ = build_environ(scope, body, length)
+        loop = asyncio.get_running_loop()
+        status, headers, chunk, rest = await loop.run_in_executor(
+            self.executor, call_wsgi, self.wsgi_app, environ)
+        try:
+            await self._start_response(send, status, headers)
+            while chunk is not None:
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True})
+                chunk = await loop.run_in_executor(
+                    self.executor, next, rest, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await loop.run_in_executor(self.executor, rest.close)
+
+    async def _retrieve_token(self, scope):
+        """
+        Answers `GET /auth/` for a valid token. Returns `None` for anything
+        else, so that the Pyramid application can produce the same error
+        response it always has.
+
+        Requests answered here skip the Pyramid tweens, so their
+        `Server-Timing` header (with `instrumented`) and request metrics
+        (with `measured`) are recorded here.
+        """
+        start = time.perf_counter()
+        authorization = _header(scope, 'authorization') or ''
+        auth_type, _, key = authorization.partition(' ')
+        if auth_type.lower() != 'key' or not key:
+            return None
+        if auth.TOKEN_SIGNER.enabled:
+            # Revocation checks may query the database
+            loop = asyncio.get_running_loop()
+            token = await loop.run_in_executor(
+                self.executor, auth.TOKEN_SIGNER.verify, key)
+            token_schm = schema.SignedAuthToken
+        else:
+            token = await self.token_store.get(key)
+            token_schm = schema.AuthToken
+        if token is None:
+            return None
+        with context_managers.no_dereference(models.AuthToken):
+            data = schema.SCHEMAS.dump(token_schm, token)
+        content = codec.CODEC.dumps(data)
+        headers = [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(content)))
+        ]
+        duration = time.perf_counter() - start
+        if self.instrumented:
+            timings = instrumentation.Timings()
+            headers.append(
+                ('Server-Timing', timings.server_timing(duration * 1000)))
+        if self.measured:
+            metrics.REQUEST_DURATION.observe(duration, view='AuthViews')
+            metrics.REQUESTS.inc(view='AuthViews', method='GET', status=200)
+            metrics.REGISTRY.maybe_write_snapshot()
+        return 200, headers, content
+
+
+def main(global_config, **settings):
+    """
+    This function returns an ASGI application.
+    """
+    import stackcite.users
+    wsgi_app = stackcite.users.main(global_config, **settings)
+    token_store = AsyncTokenStore(
+        settings['mongo.host'], settings['mongo.db'],
+        **db.client_options(settings))
+    return ASGIApplication(
+        wsgi_app, token_store,
+        workers=int(settings.get('asgi.workers', 16)),
+        instrumented=asbool(settings.get('instrumentation.enabled', False)),
+        measured=asbool(settings.get('metrics.enabled', False)))
+
+
+def from_config(config=None):
+    """
+    Returns an ASGI application configured from an `.ini` file (by default
+    the file named by the `STACKCITE_USERS_CONFIG` environment variable, or
+    `production.ini`). Intended for ASGI servers' application factories.
+    """
+    from pyramid import paster
+    config = config or os.environ.get(
+        'STACKCITE_USERS_CONFIG', 'production.ini')
+    paster.setup_logging(config)
+    settings = paster.get_appsettings(config)
+    return main(global_config=None, **settings)
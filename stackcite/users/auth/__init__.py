@@ -1,7 +1,17 @@
 from stackcite.api import auth as _auth
 
-from .utils import get_token, get_user
-from .policies import AuthTokenAuthenticationPolicy
+from .cache import NEGATIVE_CACHE, TOKEN_CACHE, TOKEN_LOOKUPS, SingleFlight
+from .bloom import TOKEN_FILTER, BloomFilter, TokenFilter
+from .limits import LIMIT_SCOPES, LOGIN_LIMITER, LoginRateLimiter
+from .signed import TOKEN_MODES, TOKEN_SIGNER, SignedToken
+from .utils import (
+    get_token,
+    get_user,
+    issue_token,
+    invalidate_token,
+    invalidate_user
+)
+from .policies import AuthTokenAuthenticationPolicy, Principals
 
 
 GROUP_CHOICES = _auth.GROUP_CHOICES
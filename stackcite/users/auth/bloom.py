@@ -0,0 +1,273 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+from datetime import datetime, timedelta
+
+from stackcite.users import metrics
+
+
+_LOG = logging.getLogger(__name__)
+
+
+# Tokens issued this long before the last sync are pulled again, to cover
+# clock differences between hosts and tokens written while syncing
+SYNC_MARGIN = timedelta(seconds=5)
+
+# Misses are looked up as usual once this many syncs were missed (e.g. while
+# the database is slow or unavailable)
+STALE_SYNCS = 3
+
+# Seconds to wait after a failed sync or rebuild
+RETRY_DELAY = 5
+
+
+class BloomFilter(object):
+    """
+    A fixed-size Bloom filter sized for `capacity` keys at a false positive
+    rate of `error_rate`. Bit positions come from a keyed hash, so they
+    cannot be predicted outside this process.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity, error_rate = int(capacity), float(error_rate)
+        if capacity < 1 or not 0 < error_rate < 1:
+            msg = 'Invalid filter: capacity={}, error_rate={}'.format(
+                capacity, error_rate)
+            raise ValueError(msg)
+        bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(int(math.ceil(bits)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._salt = os.urandom(16)
+
+    @property
+    def memory(self):
+        return len(self._bits)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(
+            key.encode('utf-8'), digest_size=16, key=self._salt).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key))
+
+
+class TokenFilter(object):
+    """
+    A per-process :class:`BloomFilter` of live :class:`~AuthToken` keys.
+    Keys it rules out are treated as anonymous without querying the
+    database; a false positive only costs the usual lookup.
+
+    Keys issued by this process are added immediately. A background thread
+    builds the filter, pulls the keys issued by other processes every
+    `sync_interval` seconds (tokens issued since the previous sync) and
+    rebuilds the filter every `rebuild_interval` seconds to drop deleted and
+    expired tokens; until then, tokens deleted by this process are
+    remembered separately. Checking a key never queries the database.
+
+    The thread is started by the first check in each process (and again
+    after a fork). With `background` unset, :meth:`rebuild` and :meth:`sync`
+    must be called directly.
+
+    A `capacity` of `0` disables the filter.
+    """
+
+    def __init__(self, capacity=0, error_rate=0.001, sync_interval=0.1,
+                 rebuild_interval=600.0, clock=time.monotonic,
+                 background=True):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.background = background
+        self.configure(capacity, error_rate, sync_interval, rebuild_interval)
+
+    def configure(self, capacity=0, error_rate=0.001, sync_interval=0.1,
+                  rebuild_interval=600.0):
+        capacity, error_rate = int(capacity), float(error_rate)
+        sync_interval = float(sync_interval)
+        rebuild_interval = float(rebuild_interval)
+        if capacity < 0 or sync_interval <= 0 or rebuild_interval <= 0:
+            raise ValueError('Invalid token filter settings')
+        if capacity:
+            # Validates the sizing up front
+            BloomFilter(capacity, error_rate)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        with self._lock:
+            self._filter = None
+            self._removed = set()
+            self._built = None
+            self._synced = None
+            self._since = None
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    @property
+    def keys(self):
+        bloom = self._filter
+        return bloom.count if bloom is not None else 0
+
+    @property
+    def memory(self):
+        bloom = self._filter
+        return bloom.memory if bloom is not None else 0
+
+    @property
+    def current(self):
+        """
+        Whether the last completed sync started recently enough for a key
+        missing from the filter to be ruled out.
+        """
+        synced = self._synced
+        return synced is not None and \
+            self._clock() - synced < self.sync_interval * STALE_SYNCS
+
+    def _collection(self):
+        from stackcite.users import models
+        return models.AuthToken._get_collection()
+
+    def rebuild(self):
+        """
+        Builds a new filter from every stored token key, read with a raw
+        cursor, and swaps it in.
+        """
+        from stackcite.users import models
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        started = datetime.utcnow()
+        issued = models.AuthToken._fields['_issued'].db_field
+        cursor = self._collection().find(
+            {}, projection={'_id': True}, batch_size=10000)
+        for son in cursor:
+            bloom.add(son['_id'])
+        if bloom.count > self.capacity:
+            _LOG.warning(
+                'Token filter over capacity ({} keys), false positive rate '
+                'is above {}'.format(bloom.count, self.error_rate))
+        with self._lock:
+            self._filter = bloom
+            self._removed = set()
+            self._built = self._clock()
+            self._since = started - SYNC_MARGIN
+        # Tokens issued while the cursor was being read
+        self._sync(issued)
+
+    def sync(self):
+        """
+        Adds the keys of tokens issued since the previous sync or rebuild.
+        """
+        from stackcite.users import models
+        self._sync(models.AuthToken._fields['_issued'].db_field)
+
+    def _sync(self, issued):
+        # `_synced` is when the sync started: keys issued before then are in
+        # the filter once it completes
+        synced = self._clock()
+        started = datetime.utcnow()
+        since = self._since
+        query = {issued: {'$gte': since}} if since is not None else {}
+        cursor = self._collection().find(query, projection={'_id': True})
+        keys = [son['_id'] for son in cursor]
+        with self._lock:
+            bloom = self._filter
+            if bloom is not None:
+                for key in keys:
+                    if key not in self._removed:
+                        bloom.add(key)
+            self._synced = synced
+            self._since = started - SYNC_MARGIN
+
+    def add(self, key):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(key)
+
+    def discard(self, key):
+        """
+        Rules out a deleted token's key until the next rebuild.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._removed.add(key)
+
+    def might_contain(self, key):
+        """
+        Returns `False` only if `key` is certainly not a live token key.
+
+        A key missing from the filter is ruled out while the filter is
+        :attr:`current`. Until the filter is built, or if syncing falls
+        behind, every key is looked up as usual.
+        """
+        if not self.enabled:
+            return True
+        if self.background:
+            self.ensure_started()
+        bloom = self._filter
+        if bloom is None:
+            return True
+        if key in self._removed:
+            metrics.TOKEN_FILTER_REJECTIONS.inc()
+            return False
+        if key in bloom or not self.current:
+            return True
+        metrics.TOKEN_FILTER_REJECTIONS.inc()
+        return False
+
+    def ensure_started(self):
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        if self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != pid or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name='token-filter', daemon=True)
+                self._thread.start()
+                self._pid = pid
+
+    def _run(self):
+        while not self._stopped.is_set() and self.enabled:
+            built = self._built
+            try:
+                if self._filter is None or \
+                        self._clock() - built >= self.rebuild_interval:
+                    self.rebuild()
+                else:
+                    self.sync()
+            except Exception:
+                _LOG.exception('Failed to update the token filter')
+                self._stopped.wait(RETRY_DELAY)
+                continue
+            self._stopped.wait(self.sync_interval)
+
+    def stop(self):
+        self._stopped.set()
+
+
+TOKEN_FILTER = TokenFilter()
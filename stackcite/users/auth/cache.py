@@ -0,0 +1,204 @@
+import threading
+import time
+
+from bson import BSON
+from collections import OrderedDict
+
+
+class TokenCache(object):
+    """
+    A bounded, thread-safe, in-process cache of :class:`~AuthToken` documents
+    keyed by token key. Entries are evicted in least-recently-used order once
+    `size` is exceeded and expire `ttl` seconds after they were cached.
+
+    A `size` of `0` disables the cache entirely.
+    """
+
+    def __init__(self, size=0, ttl=30.0, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.configure(size, ttl)
+
+    def configure(self, size, ttl):
+        """
+        Resizes the cache and changes the time-to-live of future entries.
+        Existing entries are dropped.
+        """
+        size, ttl = int(size), float(ttl)
+        if size < 0 or ttl < 0:
+            raise ValueError('Cache size and ttl must not be negative')
+        with self._lock:
+            self.size = size
+            self.ttl = ttl
+            self._entries.clear()
+
+    @property
+    def enabled(self):
+        return self.size > 0 and self.ttl > 0
+
+    def get(self, key):
+        """
+        Returns a cached token or `None` if it is not cached or has expired.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                token, _, expires = entry
+                if expires > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return token
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, token, user_id=None):
+        """
+        Caches a token, evicting the least-recently-used entry if full. The
+        `user_id` of the token's owner is recorded so that the token can be
+        invalidated by :meth:`invalidate_user`.
+        """
+        if not self.enabled:
+            return
+        user_id = str(user_id) if user_id is not None else None
+        with self._lock:
+            self._entries[key] = (token, user_id, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Removes a single token from the cache.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        """
+        Removes every cached token issued to a user.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            stale = [
+                key for key, (_, owner, _) in self._entries.items()
+                if owner == user_id]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns a summary of cache usage.
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def snapshot(document):
+    """
+    Returns an immutable snapshot of a document's stored fields, to be
+    turned back into a new document by :func:`restore`.
+    """
+    return type(document), BSON.encode(document.to_mongo())
+
+
+def restore(snapshot):
+    """
+    Returns a new document built from a :func:`snapshot`.
+    """
+    document_cls, data = snapshot
+    return document_cls._from_son(BSON(data).decode())
+
+
+class DocumentCache(TokenCache):
+    """
+    A :class:`TokenCache` that keeps each document as a :func:`snapshot` of
+    its stored fields and returns a new document on every hit, so changes a
+    request makes to its token are never seen by other requests.
+    """
+
+    def get(self, key):
+        entry = super().get(key)
+        if entry is None:
+            return None
+        return restore(entry)
+
+    def set(self, key, token, user_id=None):
+        if not self.enabled:
+            return
+        super().set(key, snapshot(token), user_id)
+
+
+class _Call(object):
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call per key at a time. Callers asking for a key that
+    is already being fetched wait for that call and share its result (or
+    its exception) instead of starting their own.
+
+    Every caller gets the same result object, so calls should return
+    something immutable (e.g. a :func:`snapshot`).
+    """
+
+    def __init__(self, enabled=True):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.enabled = enabled
+        self.shared = 0
+
+    def do(self, key, function):
+        if not self.enabled:
+            return function()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+            return call.result
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+TOKEN_CACHE = DocumentCache()
+
+# Keys recently found not to exist (cached as `True`)
+NEGATIVE_CACHE = TokenCache()
+
+TOKEN_LOOKUPS = SingleFlight()
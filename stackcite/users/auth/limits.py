@@ -0,0 +1,229 @@
+import fcntl
+import hashlib
+import ipaddress
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from collections import OrderedDict
+
+from stackcite.users import metrics, exceptions as exc
+
+
+LIMIT_SCOPES = ('address', 'email')
+
+
+class LocalWindowStore(object):
+    """
+    Keeps the window counts of at most `size` keys in this process, evicting
+    the least recently used key once full.
+    """
+
+    def __init__(self, size=10000):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.size = int(size)
+
+    def hit(self, key, index, weight, limit, count=True):
+        """
+        Counts a hit for `key` in window `index` unless the sliding count
+        (the previous window's count times `weight`, plus the current
+        window's count) has reached `limit` (`None` for no limit). Returns
+        `True` if the hit is allowed; with `count` unset it is only checked.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            current, previous = _shift(entry, index)
+            allowed = _allowed(current, previous, weight, limit)
+            if allowed and count:
+                self._entries[key] = (index, current + 1, previous)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+            return allowed
+
+
+class SharedWindowStore(object):
+    """
+    Keeps window counts in a memory-mapped file shared by every process that
+    opens it. Keys are hashed into a fixed number of `size` slots; a key
+    whose slot is taken by another key starts over (so the table should be
+    sized well above the number of keys active in one window).
+
+    Each slot is locked with a byte-range lock while it is updated.
+    """
+
+    _SLOT = struct.Struct('<QqII')
+
+    def __init__(self, path, size=10000):
+        self.path = path
+        self.size = int(size)
+        self._lock = threading.Lock()
+        length = self._SLOT.size * self.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < length:
+            os.ftruncate(self._fd, length)
+        self._map = mmap.mmap(self._fd, length)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def hit(self, key, index, weight, limit, count=True):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        key_hash = int.from_bytes(digest, 'little')
+        offset = (key_hash % self.size) * self._SLOT.size
+        # fcntl locks only exclude other processes
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self._SLOT.size, offset)
+            try:
+                stored_hash, *entry = self._SLOT.unpack_from(self._map, offset)
+                if stored_hash != key_hash:
+                    entry = None
+                current, previous = _shift(entry, index)
+                allowed = _allowed(current, previous, weight, limit)
+                if allowed and count:
+                    self._SLOT.pack_into(
+                        self._map, offset, key_hash, index, current + 1,
+                        previous)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self._SLOT.size, offset)
+        return allowed
+
+
+def _allowed(current, previous, weight, limit):
+    return limit is None or previous * weight + current < limit
+
+
+def _shift(entry, index):
+    """
+    Returns the `(current, previous)` counts of a stored
+    `(index, current, previous)` entry as of window `index`.
+    """
+    if entry is None:
+        return 0, 0
+    stored_index, current, previous = entry
+    if stored_index == index:
+        return current, previous
+    if stored_index == index - 1:
+        return 0, current
+    return 0, 0
+
+
+class LoginRateLimiter(object):
+    """
+    Limits login attempts per client address and failed login attempts per
+    email address over a sliding window of `window` seconds, before any
+    password is hashed.
+
+    The sliding count is approximated from two fixed windows: the previous
+    window's count, weighted by how much of it still overlaps the sliding
+    window, plus the current window's count. A limit of `0` disables that
+    scope. If `path` is set, counts are shared by every worker process
+    through a memory-mapped file.
+
+    Client addresses are taken from `X-Forwarded-For` only for requests
+    from one of the `trusted_proxies` (addresses or networks), see
+    :meth:`client_address`.
+    """
+
+    def __init__(self, window=60, per_email=0, per_address=0, size=10000,
+                 path=None, trusted_proxies=(), clock=time.time):
+        self._clock = clock
+        self._store = None
+        self.configure(
+            window, per_email, per_address, size, path, trusted_proxies)
+
+    def configure(self, window=60, per_email=0, per_address=0, size=10000,
+                  path=None, trusted_proxies=()):
+        window, size = float(window), int(size)
+        per_email, per_address = int(per_email), int(per_address)
+        if window <= 0 or size < 1 or per_email < 0 or per_address < 0:
+            msg = 'Invalid rate limit: window={}, size={}'.format(window, size)
+            raise ValueError(msg)
+        if isinstance(trusted_proxies, str):
+            trusted_proxies = trusted_proxies.replace(',', ' ').split()
+        trusted_proxies = tuple(
+            ipaddress.ip_network(proxy, strict=False)
+            for proxy in trusted_proxies)
+        if isinstance(self._store, SharedWindowStore):
+            self._store.close()
+        self.window = window
+        self.limits = {'email': per_email, 'address': per_address}
+        self.trusted_proxies = trusted_proxies
+        if path:
+            self._store = SharedWindowStore(path, size)
+        else:
+            self._store = LocalWindowStore(size)
+
+    @property
+    def enabled(self):
+        return any(self.limits.values())
+
+    def _trusted(self, address):
+        try:
+            address = ipaddress.ip_address(address)
+        except (TypeError, ValueError):
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def client_address(self, request):
+        """
+        Returns the address of the client that sent a request. For a
+        request from a trusted proxy, this is the last `X-Forwarded-For`
+        address that is not a trusted proxy itself. Otherwise the header is
+        ignored, since any client can set it.
+        """
+        address = getattr(request, 'remote_addr', None)
+        if not self._trusted(address):
+            return address
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        for hop in reversed(hops):
+            address = hop
+            if not self._trusted(hop):
+                break
+        return address
+
+    def _window(self):
+        index, offset = divmod(self._clock(), self.window)
+        return int(index), offset
+
+    def _key(self, scope, key):
+        if scope == 'email':
+            key = key.strip().lower()
+        return scope + ':' + key
+
+    def check(self, scope, key, count=True):
+        """
+        Raises :class:`~RateLimitedError` if the limit for `key` (an email
+        or client address) has been reached, and otherwise counts an
+        attempt. With `count` unset the attempt is only checked, so that it
+        can be counted later with :meth:`add` (e.g. once it has failed).
+        """
+        limit = self.limits[scope]
+        if not limit or not key:
+            return
+        index, offset = self._window()
+        weight = 1 - offset / self.window
+        key = self._key(scope, key)
+        if not self._store.hit(key, index, weight, limit, count):
+            metrics.LOGIN_RATE_LIMITED.inc(scope=scope)
+            retry_after = max(int(math.ceil(self.window - offset)), 1)
+            raise exc.RateLimitedError(retry_after=retry_after)
+
+    def add(self, scope, key):
+        """
+        Counts an attempt for `key` without checking its limit.
+        """
+        if not self.limits[scope] or not key:
+            return
+        index, offset = self._window()
+        weight = 1 - offset / self.window
+        self._store.hit(self._key(scope, key), index, weight, None)
+
+
+LOGIN_LIMITER = LoginRateLimiter()
@@ -1,3 +1,4 @@
+from collections import abc
 from zope.interface import implementer
 
 from pyramid.interfaces import IAuthenticationPolicy
@@ -10,6 +11,49 @@ from pyramid.authentication import (
 from . import utils
 
 
+class Principals(abc.Set):
+    """
+    The immutable effective principals of a request. `Everyone` is always a
+    member; the remaining principals are resolved from `request.user` (and
+    therefore the request's token) only when they are first needed, then
+    kept as a `frozenset`.
+
+    An ACL that lists its `Everyone` entries first can therefore grant
+    anonymous permissions without ever touching the token store.
+    """
+
+    __slots__ = ('_request', '_principals')
+
+    def __init__(self, request):
+        self._request = request
+        self._principals = None
+
+    def resolve(self):
+        if self._principals is None:
+            principals = [Everyone]
+            user = self._request.user
+            if user is not None:
+                principals.append(Authenticated)
+                principals.append(str(user.id))
+                principals.extend(user.groups)
+            self._principals = frozenset(principals)
+        return self._principals
+
+    def __contains__(self, principal):
+        if principal == Everyone:
+            return True
+        return principal in self.resolve()
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+    def __len__(self):
+        return len(self.resolve())
+
+    def __repr__(self):
+        return '<Principals {!r}>'.format(set(self.resolve()))
+
+
 @implementer(IAuthenticationPolicy)
 class AuthTokenAuthenticationPolicy(CallbackAuthenticationPolicy):
     """
@@ -17,6 +61,8 @@ class AuthTokenAuthenticationPolicy(CallbackAuthenticationPolicy):
     the request header against those saved in the database.
     """
 
+    ENVIRON_KEY = 'stackcite.users.principals'
+
     def __init__(self, callback=None, debug=False):
         self.callback = callback or utils.get_groups
         self.debug = debug
@@ -32,12 +78,12 @@ class AuthTokenAuthenticationPolicy(CallbackAuthenticationPolicy):
 
     def effective_principals(self, request):
         """
-        Resolves the effective principles of a :class:`stackcite.User`.
+        Resolves the effective principles of a :class:`stackcite.User`. The
+        result is computed once per request and resolved lazily (see
+        :class:`Principals`).
         """
-        principals = [Everyone]
-        user = request.user
-        if user is not None:
-            principals.append(Authenticated)
-            principals.append(str(user.id))
-            principals.extend(user.groups)
+        principals = request.environ.get(self.ENVIRON_KEY)
+        if principals is None:
+            principals = Principals(request)
+            request.environ[self.ENVIRON_KEY] = principals
         return principals
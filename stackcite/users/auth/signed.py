@@ -0,0 +1,236 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+from pymongo.errors import PyMongoError
+
+from .cache import TokenCache
+
+
+_LOG = logging.getLogger(__name__)
+
+
+TOKEN_MODES = ('document', 'signed')
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    data = data.encode('ascii')
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+class SignedTokenUser(object):
+    """
+    The subset of a :class:`~User` carried inside a signed token (the same
+    `id` and `groups` cached by :class:`~AuthToken`).
+    """
+
+    __slots__ = ('id', 'groups')
+
+    def __init__(self, id, groups):
+        self.id = id
+        self.groups = groups
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+
+class SignedToken(object):
+    """
+    A self-contained authentication token that can be verified without a
+    database lookup.
+    """
+
+    __slots__ = ('key', 'user', 'issued', 'expires', 'nonce')
+
+    def __init__(self, key, user, issued, expires, nonce):
+        self.key = key
+        self.user = user
+        self.issued = issued
+        self.expires = expires
+        self.nonce = nonce
+
+    @property
+    def touched(self):
+        return self.issued
+
+
+class RevocationStore(object):
+    """
+    Revoked signed tokens, stored in the :class:`~TokenRevocation`
+    collection so that every worker process sees them and they survive
+    restarts. A revocation is deleted by its TTL index once the tokens it
+    covers would have expired anyway.
+
+    Lookups are cached per token for `cache_ttl` seconds (see
+    :class:`~TokenCache`), so another process may accept a revoked token
+    for up to that long. The process that revokes a token stops accepting
+    it immediately.
+    """
+
+    def __init__(self, cache_size=10000, cache_ttl=5):
+        self._cache = TokenCache(cache_size, cache_ttl)
+
+    def configure(self, cache_size=10000, cache_ttl=5):
+        self._cache.configure(cache_size, cache_ttl)
+
+    def _collection(self):
+        from stackcite.users import models
+        return models.TokenRevocation._get_collection()
+
+    def is_revoked(self, nonce, user_id, issued):
+        """
+        Returns `True` if the token with `nonce`, or every token issued to
+        `user_id` up to `issued` or later, has been revoked.
+        """
+        entry = self._cache.get(nonce)
+        if entry is None:
+            token_revoked, user_revoked = False, None
+            keys = ['token:' + nonce, 'user:' + user_id]
+            for son in self._collection().find({'_id': {'$in': keys}}):
+                if son['_id'] == keys[0]:
+                    token_revoked = True
+                else:
+                    user_revoked = son['revoked']
+            entry = (token_revoked, user_revoked)
+            self._cache.set(nonce, entry, user_id=user_id)
+        token_revoked, user_revoked = entry
+        return token_revoked or (
+            user_revoked is not None and issued <= user_revoked)
+
+    def revoke_token(self, nonce, user_id, revoked, expires):
+        self._collection().update_one(
+            {'_id': 'token:' + nonce},
+            {'$set': {'revoked': revoked, 'expires': expires}},
+            upsert=True)
+        self._cache.invalidate(nonce)
+
+    def revoke_user(self, user_id, revoked, expires):
+        self._collection().update_one(
+            {'_id': 'user:' + user_id},
+            {'$max': {'revoked': revoked, 'expires': expires}},
+            upsert=True)
+        self._cache.invalidate_user(user_id)
+
+
+class TokenSigner(object):
+    """
+    Issues and verifies HMAC-SHA256 signed tokens carrying a user's `id`,
+    groups and an expiry time.
+
+    Revoked tokens (logout, refresh) and revoked users (account deletion,
+    group changes) are kept in `revocations` (a :class:`RevocationStore`)
+    until the affected tokens would have expired anyway. If revocations
+    cannot be checked, tokens are rejected.
+
+    A signer without a `secret` is disabled.
+    """
+
+    def __init__(self, secret=None, ttl=3600, revocations=None,
+                 clock=time.time):
+        self._lock = threading.Lock()
+        self._clock = clock
+        self.revocations = revocations or RevocationStore()
+        self.configure(secret, ttl)
+
+    def configure(self, secret, ttl=3600):
+        if secret is not None:
+            if len(secret) < 32:
+                msg = 'Token secret must be at least 32 characters long'
+                raise ValueError(msg)
+            secret = secret.encode('utf-8')
+        with self._lock:
+            self._secret = secret
+            self.ttl = int(ttl)
+
+    @property
+    def enabled(self):
+        return self._secret is not None
+
+    def _sign(self, payload):
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()
+
+    def issue(self, user):
+        """
+        Issues a new signed token for a user.
+        """
+        issued = int(self._clock() * 1000) / 1000.0
+        data = {
+            'u': str(user.id),
+            'g': list(user.groups),
+            'i': issued,
+            'e': issued + self.ttl,
+            'n': binascii.hexlify(os.urandom(8)).decode('ascii')
+        }
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        signature = self._sign(payload)
+        key = '{}.{}'.format(_b64encode(payload), _b64encode(signature))
+        return self._token(key, data)
+
+    def _token(self, key, data):
+        return SignedToken(
+            key,
+            SignedTokenUser(ObjectId(data['u']), data['g']),
+            datetime.utcfromtimestamp(data['i']),
+            datetime.utcfromtimestamp(data['e']),
+            data['n'])
+
+    def verify(self, key):
+        """
+        Returns the :class:`SignedToken` for a key or `None` if the key is
+        malformed, forged, expired or revoked.
+        """
+        if not self.enabled:
+            return None
+        try:
+            payload, signature = key.split('.')
+            payload = _b64decode(payload)
+            signature = _b64decode(signature)
+        except (AttributeError, ValueError, binascii.Error):
+            return None
+        if not hmac.compare_digest(self._sign(payload), signature):
+            return None
+        try:
+            data = json.loads(payload.decode('utf-8'))
+            token = self._token(key, data)
+        except (ValueError, KeyError, TypeError, InvalidId):
+            return None
+        if data['e'] <= self._clock():
+            return None
+        try:
+            revoked = self.revocations.is_revoked(
+                token.nonce, data['u'], data['i'])
+        except PyMongoError:
+            _LOG.exception('Cannot check token revocations')
+            return None
+        return None if revoked else token
+
+    def revoke(self, token):
+        """
+        Revokes a single token.
+        """
+        self.revocations.revoke_token(
+            token.nonce, str(token.user.id), self._clock(), token.expires)
+
+    def revoke_user(self, user_id):
+        """
+        Revokes every token issued to a user up to now.
+        """
+        now = self._clock()
+        self.revocations.revoke_user(
+            str(user_id), now, datetime.utcfromtimestamp(now + self.ttl))
+
+
+TOKEN_SIGNER = TokenSigner()
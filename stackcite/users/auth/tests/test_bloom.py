@@ -0,0 +1,138 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class BloomFilterTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import bloom
+        self.bloom = bloom.BloomFilter(1000, error_rate=0.01)
+
+    def test_contains_added_keys(self):
+        """BloomFilter contains every added key
+        """
+        keys = ['key{}'.format(i) for i in range(1000)]
+        for key in keys:
+            self.bloom.add(key)
+        self.assertTrue(all(key in self.bloom for key in keys))
+
+    def test_false_positive_rate_is_bounded(self):
+        """BloomFilter false positive rate stays close to error_rate
+        """
+        for i in range(1000):
+            self.bloom.add('key{}'.format(i))
+        false_positives = sum(
+            'other{}'.format(i) in self.bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_size_follows_error_rate(self):
+        """BloomFilter uses more memory for a lower error_rate
+        """
+        from .. import bloom
+        smaller = bloom.BloomFilter(1000, error_rate=0.0001)
+        self.assertGreater(smaller.memory, self.bloom.memory)
+
+    def test_rejects_invalid_error_rate(self):
+        """BloomFilter raises exception for an error_rate outside (0, 1)
+        """
+        from .. import bloom
+        with self.assertRaises(ValueError):
+            bloom.BloomFilter(1000, error_rate=1)
+
+
+class TokenFilterIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import models
+        from .. import bloom
+        models.User.drop_collection()
+        models.AuthToken.drop_collection()
+        self.user = models.User.new('test@email.com', 'T3stPa$$word', save=True)
+        self.token = models.AuthToken.new(self.user, save=True)
+        self.clock = testing.utils.FakeClock()
+        self.filter = bloom.TokenFilter(
+            capacity=1000, sync_interval=1, clock=self.clock,
+            background=False)
+        self.filter.rebuild()
+
+    def test_rebuild_adds_stored_keys(self):
+        """TokenFilter.rebuild() adds every stored token key
+        """
+        self.assertTrue(self.filter.might_contain(self.token.key))
+
+    def test_unknown_key_is_ruled_out(self):
+        """TokenFilter.might_contain() returns False for an unknown key
+        """
+        from .. import utils
+        self.clock.now = 2
+        self.assertFalse(self.filter.might_contain(utils.gen_key()))
+
+    def test_miss_does_not_query(self):
+        """TokenFilter.might_contain() rules out a key issued elsewhere until the next sync
+        """
+        from stackcite.users import models
+        token = models.AuthToken.new(self.user, save=True)
+        self.assertFalse(self.filter.might_contain(token.key))
+
+    def test_sync_adds_keys_issued_elsewhere(self):
+        """TokenFilter.sync() pulls tokens issued by other processes
+        """
+        from stackcite.users import models
+        token = models.AuthToken.new(self.user, save=True)
+        self.filter.sync()
+        self.assertTrue(self.filter.might_contain(token.key))
+
+    def test_stale_filter_rules_out_nothing(self):
+        """TokenFilter.might_contain() returns True for a miss once syncs fall behind
+        """
+        from .. import utils
+        self.clock.now = 3
+        self.assertTrue(self.filter.might_contain(utils.gen_key()))
+
+    def test_unbuilt_filter_rules_out_nothing(self):
+        """TokenFilter.might_contain() returns True before the filter is built
+        """
+        from .. import bloom, utils
+        token_filter = bloom.TokenFilter(capacity=1000, background=False)
+        self.assertTrue(token_filter.might_contain(utils.gen_key()))
+
+    def test_first_check_starts_background_thread(self):
+        """TokenFilter.might_contain() starts a thread that builds the filter
+        """
+        import time
+        from .. import bloom
+        token_filter = bloom.TokenFilter(capacity=1000, sync_interval=60)
+        self.addCleanup(token_filter.stop)
+        token_filter.might_contain(self.token.key)
+        for _ in range(500):
+            if token_filter.current:
+                break
+            time.sleep(0.01)
+        self.assertTrue(token_filter._thread.is_alive())
+        self.assertEqual(1, token_filter.keys)
+
+    def test_add_includes_issued_key(self):
+        """TokenFilter.add() includes a key without syncing
+        """
+        from .. import utils
+        key = utils.gen_key()
+        self.filter.add(key)
+        self.assertTrue(self.filter.might_contain(key))
+
+    def test_discard_rules_out_deleted_key(self):
+        """TokenFilter.discard() rules out a deleted token's key
+        """
+        self.filter.discard(self.token.key)
+        self.assertFalse(self.filter.might_contain(self.token.key))
+
+    def test_disabled_filter_rules_out_nothing(self):
+        """TokenFilter.might_contain() returns True if disabled
+        """
+        from .. import utils
+        self.filter.configure(capacity=0)
+        self.assertTrue(self.filter.might_contain(utils.gen_key()))
@@ -0,0 +1,199 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class FakeDocument(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    def to_mongo(self):
+        return self.data
+
+    @classmethod
+    def _from_son(cls, son):
+        return cls(son)
+
+
+class TokenCacheTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import cache
+        self.clock = testing.utils.FakeClock()
+        self.cache = cache.TokenCache(size=2, ttl=10, clock=self.clock)
+
+    def test_get_returns_cached_token(self):
+        """TokenCache.get() returns a cached token
+        """
+        token = object()
+        self.cache.set('key', token)
+        result = self.cache.get('key')
+        self.assertIs(token, result)
+
+    def test_get_returns_none_for_unknown_key(self):
+        """TokenCache.get() returns None for an unknown key
+        """
+        result = self.cache.get('key')
+        self.assertIsNone(result)
+
+    def test_get_returns_none_after_ttl(self):
+        """TokenCache.get() returns None once an entry has expired
+        """
+        self.cache.set('key', object())
+        self.clock.now = 11
+        result = self.cache.get('key')
+        self.assertIsNone(result)
+
+    def test_set_evicts_least_recently_used(self):
+        """TokenCache.set() evicts the least recently used entry when full
+        """
+        self.cache.set('a', object())
+        self.cache.set('b', object())
+        self.cache.get('a')
+        self.cache.set('c', object())
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+
+    def test_invalidate_removes_token(self):
+        """TokenCache.invalidate() removes a cached token
+        """
+        self.cache.set('key', object())
+        self.cache.invalidate('key')
+        result = self.cache.get('key')
+        self.assertIsNone(result)
+
+    def test_invalidate_user_removes_user_tokens(self):
+        """TokenCache.invalidate_user() removes every token issued to a user
+        """
+        self.cache.set('a', object(), user_id='user')
+        self.cache.set('b', object(), user_id='other')
+        self.cache.invalidate_user('user')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+
+    def test_stats_counts_hits_and_misses(self):
+        """TokenCache.stats() counts hits and misses
+        """
+        self.cache.set('key', object())
+        self.cache.get('key')
+        self.cache.get('other')
+        result = self.cache.stats()
+        self.assertEqual(1, result['hits'])
+        self.assertEqual(1, result['misses'])
+
+    def test_zero_size_disables_cache(self):
+        """TokenCache with a size of 0 does not cache tokens
+        """
+        self.cache.configure(0, 10)
+        self.cache.set('key', object())
+        result = self.cache.get('key')
+        self.assertIsNone(result)
+
+    def test_configure_rejects_negative_size(self):
+        """TokenCache.configure() raises exception for a negative size
+        """
+        with self.assertRaises(ValueError):
+            self.cache.configure(-1, 10)
+
+
+class DocumentCacheTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import cache
+        self.cache = cache.DocumentCache(
+            size=2, ttl=10, clock=testing.utils.FakeClock())
+
+    def test_get_returns_copy(self):
+        """DocumentCache.get() returns a new document equal to the cached one
+        """
+        document = FakeDocument({'_id': 'key', 'groups': ['users']})
+        self.cache.set('key', document)
+        result = self.cache.get('key')
+        self.assertIsNot(document, result)
+        self.assertEqual(document.data, result.data)
+
+    def test_changes_do_not_reach_cache(self):
+        """DocumentCache.get() is not affected by changes to a returned document
+        """
+        self.cache.set('key', FakeDocument({'groups': ['users']}))
+        self.cache.get('key').data['groups'].append('admin')
+        result = self.cache.get('key')
+        self.assertEqual(['users'], result.data['groups'])
+
+
+class SnapshotTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_restore_returns_new_document(self):
+        """restore() builds a new document from a snapshot every time
+        """
+        from .. import cache
+        document = FakeDocument({'_id': 'key', 'groups': ['users']})
+        data = cache.snapshot(document)
+        first, second = cache.restore(data), cache.restore(data)
+        self.assertIsNot(first, second)
+        self.assertEqual(document.data, first.data)
+        self.assertEqual(document.data, second.data)
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import cache
+        self.flight = cache.SingleFlight()
+
+    def test_concurrent_calls_share_one_call(self):
+        """SingleFlight.do() runs one call for concurrent callers of a key
+        """
+        import threading
+        import time
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'token'
+
+        leader = threading.Thread(
+            target=lambda: results.append(self.flight.do('key', fetch)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(
+            target=lambda: results.append(self.flight.do('key', fetch)))
+        follower.start()
+        # Wait until the follower is waiting for the leader
+        for _ in range(500):
+            if self.flight.shared:
+                break
+            time.sleep(0.01)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['token', 'token'], results)
+
+    def test_exception_is_raised(self):
+        """SingleFlight.do() raises the call's exception
+        """
+        def fetch():
+            raise KeyError('key')
+
+        with self.assertRaises(KeyError):
+            self.flight.do('key', fetch)
+
+    def test_key_is_released_after_call(self):
+        """SingleFlight.do() starts a new call once the previous one is done
+        """
+        self.flight.do('key', lambda: 1)
+        result = self.flight.do('key', lambda: 2)
+        self.assertEqual(2, result)
@@ -0,0 +1,174 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class LoginRateLimiterTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import limits
+        self.clock = testing.utils.FakeClock()
+        self.limiter = limits.LoginRateLimiter(
+            window=60, per_email=2, per_address=3, clock=self.clock)
+
+    def test_check_allows_attempts_under_limit(self):
+        """LoginRateLimiter.check() allows attempts under the limit
+        """
+        self.limiter.check('email', 'test@email.com')
+        self.limiter.check('email', 'test@email.com')
+
+    def test_check_rejects_attempts_over_limit(self):
+        """LoginRateLimiter.check() raises exception once the limit is reached
+        """
+        from stackcite.users import exceptions as exc
+        for _ in range(2):
+            self.limiter.check('email', 'test@email.com')
+        with self.assertRaises(exc.RateLimitedError):
+            self.limiter.check('email', 'test@email.com')
+
+    def test_check_normalizes_email(self):
+        """LoginRateLimiter.check() counts emails case-insensitively
+        """
+        from stackcite.users import exceptions as exc
+        self.limiter.check('email', 'test@email.com')
+        self.limiter.check('email', 'TEST@email.com')
+        with self.assertRaises(exc.RateLimitedError):
+            self.limiter.check('email', ' Test@Email.com')
+
+    def test_check_counts_scopes_separately(self):
+        """LoginRateLimiter.check() keeps separate counts per scope
+        """
+        for _ in range(2):
+            self.limiter.check('email', '127.0.0.1')
+        self.limiter.check('address', '127.0.0.1')
+
+    def test_previous_window_is_weighted(self):
+        """LoginRateLimiter.check() counts the overlap of the previous window
+        """
+        from stackcite.users import exceptions as exc
+        for _ in range(2):
+            self.limiter.check('email', 'test@email.com')
+        # Half of the previous window's attempts still count
+        self.clock.now = 90
+        self.limiter.check('email', 'test@email.com')
+        with self.assertRaises(exc.RateLimitedError):
+            self.limiter.check('email', 'test@email.com')
+
+    def test_limit_resets_after_two_windows(self):
+        """LoginRateLimiter.check() forgets attempts older than a window
+        """
+        for _ in range(2):
+            self.limiter.check('email', 'test@email.com')
+        self.clock.now = 120
+        self.limiter.check('email', 'test@email.com')
+        self.limiter.check('email', 'test@email.com')
+
+    def test_rejection_sets_retry_after(self):
+        """LoginRateLimiter.check() sets retry_after to the end of the window
+        """
+        from stackcite.users import exceptions as exc
+        self.clock.now = 45
+        for _ in range(2):
+            self.limiter.check('email', 'test@email.com')
+        with self.assertRaises(exc.RateLimitedError) as ctx:
+            self.limiter.check('email', 'test@email.com')
+        self.assertEqual(15, ctx.exception.retry_after)
+
+    def test_zero_limit_disables_scope(self):
+        """LoginRateLimiter.check() does not limit a scope with a limit of 0
+        """
+        self.limiter.configure(per_email=0, per_address=0)
+        self.assertFalse(self.limiter.enabled)
+        for _ in range(10):
+            self.limiter.check('email', 'test@email.com')
+
+    def test_check_without_count_does_not_count(self):
+        """LoginRateLimiter.check() only checks the limit with 'count' unset
+        """
+        for _ in range(5):
+            self.limiter.check('email', 'test@email.com', count=False)
+
+    def test_add_counts_towards_limit(self):
+        """LoginRateLimiter.add() counts attempts that check() then rejects
+        """
+        from stackcite.users import exceptions as exc
+        for _ in range(2):
+            self.limiter.check('email', 'test@email.com', count=False)
+            self.limiter.add('email', 'test@email.com')
+        with self.assertRaises(exc.RateLimitedError):
+            self.limiter.check('email', 'test@email.com', count=False)
+
+
+class ClientAddressTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def make_request(self, remote_addr, forwarded=None):
+        from pyramid.testing import DummyRequest
+        request = DummyRequest()
+        request.remote_addr = remote_addr
+        if forwarded is not None:
+            request.headers['X-Forwarded-For'] = forwarded
+        return request
+
+    def make_limiter(self, trusted_proxies=''):
+        from .. import limits
+        return limits.LoginRateLimiter(trusted_proxies=trusted_proxies)
+
+    def test_ignores_forwarded_for_without_trusted_proxies(self):
+        """LoginRateLimiter.client_address() ignores X-Forwarded-For by default
+        """
+        request = self.make_request('203.0.113.7', '198.51.100.1')
+        result = self.make_limiter().client_address(request)
+        self.assertEqual('203.0.113.7', result)
+
+    def test_uses_forwarded_for_from_trusted_proxy(self):
+        """LoginRateLimiter.client_address() reads X-Forwarded-For from a trusted proxy
+        """
+        request = self.make_request('10.0.0.2', '198.51.100.1, 10.0.0.1')
+        limiter = self.make_limiter('10.0.0.0/8')
+        self.assertEqual('198.51.100.1', limiter.client_address(request))
+
+    def test_skips_addresses_set_by_client(self):
+        """LoginRateLimiter.client_address() returns the last untrusted hop
+        """
+        request = self.make_request(
+            '10.0.0.2', '192.0.2.99, 198.51.100.1')
+        limiter = self.make_limiter('10.0.0.0/8')
+        self.assertEqual('198.51.100.1', limiter.client_address(request))
+
+
+class SharedWindowStoreTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        import os
+        import tempfile
+        from .. import limits
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'logins')
+        self.store = limits.SharedWindowStore(self.path, size=16)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_hit_counts_up_to_limit(self):
+        """SharedWindowStore.hit() returns False once the limit is reached
+        """
+        self.assertTrue(self.store.hit('key', 1, 0.5, 2))
+        self.assertTrue(self.store.hit('key', 1, 0.5, 2))
+        self.assertFalse(self.store.hit('key', 1, 0.5, 2))
+
+    def test_counts_are_shared_between_stores(self):
+        """SharedWindowStore counts are seen by every store on the same file
+        """
+        from .. import limits
+        other = limits.SharedWindowStore(self.path, size=16)
+        self.addCleanup(other.close)
+        self.store.hit('key', 1, 0.5, 2)
+        self.store.hit('key', 1, 0.5, 2)
+        self.assertFalse(other.hit('key', 1, 0.5, 2))
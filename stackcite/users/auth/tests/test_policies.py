@@ -84,3 +84,74 @@ class AuthPolicyIntegrationTests(unittest.TestCase):
         result = self.auth_pol.effective_principals(request)
         for expected in self.user.groups:
             self.assertIn(expected, result)
+
+    def test_effective_principals_are_computed_once_per_request(self):
+        """AuthTokenAuthenticationPolicy.effective_principals() returns the same principals for a request
+        """
+        from pyramid.testing import DummyRequest
+        request = DummyRequest()
+        request.user = self.user
+        first = self.auth_pol.effective_principals(request)
+        second = self.auth_pol.effective_principals(request)
+        self.assertIs(first, second)
+
+    def test_effective_principals_resolve_to_frozenset(self):
+        """AuthTokenAuthenticationPolicy.effective_principals() resolves to a frozenset
+        """
+        from pyramid.testing import DummyRequest
+        request = DummyRequest()
+        request.user = self.user
+        result = self.auth_pol.effective_principals(request).resolve()
+        self.assertIsInstance(result, frozenset)
+
+
+class UserAccessCountingRequest(object):
+
+    def __init__(self):
+        from pyramid.testing import DummyRequest
+        self.environ = DummyRequest().environ
+        self.user_lookups = 0
+
+    @property
+    def user(self):
+        self.user_lookups += 1
+        return None
+
+
+class PrincipalsUnitTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_everyone_does_not_resolve_user(self):
+        """Principals does not resolve the user to check for Everyone
+        """
+        from pyramid.authentication import Everyone
+        from .. import policies
+        request = UserAccessCountingRequest()
+        principals = policies.Principals(request)
+        self.assertIn(Everyone, principals)
+        self.assertEqual(0, request.user_lookups)
+
+    def test_other_principals_resolve_user_once(self):
+        """Principals resolves the user once for any other principal
+        """
+        from pyramid.authentication import Authenticated
+        from .. import policies
+        request = UserAccessCountingRequest()
+        principals = policies.Principals(request)
+        self.assertNotIn(Authenticated, principals)
+        self.assertNotIn('admin', principals)
+        self.assertEqual(1, request.user_lookups)
+
+    def test_anonymous_create_permitted_without_resolving_user(self):
+        """ACLAuthorizationPolicy permits anonymous 'create' without resolving the user
+        """
+        from pyramid.authorization import ACLAuthorizationPolicy
+        from stackcite.users import resources
+        from .. import policies
+        request = UserAccessCountingRequest()
+        principals = policies.Principals(request)
+        context = resources.AuthResource(None, 'auth')
+        result = ACLAuthorizationPolicy().permits(context, principals, 'create')
+        self.assertTrue(result)
+        self.assertEqual(0, request.user_lookups)
@@ -0,0 +1,167 @@
+import unittest
+
+from stackcite.users import testing
+
+
+SECRET = 'a-test-secret-that-is-long-enough-for-hmac'
+
+
+class FakeRevocations(object):
+
+    def __init__(self):
+        self.tokens = set()
+        self.users = {}
+
+    def is_revoked(self, nonce, user_id, issued):
+        revoked = self.users.get(user_id)
+        return nonce in self.tokens or (
+            revoked is not None and issued <= revoked)
+
+    def revoke_token(self, nonce, user_id, revoked, expires):
+        self.tokens.add(nonce)
+
+    def revoke_user(self, user_id, revoked, expires):
+        self.users[user_id] = revoked
+
+
+class TokenSignerTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from bson import ObjectId
+        from .. import signed
+        self.clock = testing.utils.FakeClock(1500000000.0)
+        self.signer = signed.TokenSigner(
+            SECRET, ttl=60, revocations=FakeRevocations(), clock=self.clock)
+        self.user = signed.SignedTokenUser(ObjectId(), ['users'])
+
+    def test_verify_returns_issued_token(self):
+        """TokenSigner.verify() accepts a token it issued
+        """
+        token = self.signer.issue(self.user)
+        result = self.signer.verify(token.key)
+        self.assertEqual(self.user.id, result.user.id)
+        self.assertEqual(['users'], result.user.groups)
+
+    def test_verify_rejects_tampered_token(self):
+        """TokenSigner.verify() rejects a token with a modified payload
+        """
+        token = self.signer.issue(self.user)
+        payload, signature = token.key.split('.')
+        tampered = '{}.{}'.format(payload[:-2] + 'AA', signature)
+        result = self.signer.verify(tampered)
+        self.assertIsNone(result)
+
+    def test_verify_rejects_token_signed_with_another_secret(self):
+        """TokenSigner.verify() rejects a token signed with a different secret
+        """
+        from .. import signed
+        other = signed.TokenSigner(SECRET[::-1], clock=self.clock)
+        token = other.issue(self.user)
+        result = self.signer.verify(token.key)
+        self.assertIsNone(result)
+
+    def test_verify_rejects_malformed_key(self):
+        """TokenSigner.verify() rejects a malformed key
+        """
+        for key in ('', 'invalid', 'a.b.c', '!!!.???'):
+            self.assertIsNone(self.signer.verify(key))
+
+    def test_verify_rejects_expired_token(self):
+        """TokenSigner.verify() rejects an expired token
+        """
+        token = self.signer.issue(self.user)
+        self.clock.now += 61
+        result = self.signer.verify(token.key)
+        self.assertIsNone(result)
+
+    def test_revoke_rejects_token(self):
+        """TokenSigner.revoke() makes a token invalid
+        """
+        token = self.signer.issue(self.user)
+        self.signer.revoke(token)
+        result = self.signer.verify(token.key)
+        self.assertIsNone(result)
+
+    def test_revoke_user_rejects_existing_tokens(self):
+        """TokenSigner.revoke_user() makes existing tokens for a user invalid
+        """
+        token = self.signer.issue(self.user)
+        self.signer.revoke_user(self.user.id)
+        result = self.signer.verify(token.key)
+        self.assertIsNone(result)
+
+    def test_revoke_user_accepts_later_tokens(self):
+        """TokenSigner.revoke_user() does not affect tokens issued afterwards
+        """
+        self.signer.revoke_user(self.user.id)
+        self.clock.now += 1
+        token = self.signer.issue(self.user)
+        result = self.signer.verify(token.key)
+        self.assertIsNotNone(result)
+
+    def test_verify_rejects_token_if_revocations_cannot_be_read(self):
+        """TokenSigner.verify() rejects tokens if revocations are unavailable
+        """
+        from pymongo.errors import ServerSelectionTimeoutError
+
+        def is_revoked(*args):
+            raise ServerSelectionTimeoutError()
+
+        token = self.signer.issue(self.user)
+        self.signer.revocations.is_revoked = is_revoked
+        result = self.signer.verify(token.key)
+        self.assertIsNone(result)
+
+    def test_disabled_signer_rejects_keys(self):
+        """TokenSigner without a secret rejects every key
+        """
+        token = self.signer.issue(self.user)
+        self.signer.configure(None)
+        result = self.signer.verify(token.key)
+        self.assertIsNone(result)
+
+    def test_configure_rejects_short_secret(self):
+        """TokenSigner.configure() raises exception for a short secret
+        """
+        with self.assertRaises(ValueError):
+            self.signer.configure('short')
+
+
+class RevocationStoreIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from bson import ObjectId
+        from stackcite.users import models
+        from .. import signed
+        models.TokenRevocation.drop_collection()
+        self.clock = testing.utils.FakeClock(1500000000.0)
+        self.signer = signed.TokenSigner(SECRET, ttl=60, clock=self.clock)
+        # Another worker process, with its own revocation cache
+        self.other = signed.TokenSigner(SECRET, ttl=60, clock=self.clock)
+        self.user = signed.SignedTokenUser(ObjectId(), ['users'])
+
+    def test_revoked_token_is_rejected_by_other_processes(self):
+        """RevocationStore shares revoked tokens between processes
+        """
+        token = self.signer.issue(self.user)
+        self.signer.revoke(token)
+        self.assertIsNone(self.other.verify(token.key))
+
+    def test_revoked_user_is_rejected_by_other_processes(self):
+        """RevocationStore shares revoked users between processes
+        """
+        token = self.signer.issue(self.user)
+        self.signer.revoke_user(self.user.id)
+        self.assertIsNone(self.other.verify(token.key))
+
+    def test_revoking_process_stops_accepting_cached_token(self):
+        """RevocationStore.revoke_token() invalidates the revoking process's cache
+        """
+        token = self.signer.issue(self.user)
+        self.assertIsNotNone(self.signer.verify(token.key))
+        self.signer.revoke(token)
+        self.assertIsNone(self.signer.verify(token.key))
@@ -136,3 +136,199 @@ class GetGroupsIntegrationTests(AuthUtilsBaseIntegrationTests):
         request.user = self.user
         result = utils.get_groups(user_id, request)
         self.assertEqual(expected, result)
+
+
+class GetAuthTokenCacheIntegrationTests(AuthUtilsBaseIntegrationTests):
+
+    def setUp(self):
+        super().setUp()
+        from .. import cache
+        cache.TOKEN_CACHE.configure(size=10, ttl=30)
+
+    def tearDown(self):
+        from .. import cache
+        cache.TOKEN_CACHE.configure(size=0, ttl=30)
+
+    def test_get_token_caches_token(self):
+        """get_token() serves a token from the cache after the first lookup
+        """
+        from pyramid.testing import DummyRequest
+        from .. import cache, utils
+        request = DummyRequest()
+        request.authorization = 'Key', self.token.key
+        expected = utils.get_token(request)
+        result = utils.get_token(request)
+        self.assertEqual(expected.key, result.key)
+        self.assertEqual(1, cache.TOKEN_CACHE.stats()['hits'])
+
+    def test_get_token_returns_copy_of_cached_token(self):
+        """get_token() never returns the same cached token object twice
+        """
+        from pyramid.testing import DummyRequest
+        from .. import ADMIN, utils
+        request = DummyRequest()
+        request.authorization = 'Key', self.token.key
+        expected = utils.get_token(request)
+        expected.user.add_group(ADMIN)
+        result = utils.get_token(request)
+        self.assertIsNot(expected, result)
+        self.assertNotIn(ADMIN, result.user.groups)
+
+    def test_get_token_records_hit(self):
+        """get_token() counts a cache hit for a cached token
+        """
+        from pyramid.testing import DummyRequest
+        from .. import cache, utils
+        request = DummyRequest()
+        request.authorization = 'Key', self.token.key
+        utils.get_token(request)
+        utils.get_token(request)
+        result = cache.TOKEN_CACHE.stats()['hits']
+        self.assertEqual(1, result)
+
+
+class SignedTokenIntegrationTests(AuthUtilsBaseIntegrationTests):
+
+    def setUp(self):
+        super().setUp()
+        from stackcite.users import models
+        from .. import signed
+        models.TokenRevocation.drop_collection()
+        signed.TOKEN_SIGNER.configure('x' * 32)
+
+    def tearDown(self):
+        from .. import signed
+        signed.TOKEN_SIGNER.configure(None)
+
+    def test_get_token_verifies_signed_token(self):
+        """get_token() returns a signed token without a database lookup
+        """
+        from pyramid.testing import DummyRequest
+        from .. import utils
+        token = utils.issue_token(self.user)
+        request = DummyRequest()
+        request.authorization = 'Key', token.key
+        result = utils.get_token(request)
+        self.assertEqual(token.key, result.key)
+
+    def test_get_user_returns_signed_token_user(self):
+        """get_user() returns the user carried by a signed token
+        """
+        from pyramid.testing import DummyRequest
+        from .. import utils
+        request = DummyRequest()
+        request.token = utils.issue_token(self.user)
+        result = utils.get_user(request)
+        self.assertEqual(self.user.id, result.id)
+
+    def test_invalidate_user_revokes_signed_tokens(self):
+        """invalidate_user() revokes signed tokens issued to a user
+        """
+        from pyramid.testing import DummyRequest
+        from .. import utils
+        token = utils.issue_token(self.user)
+        utils.invalidate_user(self.user.id)
+        request = DummyRequest()
+        request.authorization = 'Key', token.key
+        result = utils.get_token(request)
+        self.assertIsNone(result)
+
+
+class TokenFilterGetTokenIntegrationTests(AuthUtilsBaseIntegrationTests):
+
+    def setUp(self):
+        super().setUp()
+        from .. import bloom
+        bloom.TOKEN_FILTER.configure(capacity=1000)
+        self.addCleanup(bloom.TOKEN_FILTER.configure)
+        bloom.TOKEN_FILTER.rebuild()
+
+    def test_get_token_returns_filtered_token(self):
+        """get_token() returns a token that passes the token filter
+        """
+        from pyramid.testing import DummyRequest
+        from .. import utils
+        request = DummyRequest()
+        request.authorization = 'Key', self.token.key
+        result = utils.get_token(request)
+        self.assertEqual(self.token, result)
+
+    def test_get_token_skips_lookup_for_ruled_out_key(self):
+        """get_token() returns None for a key ruled out by the token filter
+        """
+        from pyramid.testing import DummyRequest
+        from .. import utils
+        from .. import bloom
+        bloom.TOKEN_FILTER.discard(self.token.key)
+        request = DummyRequest()
+        request.authorization = 'Key', self.token.key
+        result = utils.get_token(request)
+        self.assertIsNone(result)
+
+
+class SingleFlightGetTokenIntegrationTests(AuthUtilsBaseIntegrationTests):
+
+    def test_concurrent_callers_get_own_token(self):
+        """get_token() returns a different token to each caller sharing a lookup
+        """
+        import threading
+        import time
+        from pyramid.testing import DummyRequest
+        from .. import bloom, cache, utils
+        started, release = threading.Event(), threading.Event()
+
+        def might_contain(key):
+            # Holds the leader's lookup until the follower is waiting for it
+            started.set()
+            release.wait(5)
+            return True
+
+        bloom.TOKEN_FILTER.might_contain = might_contain
+        self.addCleanup(delattr, bloom.TOKEN_FILTER, 'might_contain')
+        shared = cache.TOKEN_LOOKUPS.shared
+        results = []
+
+        def get_token():
+            request = DummyRequest()
+            request.authorization = 'Key', self.token.key
+            results.append(utils.get_token(request))
+
+        leader = threading.Thread(target=get_token)
+        follower = threading.Thread(target=get_token)
+        leader.start()
+        started.wait(5)
+        follower.start()
+        for _ in range(500):
+            if cache.TOKEN_LOOKUPS.shared > shared:
+                break
+            time.sleep(0.01)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(shared + 1, cache.TOKEN_LOOKUPS.shared)
+        self.assertEqual([self.token, self.token], results)
+        self.assertIsNot(results[0], results[1])
+
+
+class NegativeCacheGetTokenIntegrationTests(AuthUtilsBaseIntegrationTests):
+
+    def setUp(self):
+        super().setUp()
+        from .. import cache
+        cache.NEGATIVE_CACHE.configure(size=10, ttl=5)
+        self.addCleanup(cache.NEGATIVE_CACHE.configure, 0, 5)
+
+    def test_missing_key_is_cached(self):
+        """get_token() answers a recently missing key without a query
+        """
+        import mongoengine
+        from pyramid.testing import DummyRequest
+        from .. import cache, utils
+        request = DummyRequest()
+        request.authorization = 'Key', utils.gen_key()
+        with self.assertRaises(mongoengine.DoesNotExist):
+            utils.get_token(request)
+        hits = cache.NEGATIVE_CACHE.hits
+        with self.assertRaises(mongoengine.DoesNotExist):
+            utils.get_token(request)
+        self.assertEqual(hits + 1, cache.NEGATIVE_CACHE.hits)
@@ -4,9 +4,19 @@ import mongoengine
 
 from mongoengine import context_managers, InvalidDocumentError
 
-from stackcite.users import models
+from stackcite.users import db, models
 from stackcite.api.validators import keys
 
+from .cache import (
+    NEGATIVE_CACHE,
+    TOKEN_CACHE,
+    TOKEN_LOOKUPS,
+    restore,
+    snapshot
+)
+from .bloom import TOKEN_FILTER
+from .signed import TOKEN_SIGNER, SignedToken
+
 
 def gen_key():
     """
@@ -21,27 +31,110 @@ def get_token(request):
     take the following form:
 
     `Authentication: key [token]`
+
+    Tokens are served from :data:`TOKEN_CACHE` when possible, and keys that
+    were recently not found are answered from :data:`NEGATIVE_CACHE`. Keys
+    that :data:`TOKEN_FILTER` rules out are treated as anonymous. Other keys
+    are read with the `token` read preference of
+    :data:`~stackcite.users.db.READS`, sharing one query between concurrent
+    lookups of the same key (see :data:`TOKEN_LOOKUPS`). Every caller gets
+    its own token document.
+
+    If signed tokens are enabled, the key is verified by :data:`TOKEN_SIGNER`
+    instead.
     """
 
     try:
         auth_type, key = request.authorization
-        if auth_type.lower() == 'key' and keys.validate_key(key):
-            token = models.AuthToken.objects.get(_key=key)
+        if auth_type.lower() != 'key':
+            return None
+        if TOKEN_SIGNER.enabled:
+            return TOKEN_SIGNER.verify(key)
+        if keys.validate_key(key):
+            token = TOKEN_CACHE.get(key)
+            if token is None:
+                if NEGATIVE_CACHE.get(key):
+                    raise models.AuthToken.DoesNotExist()
+                found = TOKEN_LOOKUPS.do(key, lambda: _lookup_token(key))
+                token = restore(found) if found is not None else None
             return token
     except (ValueError, TypeError, InvalidDocumentError):
         return None
 
 
+def _lookup_token(key):
+    # Returns a snapshot, which is shared by every caller waiting for the
+    # lookup (see `get_token()`)
+    if not TOKEN_FILTER.might_contain(key):
+        return None
+    try:
+        token = db.READS.get(models.AuthToken, 'token', _key=key)
+    except models.AuthToken.DoesNotExist:
+        NEGATIVE_CACHE.set(key, True)
+        raise
+    TOKEN_CACHE.set(key, token, user_id=get_owner_id(token))
+    return snapshot(token)
+
+
+def get_owner_id(token):
+    """
+    Returns the `id` of the user a token was issued to without dereferencing
+    the user.
+    """
+
+    with context_managers.no_dereference(type(token)):
+        return token.user.id
+
+
 def get_user(request):
     """
     Returns a user based on an API key located in the request header.
     """
 
+    if isinstance(request.token, SignedToken):
+        return request.token.user
     if request.token:
         with context_managers.no_dereference(request.token) as token:
             return token.user
 
 
+def issue_token(user):
+    """
+    Issues a new token for an authenticated user, either a signed token or a
+    newly saved :class:`~AuthToken`.
+    """
+
+    if TOKEN_SIGNER.enabled:
+        return TOKEN_SIGNER.issue(user)
+    token = models.AuthToken.new(user, save=True)
+    TOKEN_FILTER.add(token.key)
+    NEGATIVE_CACHE.invalidate(token.key)
+    return token
+
+
+def invalidate_token(token):
+    """
+    Makes sure a deleted or logged out token is no longer accepted.
+    """
+
+    if isinstance(token, SignedToken):
+        TOKEN_SIGNER.revoke(token)
+    else:
+        TOKEN_CACHE.invalidate(token.key)
+        TOKEN_FILTER.discard(token.key)
+
+
+def invalidate_user(user_id):
+    """
+    Makes sure no previously issued token carries stale data for a user that
+    was deleted or had their groups changed.
+    """
+
+    TOKEN_CACHE.invalidate_user(user_id)
+    if TOKEN_SIGNER.enabled:
+        TOKEN_SIGNER.revoke_user(user_id)
+
+
 def get_groups(user_id, request):
     """
     Returns a list of groups for the current user if `user_id` matches the `id`
@@ -0,0 +1,177 @@
+import json
+
+from bson import ObjectId
+from datetime import date, datetime, timezone
+from pyramid import httpexceptions
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+CODECS = ('auto', 'orjson', 'json')
+
+# 1 MiB
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def _isoformat(value):
+    # Naive datetimes are UTC, formatted like marshmallow's `DateTime`
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return _isoformat(obj)
+    msg = 'Object of type {} is not JSON serializable'.format(
+        type(obj).__name__)
+    raise TypeError(msg)
+
+
+class StdlibCodec(object):
+    """
+    Encodes and decodes JSON with the standard library.
+    """
+
+    name = 'json'
+
+    def dumps(self, value, default=_default):
+        return json.dumps(value, default=default).encode('utf-8')
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonCodec(object):
+    """
+    Encodes and decodes JSON with `orjson`, which serializes datetimes (as
+    UTC) natively.
+    """
+
+    name = 'orjson'
+
+    def dumps(self, value, default=_default):
+        return orjson.dumps(
+            value, default=default, option=orjson.OPT_NAIVE_UTC)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class Codec(object):
+    """
+    The JSON codec used to parse request bodies and render responses.
+
+    The `'auto'` codec uses `orjson` if it is installed and the standard
+    library otherwise. Both encode `ObjectId`, `datetime` and `date` values
+    (as strings).
+    """
+
+    def __init__(self, name='auto', max_body_size=MAX_BODY_SIZE):
+        self.configure(name, max_body_size)
+
+    def configure(self, name='auto', max_body_size=MAX_BODY_SIZE):
+        if name not in CODECS:
+            msg = 'Invalid JSON codec: {}'.format(name)
+            raise ValueError(msg)
+        if name == 'orjson' and orjson is None:
+            msg = 'The orjson codec requires the orjson package'
+            raise ValueError(msg)
+        if name == 'json' or orjson is None:
+            self._codec = StdlibCodec()
+        else:
+            self._codec = OrjsonCodec()
+        self.max_body_size = int(max_body_size)
+
+    @property
+    def name(self):
+        return self._codec.name
+
+    def dumps(self, value, default=_default):
+        """
+        Encodes a value as UTF-8 JSON bytes. `default` is called for objects
+        the codec cannot encode, and must return an encodable value or raise
+        `TypeError`.
+        """
+        return self._codec.dumps(value, default=default)
+
+    def loads(self, data):
+        """
+        Decodes JSON from `bytes` or `str`. Raises `ValueError` for invalid
+        JSON.
+        """
+        return self._codec.loads(data)
+
+
+CODEC = Codec()
+
+
+def json_body(request):
+    """
+    Parses a request's JSON body with :data:`CODEC` (replacing WebOb's
+    `request.json_body`). Bodies larger than `CODEC.max_body_size` bytes are
+    rejected with 413 Request Entity Too Large before they are parsed.
+    """
+    limit = CODEC.max_body_size
+    length = request.content_length
+    if limit and length is not None and length > limit:
+        raise httpexceptions.HTTPRequestEntityTooLarge()
+    body = request.body
+    if limit and len(body) > limit:
+        raise httpexceptions.HTTPRequestEntityTooLarge()
+    return CODEC.loads(body)
+
+
+class JSONRenderer(object):
+    """
+    A Pyramid renderer factory rendering values with :data:`CODEC`.
+
+    Like Pyramid's own JSON renderer, objects the codec cannot encode are
+    rendered by their `__json__(request)` method, or by an adapter
+    registered for their type with :meth:`add_adapter`.
+    """
+
+    def __init__(self, codec=CODEC, adapters=()):
+        self.codec = codec
+        self._adapters = []
+        for type_or_iface, adapter in adapters:
+            self.add_adapter(type_or_iface, adapter)
+
+    def add_adapter(self, type_or_iface, adapter):
+        """
+        Renders objects of a type (or providing an interface) with
+        `adapter(obj, request)`.
+        """
+        self._adapters.append((type_or_iface, adapter))
+
+    def _make_default(self, request):
+        def default(obj):
+            if hasattr(obj, '__json__'):
+                return obj.__json__(request)
+            for type_or_iface, adapter in self._adapters:
+                if isinstance(type_or_iface, type):
+                    matches = isinstance(obj, type_or_iface)
+                else:
+                    matches = type_or_iface.providedBy(obj)
+                if matches:
+                    return adapter(obj, request)
+            return _default(obj)
+        return default
+
+    def __call__(self, info):
+        def _render(value, system):
+            request = system.get('request')
+            if request is not None:
+                response = request.response
+                if response.content_type == response.default_content_type:
+                    response.content_type = 'application/json'
+            return self.codec.dumps(
+                value, default=self._make_default(request))
+        return _render
@@ -0,0 +1,199 @@
+import contextlib
+import logging
+
+import mongoengine
+
+from mongoengine import connection as me_connection
+from pymongo import read_preferences
+
+from stackcite.users import metrics
+
+
+_LOG = logging.getLogger(__name__)
+
+
+def _compressors(value):
+    return [c for c in value.replace(',', ' ').split() if c]
+
+
+# Maps `mongo.<setting>` to a MongoClient option
+CLIENT_OPTIONS = (
+    ('max_pool_size', 'maxPoolSize', int),
+    ('min_pool_size', 'minPoolSize', int),
+    ('max_idle_time_ms', 'maxIdleTimeMS', int),
+    ('wait_queue_timeout_ms', 'waitQueueTimeoutMS', int),
+    ('server_selection_timeout_ms', 'serverSelectionTimeoutMS', int),
+    ('connect_timeout_ms', 'connectTimeoutMS', int),
+    ('socket_timeout_ms', 'socketTimeoutMS', int),
+    ('compressors', 'compressors', _compressors),
+    ('appname', 'appname', str),
+)
+
+
+def client_options(settings):
+    """
+    Returns the MongoClient options set by the `mongo.*` settings. Options
+    that are not set are left to the driver's defaults.
+    """
+    options = {}
+    for setting, option, convert in CLIENT_OPTIONS:
+        value = settings.get('mongo.' + setting)
+        if value is None or value == '':
+            continue
+        options[option] = convert(value)
+    return options
+
+
+class Connection(object):
+    """
+    Registers the MongoEngine connection without opening it: the client
+    connects on its first operation, in whichever process performs it.
+
+    pymongo clients are not fork-safe once they have connected, so
+    :func:`~stackcite.users.main` performs no database operation. Everything
+    that reads or writes at startup (e.g. the token filter and the outbox
+    dispatcher) starts lazily in each process instead, so the workers of a
+    pre-forking server that preloads the application each connect their
+    own client. Keep it that way when adding settings.
+    """
+
+    def __init__(self):
+        self.host = None
+        self.db = None
+        self.options = {}
+        self.transactions = None
+
+    def configure(self, host, db, **options):
+        self.host = host
+        self.db = db
+        self.options = options
+        self.transactions = None
+        self.connect()
+
+    def connect(self):
+        alias = mongoengine.DEFAULT_CONNECTION_NAME
+        mongoengine.disconnect(alias)
+        mongoengine.connect(
+            host=self.host, db=self.db, alias=alias, connect=False,
+            **self.options)
+
+    def supports_transactions(self):
+        """
+        Returns `True` if the server is a replica set member or a `mongos`
+        with sessions, checked once on the first call.
+        """
+        if self.transactions is None:
+            client = me_connection.get_connection()
+            hello = client.admin.command('ismaster')
+            cluster = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+            self.transactions = (
+                cluster and 'logicalSessionTimeoutMinutes' in hello)
+        return self.transactions
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Yields a session whose writes are committed together when the block
+        exits (and aborted if it raises). Standalone servers do not support
+        transactions, so there the session is `None` and every write made
+        with it is applied on its own.
+        """
+        if not self.supports_transactions():
+            yield None
+            return
+        client = me_connection.get_connection()
+        with client.start_session() as session:
+            with session.start_transaction():
+                yield session
+
+
+CONNECTION = Connection()
+
+
+# Read preference modes by their name in the settings
+READ_MODES = {
+    'primary': read_preferences.Primary,
+    'primaryPreferred': read_preferences.PrimaryPreferred,
+    'secondary': read_preferences.Secondary,
+    'secondaryPreferred': read_preferences.SecondaryPreferred,
+    'nearest': read_preferences.Nearest
+}
+
+# Reads that can be routed: token validation, `GET /{userId}/` and admin
+# user listings
+READ_OPERATIONS = ('token', 'user', 'listing')
+
+# The smallest staleness bound MongoDB accepts (in seconds)
+MIN_MAX_STALENESS = 90
+
+
+class ReadRouter(object):
+    """
+    Chooses the read preference of each routed read operation. Reads that
+    may go to a secondary are bounded by `max_staleness` seconds of
+    replication lag (`-1` for no bound).
+
+    With `fallback`, a single-document read that finds nothing on a
+    secondary is repeated on the primary, so a document read right after it
+    was written (e.g. a token used as soon as it is issued) is still found.
+    """
+
+    def __init__(self, preferences=None, max_staleness=-1, fallback=True):
+        self.configure(preferences, max_staleness, fallback)
+
+    def configure(self, preferences=None, max_staleness=-1, fallback=True):
+        preferences = preferences or {}
+        max_staleness = int(max_staleness)
+        if max_staleness != -1 and max_staleness < MIN_MAX_STALENESS:
+            msg = 'Max staleness must be -1 or at least {} seconds'.format(
+                MIN_MAX_STALENESS)
+            raise ValueError(msg)
+        routes = {}
+        for operation in READ_OPERATIONS:
+            mode = preferences.get(operation) or 'primary'
+            if mode not in READ_MODES:
+                msg = 'Invalid read preference for {}: {}'.format(
+                    operation, mode)
+                raise ValueError(msg)
+            if mode == 'primary':
+                routes[operation] = read_preferences.ReadPreference.PRIMARY
+            else:
+                routes[operation] = READ_MODES[mode](
+                    max_staleness=max_staleness)
+        self.routes = routes
+        self.max_staleness = max_staleness
+        self.fallback = bool(fallback)
+
+    def read_preference(self, operation):
+        return self.routes[operation]
+
+    def on_primary(self, operation):
+        primary = read_preferences.ReadPreference.PRIMARY
+        return self.routes[operation].mode == primary.mode
+
+    def queryset(self, document_cls, operation):
+        """
+        Returns `document_cls.objects` with the operation's read preference.
+        """
+        queryset = document_cls.objects
+        if self.on_primary(operation):
+            return queryset
+        return queryset.read_preference(self.routes[operation])
+
+    def get(self, document_cls, operation, **query):
+        """
+        Fetches a single document with the operation's read preference,
+        falling back to the primary if it is not found.
+        """
+        if self.on_primary(operation):
+            return document_cls.objects.get(**query)
+        try:
+            return self.queryset(document_cls, operation).get(**query)
+        except document_cls.DoesNotExist:
+            if not self.fallback:
+                raise
+        metrics.REPLICA_READ_FALLBACKS.inc(operation=operation)
+        return document_cls.objects.get(**query)
+
+
+READS = ReadRouter()
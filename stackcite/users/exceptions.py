@@ -10,3 +10,29 @@ class AuthenticationError(StackciteError):
     """
 
     _DEFAULT_MESSAGE = 'Authentication failed'
+
+
+class ServiceUnavailableError(StackciteError):
+    """
+    A custom exception raised when the service is too busy to handle a request.
+    Clients should retry after `retry_after` seconds.
+    """
+
+    _DEFAULT_MESSAGE = 'Service temporarily unavailable'
+
+    def __init__(self, *args, retry_after=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(StackciteError):
+    """
+    A custom exception raised when a client has made too many attempts.
+    Clients should retry after `retry_after` seconds.
+    """
+
+    _DEFAULT_MESSAGE = 'Too many attempts'
+
+    def __init__(self, *args, retry_after=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
@@ -0,0 +1,306 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import os
+
+from collections import OrderedDict
+
+import bcrypt
+
+from stackcite.users import hashing, instrumentation
+
+try:
+    import argon2
+    import argon2.low_level
+except ImportError:
+    argon2 = None
+
+
+_LOG = logging.getLogger(__name__)
+
+
+def _b64encode(data):
+    return base64.b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+class Hasher(object):
+    """
+    A password hashing algorithm producing self-describing hashes of the
+    form `$<algorithm>$<parameters>$<salt and digest>`.
+
+    :meth:`encode` and :meth:`verify` may run on a process pool, so they
+    must only depend on their arguments and the hasher's parameters.
+    """
+
+    name = None
+    prefixes = ()
+
+    def identifies(self, encoded):
+        return encoded.startswith(self.prefixes)
+
+    def salt(self):
+        raise NotImplementedError()
+
+    def encode(self, password, salt):
+        """
+        Returns the encoded hash of a password.
+        """
+        raise NotImplementedError()
+
+    def verify(self, password, encoded):
+        """
+        Returns `True` if a password matches an encoded hash.
+        """
+        raise NotImplementedError()
+
+    def needs_rehash(self, encoded):
+        """
+        Returns `True` if an encoded hash was made with other parameters than
+        the current ones.
+        """
+        raise NotImplementedError()
+
+
+class BcryptHasher(Hasher):
+    """
+    bcrypt, at the cost factor set with
+    :func:`~stackcite.users.hashing.set_rounds`.
+    """
+
+    name = 'bcrypt'
+    prefixes = ('$2a$', '$2b$', '$2y$')
+
+    def salt(self):
+        return hashing.gensalt()
+
+    def encode(self, password, salt):
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('ascii')
+
+    def verify(self, password, encoded):
+        try:
+            return bcrypt.checkpw(
+                password.encode('utf-8'), encoded.encode('ascii'))
+        except ValueError:
+            return False
+
+    def needs_rehash(self, encoded):
+        return hashing.needs_rehash(encoded)
+
+
+class ScryptHasher(Hasher):
+    """
+    scrypt (from :mod:`hashlib`), encoded as
+    `$scrypt$ln=<log2 n>,r=<r>,p=<p>$<salt>$<digest>`.
+    """
+
+    name = 'scrypt'
+    prefixes = ('$scrypt$',)
+
+    DIGEST_SIZE = 32
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.configure(n, r, p)
+
+    def configure(self, n=2 ** 14, r=8, p=1):
+        n, r, p = int(n), int(r), int(p)
+        if n < 2 or n & (n - 1) or r < 1 or p < 1:
+            msg = 'Invalid scrypt parameters: n={}, r={}, p={}'.format(n, r, p)
+            raise ValueError(msg)
+        self.n, self.r, self.p = n, r, p
+
+    @staticmethod
+    def _params(n, r, p):
+        return 'ln={},r={},p={}'.format(n.bit_length() - 1, r, p)
+
+    @staticmethod
+    def _parse(encoded):
+        _, _, params, salt, digest = encoded.split('$')
+        params = dict(param.split('=') for param in params.split(','))
+        n, r, p = 1 << int(params['ln']), int(params['r']), int(params['p'])
+        return n, r, p, _b64decode(salt), _b64decode(digest)
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(
+            password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+            maxmem=256 * n * r, dklen=self.DIGEST_SIZE)
+
+    def salt(self):
+        return os.urandom(16)
+
+    def encode(self, password, salt):
+        digest = self._derive(password, salt, self.n, self.r, self.p)
+        return '$scrypt${}${}${}'.format(
+            self._params(self.n, self.r, self.p),
+            _b64encode(salt), _b64encode(digest))
+
+    def verify(self, password, encoded):
+        try:
+            n, r, p, salt, digest = self._parse(encoded)
+        except (ValueError, KeyError, binascii.Error):
+            return False
+        return hmac.compare_digest(
+            self._derive(password, salt, n, r, p), digest)
+
+    def needs_rehash(self, encoded):
+        try:
+            n, r, p, _, _ = self._parse(encoded)
+        except (ValueError, KeyError, binascii.Error):
+            return True
+        return (n, r, p) != (self.n, self.r, self.p)
+
+
+class Argon2Hasher(Hasher):
+    """
+    Argon2id (requires `argon2-cffi`), in the standard PHC string format.
+
+    Without `argon2-cffi`, stored argon2 hashes never verify (so those users
+    cannot log in until it is installed) and are left as they are.
+    """
+
+    name = 'argon2'
+    prefixes = ('$argon2id$',)
+
+    DIGEST_SIZE = 32
+
+    def __init__(self, time_cost=3, memory_cost=65536, parallelism=4):
+        self.configure(time_cost, memory_cost, parallelism)
+
+    def configure(self, time_cost=3, memory_cost=65536, parallelism=4):
+        self.time_cost = int(time_cost)
+        self.memory_cost = int(memory_cost)
+        self.parallelism = int(parallelism)
+
+    @property
+    def available(self):
+        return argon2 is not None
+
+    def _hasher(self):
+        if argon2 is None:
+            msg = 'argon2 password hashes require the argon2-cffi package'
+            raise RuntimeError(msg)
+        return argon2.PasswordHasher(
+            time_cost=self.time_cost, memory_cost=self.memory_cost,
+            parallelism=self.parallelism, hash_len=self.DIGEST_SIZE)
+
+    def salt(self):
+        return os.urandom(16)
+
+    def encode(self, password, salt):
+        self._hasher()
+        return argon2.low_level.hash_secret(
+            password.encode('utf-8'), salt,
+            time_cost=self.time_cost, memory_cost=self.memory_cost,
+            parallelism=self.parallelism, hash_len=self.DIGEST_SIZE,
+            type=argon2.low_level.Type.ID).decode('ascii')
+
+    def verify(self, password, encoded):
+        if argon2 is None:
+            _LOG.error('Cannot verify an argon2 password hash without the '
+                       'argon2-cffi package')
+            return False
+        try:
+            return self._hasher().verify(encoded, password)
+        except (argon2.exceptions.VerificationError,
+                argon2.exceptions.InvalidHash):
+            return False
+
+    def needs_rehash(self, encoded):
+        if argon2 is None:
+            _LOG.error('Cannot check an argon2 password hash without the '
+                       'argon2-cffi package')
+            return False
+        return self._hasher().check_needs_rehash(encoded)
+
+
+class HasherRegistry(object):
+    """
+    The available password hashers. New passwords are hashed with the
+    configured `algorithm`, while stored hashes are checked by whichever
+    hasher their prefix identifies.
+    """
+
+    def __init__(self, *hashers, algorithm='bcrypt'):
+        self._hashers = OrderedDict()
+        for hasher in hashers:
+            self.register(hasher)
+        self.configure(algorithm)
+
+    def register(self, hasher):
+        self._hashers[hasher.name] = hasher
+        return hasher
+
+    def get(self, name):
+        return self._hashers[name]
+
+    @property
+    def algorithms(self):
+        return tuple(self._hashers)
+
+    def configure(self, algorithm='bcrypt'):
+        hasher = self._hashers.get(algorithm)
+        if hasher is None:
+            msg = 'Invalid password hashing algorithm: {}'.format(algorithm)
+            raise ValueError(msg)
+        if not getattr(hasher, 'available', True):
+            msg = 'Password hashing algorithm not installed: {}'.format(
+                algorithm)
+            raise ValueError(msg)
+        self.algorithm = algorithm
+
+    @property
+    def default(self):
+        return self._hashers[self.algorithm]
+
+    def identify(self, encoded):
+        """
+        Returns the hasher that produced an encoded hash, or `None`.
+        """
+        if encoded:
+            for hasher in self._hashers.values():
+                if hasher.identifies(encoded):
+                    return hasher
+        return None
+
+    def hash(self, password):
+        """
+        Hashes a password with the default hasher on the hashing pool.
+        """
+        hasher = self.default
+        salt = hasher.salt()
+        with instrumentation.timed('hash'):
+            return hashing.HASHING_POOL.submit(hasher.encode, password, salt)
+
+    def verify(self, password, encoded):
+        """
+        Checks a password against an encoded hash on the hashing pool.
+        """
+        hasher = self.identify(encoded)
+        if hasher is None:
+            return False
+        with instrumentation.timed('hash'):
+            return hashing.HASHING_POOL.submit(
+                hasher.verify, password, encoded)
+
+    def needs_rehash(self, encoded):
+        """
+        Returns `True` if an encoded hash should be replaced, because it was
+        made by another algorithm or with other parameters (subject to the
+        rehash policy, see :func:`~stackcite.users.hashing.needs_rehash`).
+        """
+        if hashing.REHASH_POLICY == 'never':
+            return False
+        hasher = self.identify(encoded)
+        if hasher is None:
+            return False
+        if hasher is not self.default:
+            return True
+        return hasher.needs_rehash(encoded)
+
+
+HASHERS = HasherRegistry(BcryptHasher(), ScryptHasher(), Argon2Hasher())
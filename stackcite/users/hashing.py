@@ -0,0 +1,211 @@
+import functools
+import logging
+import math
+import threading
+import time
+import bcrypt
+
+from concurrent import futures
+
+from stackcite.users import exceptions
+
+
+_LOG = logging.getLogger(__name__)
+
+POOL_KINDS = ('none', 'thread', 'process')
+
+# When to rehash a password at login: if its cost is below the current cost,
+# if it differs from the current cost or never
+REHASH_POLICIES = ('upgrade', 'always', 'never')
+
+BCRYPT_ROUNDS = 12
+
+REHASH_POLICY = 'upgrade'
+
+
+class HashingPool(object):
+    """
+    A bounded executor for password hashing. At most `workers` hashes run
+    concurrently and at most `queue_depth` more may wait for a free worker.
+    Submitting work to a saturated pool raises
+    :class:`~stackcite.users.exceptions.ServiceUnavailableError` instead of
+    blocking the calling thread.
+
+    A pool of kind `'none'` hashes inline on the calling thread.
+    """
+
+    def __init__(self, kind='none', workers=1, queue_depth=0, retry_after=1):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self.configure(kind, workers, queue_depth, retry_after)
+
+    def configure(self, kind, workers, queue_depth, retry_after=1):
+        """
+        Replaces the underlying executor. Pending work on the previous
+        executor is allowed to finish.
+        """
+        if kind not in POOL_KINDS:
+            msg = 'Invalid hashing pool kind: {}'.format(kind)
+            raise ValueError(msg)
+        workers, queue_depth = int(workers), int(queue_depth)
+        if workers < 1 or queue_depth < 0:
+            msg = 'Hashing pool requires at least one worker'
+            raise ValueError(msg)
+        self.shutdown(wait=False)
+        with self._lock:
+            self.kind = kind
+            self.workers = workers
+            self.queue_depth = queue_depth
+            self.retry_after = int(retry_after)
+            self._pending = 0
+            self._slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    @property
+    def pending(self):
+        """
+        The number of hashes currently running or waiting for a worker.
+        """
+        return self._pending
+
+    def _get_executor(self):
+        # Executors are created lazily so that a process pool is never forked
+        # before the server itself forks its workers
+        with self._lock:
+            if self._executor is None:
+                if self.kind == 'process':
+                    executor = futures.ProcessPoolExecutor
+                else:
+                    executor = futures.ThreadPoolExecutor
+                self._executor = executor(max_workers=self.workers)
+            return self._executor
+
+    def _release(self, slots, future=None):
+        with self._lock:
+            if slots is self._slots:
+                self._pending -= 1
+        slots.release()
+
+    def submit(self, fn, *args):
+        """
+        Runs `fn(*args)` on the pool and waits for the result.
+        """
+        if self.kind == 'none':
+            return fn(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise exceptions.ServiceUnavailableError(
+                retry_after=self.retry_after)
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release(slots)
+            raise
+        future.add_done_callback(functools.partial(self._release, slots))
+        return future.result()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+HASHING_POOL = HashingPool()
+
+
+def set_rounds(rounds):
+    """
+    Sets the bcrypt cost factor used for new salts.
+    """
+    global BCRYPT_ROUNDS
+    rounds = int(rounds)
+    if not 4 <= rounds <= 31:
+        msg = 'Invalid bcrypt cost factor: {}'.format(rounds)
+        raise ValueError(msg)
+    BCRYPT_ROUNDS = rounds
+
+
+def gensalt():
+    """
+    Generates a new bcrypt salt at the configured cost factor.
+    """
+    return bcrypt.gensalt(BCRYPT_ROUNDS)
+
+
+def set_rehash_policy(policy):
+    """
+    Sets when :func:`needs_rehash` asks for a stored hash to be replaced.
+    """
+    global REHASH_POLICY
+    if policy not in REHASH_POLICIES:
+        msg = 'Invalid rehash policy: {}'.format(policy)
+        raise ValueError(msg)
+    REHASH_POLICY = policy
+
+
+def cost(salt):
+    """
+    Returns the cost factor of a bcrypt salt or hash (e.g. `$2b$12$...`), or
+    `None` if it cannot be parsed.
+    """
+    if isinstance(salt, bytes):
+        salt = salt.decode('ascii', 'replace')
+    try:
+        return int(salt.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(salt):
+    """
+    Returns `True` if a password stored with `salt` should be hashed again at
+    the current cost factor.
+    """
+    if REHASH_POLICY == 'never':
+        return False
+    current = cost(salt)
+    if current is None:
+        return False
+    if REHASH_POLICY == 'upgrade':
+        return current < BCRYPT_ROUNDS
+    return current != BCRYPT_ROUNDS
+
+
+def _measure(rounds, timer):
+    salt = bcrypt.gensalt(rounds)
+    start = timer()
+    bcrypt.hashpw(b'calibration', salt)
+    return (timer() - start) * 1000
+
+
+def calibrate(target_ms, min_rounds=4, max_rounds=16, timer=time.perf_counter):
+    """
+    Returns the highest bcrypt cost factor between `min_rounds` and
+    `max_rounds` that hashes a password within `target_ms` milliseconds on
+    this machine.
+
+    Every additional round doubles the hashing time, so the cost factor is
+    extrapolated from one cheap measurement and then checked once.
+    """
+    target_ms = float(target_ms)
+    if target_ms <= 0:
+        msg = 'Invalid hashing target: {} ms'.format(target_ms)
+        raise ValueError(msg)
+    min_rounds, max_rounds = int(min_rounds), int(max_rounds)
+    if not 4 <= min_rounds <= max_rounds <= 31:
+        msg = 'Invalid bcrypt cost range: {}-{}'.format(min_rounds, max_rounds)
+        raise ValueError(msg)
+    base = min(max(min_rounds, 8), max_rounds)
+    elapsed = min(_measure(base, timer) for _ in range(3))
+    rounds = base + int(math.floor(math.log2(target_ms / max(elapsed, 1e-3))))
+    rounds = min(max(rounds, min_rounds), max_rounds)
+    elapsed = _measure(rounds, timer)
+    if elapsed > target_ms and rounds > min_rounds:
+        rounds -= 1
+        elapsed /= 2
+    _LOG.info('Calibrated bcrypt cost factor: {} (~{:.0f} ms)'.format(
+        rounds, elapsed))
+    return rounds
@@ -0,0 +1,216 @@
+import logging
+import threading
+
+from stackcite.users import metrics
+
+
+_LOG = logging.getLogger(__name__)
+
+_LOCAL = threading.local()
+
+
+class IdentityMap(object):
+    """
+    The documents loaded while handling one request, keyed by class and by
+    `id` or another unique field, so that looking the same document up again
+    returns the loaded instance without a query.
+
+    It is also a unit of work: saves and deletes scheduled with
+    :func:`save` and :func:`delete` are applied once, in order, by
+    :meth:`flush` when the request succeeds. Only writes made through
+    those functions are deferred; documents written directly should be
+    recorded with :func:`add`.
+    """
+
+    def __init__(self):
+        self._documents = {}
+        self._pending = []
+        self._scheduled = set()
+        self._callbacks = []
+        self.hits = 0
+
+    @staticmethod
+    def _lookup_field(document_cls, query):
+        if len(query) != 1:
+            return None
+        (name, value), = query.items()
+        if name in ('id', 'pk'):
+            return 'id', value
+        field = document_cls._fields.get(name)
+        if field is None or not (field.unique or field.primary_key):
+            return None
+        if field.primary_key:
+            return 'id', value
+        return name, value
+
+    def _keys(self, document):
+        document_cls = type(document)
+        keys = [(document_cls, 'id', str(document.pk))]
+        for name, field in document_cls._fields.items():
+            if field.unique and not field.primary_key:
+                value = getattr(document, name, None)
+                if value is not None:
+                    keys.append((document_cls, name, str(value)))
+        return keys
+
+    def get(self, document_cls, load=None, **query):
+        """
+        Returns `document_cls.objects.get(**query)` (or the result of
+        `load()`), loading it only the first time it is looked up by its
+        `id` or a unique field.
+        """
+        if load is None:
+            def load():
+                return document_cls.objects.get(**query)
+        lookup = self._lookup_field(document_cls, query)
+        if lookup is None:
+            return load()
+        key = (document_cls, lookup[0], str(lookup[1]))
+        document = self._documents.get(key)
+        if document is not None:
+            self.hits += 1
+            return document
+        document = load()
+        self.add(document)
+        return document
+
+    def add(self, document):
+        # Replaces a copy loaded earlier, including the keys of unique
+        # values it no longer has
+        stale = self._documents.get((type(document), 'id', str(document.pk)))
+        if stale is not None:
+            self.discard(stale)
+        for key in self._keys(document):
+            self._documents[key] = document
+
+    def discard(self, document):
+        for key, value in list(self._documents.items()):
+            if value is document:
+                del self._documents[key]
+
+    def schedule(self, action, document):
+        # A document is saved at most once, where it was first scheduled
+        marker = (action, id(document))
+        if marker in self._scheduled:
+            return
+        self._scheduled.add(marker)
+        self._pending.append((action, document))
+
+    def after_flush(self, callback):
+        self._callbacks.append(callback)
+
+    def flush(self):
+        """
+        Applies the scheduled saves and deletes, then runs the callbacks
+        registered with :func:`after_flush`.
+        """
+        pending, self._pending = self._pending, []
+        callbacks, self._callbacks = self._callbacks, []
+        self._scheduled.clear()
+        for action, document in pending:
+            if action == 'delete':
+                document.delete()
+                self.discard(document)
+            else:
+                document.save()
+        for callback in callbacks:
+            callback()
+
+
+def current():
+    """
+    Returns the identity map of the request being handled by this thread, or
+    `None`.
+    """
+    return getattr(_LOCAL, 'identity_map', None)
+
+
+def get(document_cls, load=None, **query):
+    """
+    Looks a document up through the current identity map, if there is one.
+    """
+    identity_map = current()
+    if identity_map is None:
+        if load is not None:
+            return load()
+        return document_cls.objects.get(**query)
+    return identity_map.get(document_cls, load, **query)
+
+
+def add(document):
+    """
+    Records a document that was written directly (not through :func:`save`)
+    in the current identity map, if there is one, replacing the copy that
+    was loaded before.
+    """
+    identity_map = current()
+    if identity_map is not None:
+        identity_map.add(document)
+
+
+def save(document):
+    """
+    Saves a document at the end of the current request, or now if there is
+    no identity map.
+    """
+    identity_map = current()
+    if identity_map is None:
+        document.save()
+    else:
+        identity_map.schedule('save', document)
+
+
+def delete(document):
+    """
+    Deletes a document at the end of the current request, or now if there
+    is no identity map.
+    """
+    identity_map = current()
+    if identity_map is None:
+        document.delete()
+    else:
+        identity_map.schedule('delete', document)
+
+
+def after_flush(callback):
+    """
+    Calls `callback` once the current request's changes have been written,
+    or now if there is no identity map.
+    """
+    identity_map = current()
+    if identity_map is None:
+        callback()
+    else:
+        identity_map.after_flush(callback)
+
+
+def identity_map_tween_factory(handler, registry):
+    """
+    A tween that gives each request its own :class:`IdentityMap` and flushes
+    it if the request succeeds. If the flush fails, the request fails with
+    the flush's exception (writes applied before the failure are kept).
+    """
+
+    def identity_map_tween(request):
+        identity_map = _LOCAL.identity_map = IdentityMap()
+        try:
+            response = handler(request)
+            if response.status_code < 400:
+                try:
+                    identity_map.flush()
+                except Exception:
+                    # The response has already been rendered as a success,
+                    # so it is dropped and the error is handled by the
+                    # exception views instead
+                    _LOG.exception('Identity map flush failed: {} {}'.format(
+                        request.method, request.path))
+                    raise
+            return response
+        finally:
+            _LOCAL.identity_map = None
+            if identity_map.hits:
+                metrics.IDENTITY_MAP_HITS.inc(identity_map.hits)
+                _LOG.debug('Identity map saved {} queries: {} {}'.format(
+                    identity_map.hits, request.method, request.path))
+
+    return identity_map_tween
@@ -0,0 +1,169 @@
+import logging
+import threading
+
+import marshmallow
+import mongoengine
+
+from bson import ObjectId
+from concurrent import futures
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from stackcite.users import codec, hashers, models, outbox, schema
+
+
+_LOG = logging.getLogger(__name__)
+
+_DUPLICATE_KEY = 11000
+
+
+def _result(line, **kwargs):
+    result = {'line': line}
+    result.update(kwargs)
+    return result
+
+
+def _failed(line, errors, email=None):
+    return _result(line, status='failed', email=email, errors=errors)
+
+
+class UserImporter(object):
+    """
+    Creates users (and their confirmation tokens) in bulk from NDJSON
+    records with the same fields as `POST /`.
+
+    Records are read and written in batches of `batch_size`: passwords are
+    hashed across a pool of `workers` processes (or inline if `workers` is
+    0) and users and tokens are each written with a single unordered
+    `insert_many`, so one bad record never aborts the rest of its batch.
+    """
+
+    def __init__(self, workers=0, batch_size=500):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.configure(workers, batch_size)
+
+    def configure(self, workers, batch_size=500):
+        workers, batch_size = int(workers), int(batch_size)
+        if workers < 0 or batch_size < 1:
+            msg = 'Invalid import settings: workers={}, batch_size={}'.format(
+                workers, batch_size)
+            raise ValueError(msg)
+        self.shutdown(wait=False)
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def _get_executor(self):
+        # Created lazily so that the pool is never forked before the server
+        # forks its own workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ProcessPoolExecutor(
+                    max_workers=self.workers)
+            return self._executor
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def _hash_passwords(self, passwords):
+        hasher = hashers.HASHERS.default
+        salts = [hasher.salt() for _ in passwords]
+        if self.workers:
+            chunksize = max(len(passwords) // (self.workers * 4), 1)
+            return list(self._get_executor().map(
+                hasher.encode, passwords, salts, chunksize=chunksize))
+        else:
+            return list(map(hasher.encode, passwords, salts))
+
+    def run(self, lines):
+        """
+        Imports users from an iterable of NDJSON lines (`str` or `bytes`) and
+        yields one result per non-blank line, in input order.
+        """
+        batch = []
+        for number, line in enumerate(lines, 1):
+            if line.strip():
+                batch.append((number, line))
+            if len(batch) >= self.batch_size:
+                yield from self._import_batch(batch)
+                batch = []
+        if batch:
+            yield from self._import_batch(batch)
+
+    def _load(self, batch):
+        schm = schema.User(strict=True)
+        schm.method = 'POST'
+        results, records = {}, []
+        for number, line in batch:
+            try:
+                data = codec.CODEC.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError()
+                data = schm.load(data).data
+            except marshmallow.ValidationError as err:
+                results[number] = _failed(number, err.messages)
+            except ValueError:
+                errors = {'_schema': ['Invalid JSON object.']}
+                results[number] = _failed(number, errors)
+            else:
+                records.append((number, data))
+        return results, records
+
+    def _build_users(self, records, results):
+        hashes = self._hash_passwords([data['password'] for _, data in records])
+        users = []
+        for (number, data), encoded in zip(records, hashes):
+            user = models.User(
+                id=ObjectId(), email=data['email'], _password=encoded)
+            for group in data.get('groups', ()):
+                user.add_group(group)
+            try:
+                user.validate()
+            except mongoengine.ValidationError as err:
+                results[number] = _failed(number, err.to_dict(), user.email)
+            else:
+                users.append((number, user))
+        return users
+
+    def _import_batch(self, batch):
+        results, records = self._load(batch)
+        users = self._build_users(records, results)
+
+        # Users
+        failed = {}
+        if users:
+            collection = models.User._get_collection()
+            try:
+                collection.insert_many(
+                    [user.to_mongo() for _, user in users], ordered=False)
+            except BulkWriteError as err:
+                for error in err.details['writeErrors']:
+                    if error['code'] == _DUPLICATE_KEY:
+                        msg = 'A user with this email address already exists.'
+                        failed[error['index']] = {'email': [msg]}
+                    else:
+                        failed[error['index']] = {'_schema': [error['errmsg']]}
+        created = []
+        for idx, (number, user) in enumerate(users):
+            if idx in failed:
+                results[number] = _failed(number, failed[idx], user.email)
+            else:
+                created.append((number, user))
+
+        # Confirmation tokens and their outbox messages (users without them
+        # can request a new one)
+        try:
+            outbox.issue_confirmations([user for _, user in created])
+        except PyMongoError as err:
+            _LOG.warning('Confirmation emails not queued: {}'.format(err))
+        for number, user in created:
+            results[number] = _result(
+                number, status='created', email=user.email, id=str(user.id))
+
+        for number, _ in batch:
+            yield results[number]
+
+
+USER_IMPORTER = UserImporter()
@@ -0,0 +1,170 @@
+import json
+import logging
+import threading
+import time
+
+from pymongo import monitoring
+
+
+_LOG = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class Timings(object):
+    """
+    Accumulates the number of calls and the total time spent in each timed
+    category (e.g. `db`, `hash`, `serialize`) during a single request.
+    """
+
+    __slots__ = ('_totals',)
+
+    def __init__(self):
+        self._totals = {}
+
+    def add(self, name, seconds):
+        count, total = self._totals.get(name, (0, 0.0))
+        self._totals[name] = (count + 1, total + seconds)
+
+    def count(self, name):
+        return self._totals.get(name, (0, 0.0))[0]
+
+    def total(self, name):
+        """
+        Returns the total time spent in a category in milliseconds.
+        """
+        return self._totals.get(name, (0, 0.0))[1] * 1000
+
+    def server_timing(self, total=None):
+        """
+        Formats the timings as a `Server-Timing` header value.
+        """
+        metrics = [
+            '{};dur={:.2f};desc="{} calls"'.format(
+                name, self.total(name), self.count(name))
+            for name in sorted(self._totals)]
+        if total is not None:
+            metrics.append('total;dur={:.2f}'.format(total))
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        result = {}
+        for name in sorted(self._totals):
+            result[name + '_count'] = self.count(name)
+            result[name + '_ms'] = round(self.total(name), 3)
+        return result
+
+
+def current():
+    """
+    Returns the :class:`Timings` of the request being handled by the current
+    thread, or `None` if instrumentation is disabled.
+    """
+    return getattr(_local, 'timings', None)
+
+
+class _Timer(object):
+
+    __slots__ = ('_timings', '_name', '_start')
+
+    def __init__(self, timings, name):
+        self._timings = timings
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._timings.add(self._name, time.perf_counter() - self._start)
+
+
+class _NullTimer(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(name):
+    """
+    Returns a context manager that adds the time spent inside it to the
+    current request's timings under `name`. Does nothing outside of an
+    instrumented request.
+    """
+    timings = current()
+    if timings is None:
+        return _NULL_TIMER
+    return _Timer(timings, name)
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """
+    A pymongo command listener that adds the duration of every database
+    command to the timings of the request that issued it.
+    """
+
+    def _record(self, event):
+        timings = current()
+        if timings is not None:
+            timings.add('db', event.duration_micros / 1e6)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+
+_LISTENER = None
+
+
+def register_listener():
+    """
+    Registers :class:`CommandTimingListener` with pymongo. Must be called
+    before the database connection is created.
+    """
+    global _LISTENER
+    if _LISTENER is None:
+        _LISTENER = CommandTimingListener()
+        monitoring.register(_LISTENER)
+    return _LISTENER
+
+
+def timing_tween_factory(handler, registry):
+    """
+    A tween that collects per-request timings, reports them in a
+    `Server-Timing` response header and logs them as a JSON line.
+    """
+
+    def timing_tween(request):
+        timings = _local.timings = Timings()
+        start = time.perf_counter()
+        try:
+            response = handler(request)
+        finally:
+            _local.timings = None
+        total = (time.perf_counter() - start) * 1000
+        response.headers['Server-Timing'] = timings.server_timing(total)
+        if _LOG.isEnabledFor(logging.INFO):
+            record = timings.as_dict()
+            record.update({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total, 3)
+            })
+            _LOG.info('timings %s', json.dumps(record, sort_keys=True))
+        return response
+
+    return timing_tween
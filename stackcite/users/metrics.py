@@ -0,0 +1,683 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from pymongo import monitoring
+
+
+_LOG = logging.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (
+    .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.,
+    math.inf)
+
+GAUGE_MODES = ('sum', 'max', 'min', 'pid')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in sorted(labels.items()):
+        value = str(value).replace('\\', r'\\').replace('"', r'\"')
+        value = value.replace('\n', r'\n')
+        pairs.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric(object):
+    """
+    The base class of all metrics. Values are kept per combination of label
+    values and are safe to update from any thread.
+    """
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._function = None
+        if registry is not None:
+            registry.register(self)
+
+    def set_function(self, function):
+        """
+        Reports the value returned by `function` whenever the metric is
+        collected (unlabelled metrics only).
+        """
+        if self.labelnames:
+            msg = 'Only unlabelled metrics can use a function'
+            raise ValueError(msg)
+        self._function = function
+
+    def _function_samples(self):
+        try:
+            return [(self.name, {}, self._function())]
+        except Exception:
+            _LOG.exception('Failed to collect metric {}'.format(self.name))
+            return []
+
+    def _key(self, labels):
+        if sorted(labels) != sorted(self.labelnames):
+            msg = 'Expected labels {} for {}'.format(
+                self.labelnames, self.name)
+            raise ValueError(msg)
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+    def samples(self):
+        """
+        Returns a list of `(sample_name, labels, value)` tuples.
+        """
+        raise NotImplementedError()
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    """
+    A monotonically increasing count. An unlabelled counter may be backed by
+    a function returning a cumulative count kept elsewhere (e.g. a cache's
+    hits).
+    """
+
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only be incremented')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._function is not None:
+            return self._function_samples()
+        with self._lock:
+            return [(self.name, self._labels(key), value)
+                    for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down. An unlabelled gauge may be backed by a
+    function that is called whenever the gauge is collected.
+
+    `multiprocess_mode` decides how values from several worker processes are
+    combined: summed, the maximum, the minimum or reported per process (with a
+    `pid` label).
+    """
+
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None,
+                 multiprocess_mode='sum'):
+        if multiprocess_mode not in GAUGE_MODES:
+            msg = 'Invalid multiprocess mode: {}'.format(multiprocess_mode)
+            raise ValueError(msg)
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._function is not None:
+            return self._function_samples()
+        with self._lock:
+            return [(self.name, self._labels(key), value)
+                    for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    """
+    Counts observations (e.g. request durations in seconds) in configurable
+    cumulative buckets.
+    """
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None,
+                 buckets=DEFAULT_BUCKETS):
+        buckets = tuple(sorted(buckets))
+        if buckets[-1] != math.inf:
+            buckets += (math.inf,)
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[idx] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    bucket = dict(labels, le=_format_value(bound))
+                    samples.append((self.name + '_bucket', bucket, cumulative))
+                samples.append((self.name + '_sum', labels, total))
+                samples.append((self.name + '_count', labels, cumulative))
+        return samples
+
+
+class Registry(object):
+    """
+    A collection of metrics that can be rendered in the Prometheus text
+    exposition format.
+
+    If a `multiprocess_dir` is configured, every process periodically writes
+    a snapshot of its metrics into that directory and :meth:`render` combines
+    the snapshots of all processes. The directory should be emptied before
+    the server starts.
+    """
+
+    def __init__(self, multiprocess_dir=None, snapshot_interval=5.0):
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+        self._last_snapshot = 0.0
+        self.configure(multiprocess_dir, snapshot_interval)
+
+    def configure(self, multiprocess_dir=None, snapshot_interval=5.0):
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+        self.multiprocess_dir = multiprocess_dir or None
+        self.snapshot_interval = float(snapshot_interval)
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                msg = 'Duplicate metric: {}'.format(metric.name)
+                raise ValueError(msg)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def collect(self):
+        """
+        Returns a list of `(metric, samples)` for this process.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [(metric, metric.samples()) for metric in metrics]
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+    # Multi-process support
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.multiprocess_dir, '{}.json'.format(pid))
+
+    def write_snapshot(self):
+        """
+        Writes this process' metrics to the multi-process directory.
+        """
+        if not self.multiprocess_dir:
+            return
+        snapshot = {
+            metric.name: [[name, labels, value]
+                          for name, labels, value in samples]
+            for metric, samples in self.collect()}
+        path = self._snapshot_path(os.getpid())
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, path)
+        self._last_snapshot = time.monotonic()
+
+    def maybe_write_snapshot(self):
+        """
+        Writes a snapshot if the last one is older than `snapshot_interval`.
+        """
+        if self.multiprocess_dir:
+            elapsed = time.monotonic() - self._last_snapshot
+            if elapsed >= self.snapshot_interval:
+                self.write_snapshot()
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _read_snapshots(self):
+        for filename in os.listdir(self.multiprocess_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                pid = int(filename[:-len('.json')])
+                with open(os.path.join(self.multiprocess_dir, filename)) as f:
+                    yield pid, json.load(f)
+            except (ValueError, OSError):
+                _LOG.warning('Skipping metrics snapshot {}'.format(filename))
+
+    def _collect_all(self):
+        self.write_snapshot()
+        merged = OrderedDict(
+            (name, OrderedDict()) for name in self._metrics)
+        for pid, snapshot in self._read_snapshots():
+            alive = self._is_alive(pid)
+            for metric_name, samples in snapshot.items():
+                metric = self._metrics.get(metric_name)
+                if metric is None:
+                    continue
+                is_gauge = metric.TYPE == Gauge.TYPE
+                if is_gauge and not alive:
+                    continue
+                mode = metric.multiprocess_mode if is_gauge else 'sum'
+                values = merged[metric_name]
+                for name, labels, value in samples:
+                    if mode == 'pid':
+                        labels = dict(labels, pid=str(pid))
+                    key = (name, tuple(sorted(labels.items())))
+                    if key not in values:
+                        values[key] = value
+                    elif mode == 'sum':
+                        values[key] += value
+                    elif mode == 'max':
+                        values[key] = max(values[key], value)
+                    elif mode == 'min':
+                        values[key] = min(values[key], value)
+        return [
+            (self._metrics[metric_name],
+             [(name, dict(labels), value)
+              for (name, labels), value in values.items()])
+            for metric_name, values in merged.items()]
+
+    def render(self):
+        """
+        Renders all metrics in the Prometheus text exposition format.
+        """
+        if self.multiprocess_dir:
+            families = self._collect_all()
+        else:
+            families = self.collect()
+        lines = []
+        for metric, samples in families:
+            lines.append('# HELP {} {}'.format(
+                metric.name, metric.documentation.replace('\n', ' ')))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.TYPE))
+            for name, labels, value in samples:
+                lines.append('{}{} {}'.format(
+                    name, _format_labels(labels), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = Counter(
+    'stackcite_users_requests_total',
+    'Requests handled, by view class, method and response status.',
+    ('view', 'method', 'status'), registry=REGISTRY)
+
+REQUEST_DURATION = Histogram(
+    'stackcite_users_request_duration_seconds',
+    'Request latency by view class.',
+    ('view',), registry=REGISTRY)
+
+AUTH_ATTEMPTS = Counter(
+    'stackcite_users_auth_attempts_total',
+    'Login attempts by result ("success" or "failure").',
+    ('result',), registry=REGISTRY)
+
+LOGIN_RATE_LIMITED = Counter(
+    'stackcite_users_login_rate_limited_total',
+    'Login attempts rejected before authentication, by the limit hit '
+    '("email" or "address").',
+    ('scope',), registry=REGISTRY)
+
+TOKEN_FILTER_REJECTIONS = Counter(
+    'stackcite_users_token_filter_rejections_total',
+    'Token keys ruled out by the token filter without a database lookup.',
+    registry=REGISTRY)
+
+TOKEN_FILTER_KEYS = Gauge(
+    'stackcite_users_token_filter_keys',
+    'Token keys added to the token filter since it was last rebuilt.',
+    registry=REGISTRY, multiprocess_mode='pid')
+
+TOKEN_CACHE_HITS = Counter(
+    'stackcite_users_token_cache_hits_total',
+    'Token cache hits.',
+    registry=REGISTRY)
+
+TOKEN_CACHE_MISSES = Counter(
+    'stackcite_users_token_cache_misses_total',
+    'Token cache misses.',
+    registry=REGISTRY)
+
+TOKEN_NEGATIVE_CACHE_HITS = Counter(
+    'stackcite_users_token_negative_cache_hits_total',
+    'Lookups of recently missing token keys answered without a query.',
+    registry=REGISTRY)
+
+TOKEN_LOOKUPS_SHARED = Counter(
+    'stackcite_users_token_lookups_shared_total',
+    'Token lookups that waited for a concurrent lookup of the same key.',
+    registry=REGISTRY)
+
+TOKEN_CACHE_HIT_RATIO = Gauge(
+    'stackcite_users_token_cache_hit_ratio',
+    'Fraction of token lookups served by the token cache.',
+    registry=REGISTRY, multiprocess_mode='pid')
+
+HASHING_QUEUE_DEPTH = Gauge(
+    'stackcite_users_hashing_queue_depth',
+    'Password hashes running or waiting for a hashing worker.',
+    registry=REGISTRY)
+
+HASHING_COST = Gauge(
+    'stackcite_users_hashing_cost',
+    'bcrypt cost factor used for new password hashes.',
+    registry=REGISTRY, multiprocess_mode='max')
+
+PASSWORD_HASH_COSTS = Gauge(
+    'stackcite_users_password_hashes',
+    'Stored password hashes by algorithm and parameters.',
+    ('algorithm', 'cost'), registry=REGISTRY, multiprocess_mode='max')
+
+PASSWORD_REHASHES = Counter(
+    'stackcite_users_password_rehashes_total',
+    'Passwords rehashed or migrated from the legacy format at login, by '
+    'result ("success", "migrated" or "conflict").',
+    ('result',), registry=REGISTRY)
+
+MONGO_COMMAND_DURATION = Histogram(
+    'stackcite_users_mongo_command_duration_seconds',
+    'MongoDB command latency by command name.',
+    ('command', 'outcome'), registry=REGISTRY)
+
+MONGO_POOL_CONNECTIONS = Gauge(
+    'stackcite_users_mongo_pool_connections',
+    'Open MongoDB connections by server.',
+    ('address',), registry=REGISTRY)
+
+MONGO_POOL_CHECKED_OUT = Gauge(
+    'stackcite_users_mongo_pool_checked_out',
+    'MongoDB connections in use by server.',
+    ('address',), registry=REGISTRY)
+
+MONGO_POOL_MAX_SIZE = Gauge(
+    'stackcite_users_mongo_pool_max_size',
+    'Maximum MongoDB connections per server.',
+    ('address',), registry=REGISTRY)
+
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    'stackcite_users_mongo_pool_checkout_failures_total',
+    'Failed MongoDB connection checkouts by reason (e.g. "timeout").',
+    ('reason',), registry=REGISTRY)
+
+REPLICA_READ_FALLBACKS = Counter(
+    'stackcite_users_replica_read_fallbacks_total',
+    'Reads repeated on the primary after missing on a secondary, by '
+    'operation.',
+    ('operation',), registry=REGISTRY)
+
+OUTBOX_DELIVERED = Counter(
+    'stackcite_users_outbox_delivered_total',
+    'Outbox messages delivered, by kind.',
+    ('kind',), registry=REGISTRY)
+
+OUTBOX_FAILURES = Counter(
+    'stackcite_users_outbox_failures_total',
+    'Failed outbox deliveries by kind and result ("retry" or "failed").',
+    ('kind', 'result'), registry=REGISTRY)
+
+OUTBOX_DELIVERY_LAG = Histogram(
+    'stackcite_users_outbox_delivery_lag_seconds',
+    'Time from writing an outbox message to delivering it, by kind.',
+    ('kind',), registry=REGISTRY,
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900))
+
+OUTBOX_PENDING = Gauge(
+    'stackcite_users_outbox_pending',
+    'Outbox messages waiting to be delivered.',
+    registry=REGISTRY, multiprocess_mode='max')
+
+OUTBOX_OLDEST_PENDING = Gauge(
+    'stackcite_users_outbox_oldest_pending_seconds',
+    'Age of the oldest outbox message waiting to be delivered.',
+    registry=REGISTRY, multiprocess_mode='max')
+
+IDENTITY_MAP_HITS = Counter(
+    'stackcite_users_identity_map_hits_total',
+    'Repeated document lookups served by the request identity map (queries '
+    'saved).',
+    registry=REGISTRY)
+
+
+class HashCostsReporter(object):
+    """
+    Refreshes :data:`PASSWORD_HASH_COSTS` every `interval` seconds from a
+    background thread, so that counting password hashes (an aggregation
+    over the users collection) never runs inside a request.
+
+    The thread is started by :meth:`ensure_started` in each process that
+    serves metrics (and again after a fork). An `interval` of `0` disables
+    it.
+    """
+
+    def __init__(self, interval=0):
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.configure(interval)
+
+    def configure(self, interval):
+        interval = float(interval)
+        if interval < 0:
+            raise ValueError('Hash costs interval must not be negative')
+        self.interval = interval
+
+    def refresh(self):
+        from stackcite.users import models
+        try:
+            costs = models.User.hash_costs()
+        except Exception:
+            _LOG.exception('Failed to count password hashes by cost')
+            return
+        PASSWORD_HASH_COSTS.clear()
+        for (algorithm, cost), count in costs.items():
+            PASSWORD_HASH_COSTS.set(count, algorithm=algorithm, cost=cost)
+
+    def ensure_started(self):
+        if not self.interval:
+            return
+        pid = os.getpid()
+        if self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != pid or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name='hash-costs', daemon=True)
+                self._thread.start()
+                self._pid = pid
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.refresh()
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+
+HASH_COSTS = HashCostsReporter()
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    A pymongo command listener that records the latency of every database
+    command in :data:`MONGO_COMMAND_DURATION`.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1e6,
+            command=event.command_name, outcome='success')
+
+    def failed(self, event):
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1e6,
+            command=event.command_name, outcome='failure')
+
+
+def _address(event):
+    return '{}:{}'.format(*event.address)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    A pymongo connection pool listener that tracks open and checked out
+    connections per server.
+    """
+
+    def pool_created(self, event):
+        max_size = event.options.get('maxPoolSize', 100)
+        MONGO_POOL_MAX_SIZE.set(max_size, address=_address(event))
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        address = _address(event)
+        MONGO_POOL_CONNECTIONS.set(0, address=address)
+        MONGO_POOL_CHECKED_OUT.set(0, address=address)
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.inc(address=_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.dec(address=_address(event))
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.inc(reason=str(event.reason).lower())
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKED_OUT.inc(address=_address(event))
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.dec(address=_address(event))
+
+
+def _reset_pool_metrics():
+    # A forked process starts without any of its parent's connections
+    for gauge in (MONGO_POOL_CONNECTIONS, MONGO_POOL_CHECKED_OUT):
+        gauge.clear()
+
+
+_LISTENER = None
+
+
+def register_listener():
+    """
+    Registers :class:`CommandMetricsListener` and :class:`PoolMetricsListener`
+    with pymongo. Must be called before the database connection is created.
+    """
+    global _LISTENER
+    if _LISTENER is None:
+        _LISTENER = CommandMetricsListener()
+        monitoring.register(_LISTENER)
+        monitoring.register(PoolMetricsListener())
+        os.register_at_fork(after_in_child=_reset_pool_metrics)
+    return _LISTENER
+
+
+def metrics_tween_factory(handler, registry):
+    """
+    A tween that counts requests and records their latency per view class.
+    """
+    from stackcite.users.views import VIEW_LABELS
+
+    def metrics_tween(request):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = handler(request)
+            status = response.status_code
+            return response
+        finally:
+            context = getattr(request, 'context', None)
+            view = VIEW_LABELS.get(type(context), 'other')
+            REQUEST_DURATION.observe(time.perf_counter() - start, view=view)
+            REQUESTS.inc(view=view, method=request.method, status=status)
+            REGISTRY.maybe_write_snapshot()
+
+    return metrics_tween
@@ -1,2 +1,4 @@
-from .users import User
-from .tokens import AuthToken, ConfirmToken
+from .users import User, Credentials
+from .tokens import AuthToken, ConfirmToken, TokenRevocation
+from .touches import TOUCH_COALESCER
+from .outbox import OutboxMessage
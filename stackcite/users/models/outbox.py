@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+import mongoengine
+
+
+MESSAGE_KINDS = ('confirmation',)
+
+MESSAGE_STATES = ('pending', 'sent', 'failed')
+
+
+class OutboxMessage(mongoengine.Document):
+    """
+    A message waiting to be delivered by the outbox dispatcher. Messages are
+    written while handling a request and delivered later, so a slow or
+    unavailable mail server never holds up a request.
+
+    A message is not delivered after it `expires` (e.g. once the confirmation
+    token it carries has expired), and is deleted a day later.
+    """
+
+    _kind = mongoengine.StringField(
+        db_field='kind', required=True, choices=MESSAGE_KINDS)
+    _recipient = mongoengine.EmailField(db_field='recipient', required=True)
+    _payload = mongoengine.DictField(db_field='payload')
+    _state = mongoengine.StringField(
+        db_field='state', required=True, choices=MESSAGE_STATES,
+        default='pending')
+    _created = mongoengine.DateTimeField(db_field='created', required=True)
+    _available = mongoengine.DateTimeField(db_field='available', required=True)
+    _expires = mongoengine.DateTimeField(db_field='expires', required=True)
+    _attempts = mongoengine.IntField(db_field='attempts', default=0)
+    _claim = mongoengine.StringField(db_field='claim')
+    _sent = mongoengine.DateTimeField(db_field='sent')
+    _error = mongoengine.StringField(db_field='error')
+
+    @classmethod
+    def new(cls, kind, recipient, payload, ttl, save=False):
+        now = datetime.utcnow()
+        message = cls(
+            _kind=kind, _recipient=recipient, _payload=payload,
+            _created=now, _available=now,
+            _expires=now + timedelta(seconds=ttl))
+        if save:
+            message.save(force_insert=True)
+        return message
+
+    @property
+    def kind(self):
+        return self._kind
+
+    @property
+    def recipient(self):
+        return self._recipient
+
+    @property
+    def payload(self):
+        return self._payload
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def created(self):
+        return self._created
+
+    @property
+    def attempts(self):
+        return self._attempts
+
+    @property
+    def sent(self):
+        return self._sent
+
+    @property
+    def error(self):
+        return self._error
+
+    meta = {
+        'indexes': [
+            # Dispatcher claims (pending messages in order of availability)
+            {
+                'fields': ['_state', '_available']
+            },
+            {
+                'fields': ['_claim']
+            },
+            {
+                'fields': ['_expires'],
+                'expireAfterSeconds': 24*60*60  # 1 day
+            }
+        ]
+    }
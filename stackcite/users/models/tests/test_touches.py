@@ -0,0 +1,84 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class TouchCoalescerUnitTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_configure_rejects_interval_longer_than_max(self):
+        """TouchCoalescer.configure() raises exception for an interval above MAX_INTERVAL
+        """
+        from .. import touches
+        with self.assertRaises(ValueError):
+            touches.TouchCoalescer(interval=touches.MAX_INTERVAL + 1)
+
+    def test_configure_rejects_empty_batch(self):
+        """TouchCoalescer.configure() raises exception for a batch size below 1
+        """
+        from .. import touches
+        with self.assertRaises(ValueError):
+            touches.TouchCoalescer(interval=1, max_batch=0)
+
+
+class TouchCoalescerIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import models
+        from .. import touches
+        models.User.drop_collection()
+        models.AuthToken.drop_collection()
+        self.user = testing.utils.create_user(
+            'test@email.com', 'T3stPa$$word', save=True)
+        self.token = testing.utils.create_auth_token(self.user, save=True)
+        self.coalescer = touches.TouchCoalescer(interval=60, max_batch=10)
+
+    def tearDown(self):
+        self.coalescer.stop()
+
+    def test_touch_buffers_timestamp(self):
+        """TouchCoalescer.touch() buffers the new timestamp without saving
+        """
+        from stackcite.users import models
+        expected = models.AuthToken.objects.get(_key=self.token.key).touched
+        self.coalescer.touch(self.token)
+        result = models.AuthToken.objects.get(_key=self.token.key).touched
+        self.assertEqual(expected, result)
+        self.assertEqual(1, self.coalescer.pending)
+
+    def test_flush_writes_buffered_timestamp(self):
+        """TouchCoalescer.flush() writes buffered timestamps to the database
+        """
+        from stackcite.users import models
+        before = models.AuthToken.objects.get(_key=self.token.key).touched
+        self.coalescer.touch(self.token)
+        self.coalescer.flush()
+        result = models.AuthToken.objects.get(_key=self.token.key).touched
+        self.assertGreater(result, before)
+
+    def test_flush_never_moves_timestamp_backwards(self):
+        """TouchCoalescer.flush() does not overwrite a more recent timestamp
+        """
+        from datetime import timedelta
+        from stackcite.users import models
+        self.coalescer.touch(self.token)
+        self.token._touched += timedelta(minutes=5)
+        self.token.save(clean=False)
+        expected = models.AuthToken.objects.get(_key=self.token.key).touched
+        self.coalescer.flush()
+        result = models.AuthToken.objects.get(_key=self.token.key).touched
+        self.assertEqual(expected, result)
+
+    def test_disabled_coalescer_saves_immediately(self):
+        """TouchCoalescer.touch() saves the token immediately when disabled
+        """
+        from stackcite.users import models
+        self.coalescer.configure(0, 10)
+        before = models.AuthToken.objects.get(_key=self.token.key).touched
+        self.coalescer.touch(self.token)
+        result = models.AuthToken.objects.get(_key=self.token.key).touched
+        self.assertGreater(result, before)
+        self.assertEqual(0, self.coalescer.pending)
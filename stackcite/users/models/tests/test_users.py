@@ -45,8 +45,7 @@ class UserUnitTests(UserBaseTests):
         except mongoengine.ValidationError as err:
             err_dict = err.to_dict()
             invalid_fields = err_dict.keys()
-            self.assertIn('_salt', invalid_fields)
-            self.assertIn('_hash', invalid_fields)
+            self.assertIn('_password', invalid_fields)
 
     def test_group_default_is_empty_list(self):
         """User.groups defaults to an empty list
@@ -346,3 +345,226 @@ class UserIntegrationTests(UserBaseTests):
         from stackcite.users.exceptions import AuthenticationError
         with self.assertRaises(AuthenticationError):
             users.User.authenticate(self.user.email, 'Wr0ngPa$$word')
+
+    def test_record_login_sets_last_login(self):
+        """User.record_login() saves 'last_login' to the database
+        """
+        from .. import users
+        user = users.User.new('test@email.com', 'T3stPa$$word', save=True)
+        user.record_login()
+        result = users.User.objects.get(id=user.id).last_login
+        self.assertIsNotNone(result)
+
+    def test_record_login_moves_last_login_to_previous_login(self):
+        """User.record_login() saves the original 'last_login' as 'previous_login'
+        """
+        from .. import users
+        user = users.User.new('test@email.com', 'T3stPa$$word', save=True)
+        first_login = user.record_login()
+        user.record_login()
+        result = users.User.objects.get(id=user.id).previous_login
+        self.assertEqual(first_login, result)
+
+    def test_record_login_updates_document(self):
+        """User.record_login() mirrors the saved timestamps on the document
+        """
+        from .. import users
+        user = users.User.new('test@email.com', 'T3stPa$$word', save=True)
+        user.record_login()
+        expected = users.User.objects.get(id=user.id).last_login
+        self.assertEqual(expected, user.last_login)
+
+    def test_record_login_raises_exception_for_unsaved_user(self):
+        """User.record_login() raises exception if the user does not exist
+        """
+        import mongoengine
+        from .. import users
+        user = users.User.new('test@email.com', 'T3stPa$$word')
+        with self.assertRaises(mongoengine.DoesNotExist):
+            user.record_login()
+
+    def test_credentials_returns_password_fields(self):
+        """User.credentials() returns the fields needed to authenticate
+        """
+        from .. import users
+        user = users.User.new('test@email.com', 'T3stPa$$word', save=True)
+        result = users.User.credentials('test@email.com')
+        self.assertEqual(user.id, result.id)
+        self.assertEqual(user._password, result.password)
+        self.assertIsNone(result.hash)
+
+    def test_credentials_raises_exception_for_unknown_email(self):
+        """User.credentials() raises exception for an unknown email
+        """
+        import mongoengine
+        from .. import users
+        with self.assertRaises(mongoengine.DoesNotExist):
+            users.User.credentials('test@email.com')
+
+    def test_credentials_check_password_matches_correct_password(self):
+        """Credentials.check_password() returns True for the correct password
+        """
+        from .. import users
+        users.User.new('test@email.com', 'T3stPa$$word', save=True)
+        credentials = users.User.credentials('test@email.com')
+        result = credentials.check_password('T3stPa$$word')
+        self.assertTrue(result)
+
+    def test_credentials_to_user_carries_groups(self):
+        """Credentials.to_user() builds a user with the stored groups
+        """
+        from stackcite.users import auth
+        from .. import users
+        user = users.User.new('test@email.com', 'T3stPa$$word')
+        user.add_group(auth.STAFF)
+        user.save()
+        result = users.User.credentials('test@email.com').to_user()
+        self.assertEqual([auth.STAFF], result.groups)
+
+    def test_credentials_materialize_returns_full_user(self):
+        """Credentials.materialize() fetches the full user
+        """
+        from .. import users
+        users.User.new('test@email.com', 'T3stPa$$word', save=True)
+        credentials = users.User.credentials('test@email.com')
+        result = credentials.materialize()
+        self.assertIsNotNone(result.joined)
+
+
+class UserRehashTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import hashing
+        from .. import users
+        users.User.drop_collection()
+        hashing.set_rounds(4)
+        self.user = users.User.new('test@email.com', 'T3stPa$$word', save=True)
+        hashing.set_rounds(5)
+
+    def tearDown(self):
+        from stackcite.users import hashing
+        hashing.set_rounds(12)
+
+    def _stored_cost(self):
+        from stackcite.users import hashing
+        from .. import users
+        return hashing.cost(users.User.objects.get(id=self.user.id)._password)
+
+    def test_authenticate_rehashes_at_current_cost(self):
+        """User.authenticate() rehashes a password stored at a lower cost
+        """
+        from .. import users
+        users.User.authenticate('test@email.com', 'T3stPa$$word')
+        self.assertEqual(5, self._stored_cost())
+
+    def test_check_password_rehashes_at_current_cost(self):
+        """User.check_password() rehashes a password stored at a lower cost
+        """
+        self.user.check_password('T3stPa$$word')
+        self.assertEqual(5, self._stored_cost())
+
+    def test_rehashed_password_still_checks(self):
+        """User.authenticate() accepts a password after rehashing it
+        """
+        from .. import users
+        users.User.authenticate('test@email.com', 'T3stPa$$word')
+        user = users.User.authenticate('test@email.com', 'T3stPa$$word')
+        self.assertEqual('test@email.com', user.email)
+
+    def test_wrong_password_is_not_rehashed(self):
+        """User.check_password() does not rehash for a wrong password
+        """
+        self.user.check_password('Wr0ngPa$$word')
+        self.assertEqual(4, self._stored_cost())
+
+    def test_rehash_skips_changed_password(self):
+        """_rehash() does not overwrite a password changed concurrently
+        """
+        from .. import users
+        encoded = self.user._password
+        self.user.set_password('N3wPa$$word')
+        self.user.save()
+        result = users._rehash(self.user.id, 'T3stPa$$word', encoded)
+        self.assertIsNone(result)
+
+    def test_hash_costs_counts_users_by_cost(self):
+        """User.hash_costs() counts stored hashes by algorithm and cost
+        """
+        from .. import users
+        users.User.new('other@email.com', 'T3stPa$$word', save=True)
+        expected = {('bcrypt', '04'): 1, ('bcrypt', '05'): 1}
+        self.assertEqual(expected, users.User.hash_costs())
+
+
+class UserHasherTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import hashers, hashing
+        from .. import users
+        users.User.drop_collection()
+        hashing.set_rounds(4)
+        hashers.HASHERS.get('scrypt').configure(n=2 ** 4)
+        self.user = users.User.new('test@email.com', 'T3stPa$$word', save=True)
+
+    def tearDown(self):
+        from stackcite.users import hashers, hashing
+        hashing.set_rounds(12)
+        hashers.HASHERS.get('scrypt').configure()
+        hashers.HASHERS.configure('bcrypt')
+
+    def _stored(self):
+        from .. import users
+        return users.User._get_collection().find_one({'_id': self.user.id})
+
+    def _make_legacy(self):
+        from .. import users
+        encoded = self.user._password
+        users.User._get_collection().update_one(
+            {'_id': self.user.id},
+            {'$set': {'_salt': encoded[:29], '_hash': encoded},
+             '$unset': {'password': ''}})
+        return encoded
+
+    def test_authenticate_switches_algorithm(self):
+        """User.authenticate() rehashes a password made by another algorithm
+        """
+        from stackcite.users import hashers
+        from .. import users
+        hashers.HASHERS.configure('scrypt')
+        users.User.authenticate('test@email.com', 'T3stPa$$word')
+        self.assertTrue(self._stored()['password'].startswith('$scrypt$'))
+        user = users.User.authenticate('test@email.com', 'T3stPa$$word')
+        self.assertEqual('test@email.com', user.email)
+
+    def test_authenticate_migrates_legacy_hash(self):
+        """User.authenticate() moves a legacy hash to the password field
+        """
+        from .. import users
+        encoded = self._make_legacy()
+        users.User.authenticate('test@email.com', 'T3stPa$$word')
+        stored = self._stored()
+        self.assertEqual(encoded, stored['password'])
+        self.assertNotIn('_salt', stored)
+        self.assertNotIn('_hash', stored)
+
+    def test_legacy_hash_is_migrated_on_save(self):
+        """User.save() moves a legacy hash to the password field
+        """
+        from .. import users
+        encoded = self._make_legacy()
+        user = users.User.objects.get(id=self.user.id)
+        user.save()
+        self.assertEqual(encoded, self._stored()['password'])
+        self.assertTrue(user.check_password('T3stPa$$word'))
+
+    def test_migrate_passwords_moves_legacy_hashes(self):
+        """User.migrate_passwords() moves every legacy hash
+        """
+        from .. import users
+        encoded = self._make_legacy()
+        self.assertEqual(1, users.User.migrate_passwords())
+        self.assertEqual(encoded, self._stored()['password'])
@@ -2,6 +2,7 @@ from datetime import datetime
 import mongoengine
 
 from stackcite.api import auth, models
+from stackcite.users import identity
 
 from . import users
 
@@ -27,6 +28,9 @@ class AuthToken(mongoengine.Document):
     invalidated if it has not been "touched" in more than 1 hour.
     """
 
+    # Write concern used when issuing new tokens (see `new()`)
+    WRITE_CONCERN = {}
+
     _key = TokenKeyField(
         primary_key=True, db_field='key', max_length=56)
     _user = mongoengine.CachedReferenceField(
@@ -38,7 +42,7 @@ class AuthToken(mongoengine.Document):
     def new(cls, user, save=False):
         token = cls(_user=user)
         if save:
-            token.save()
+            token.save(force_insert=True, write_concern=cls.WRITE_CONCERN)
         return token
 
     @property
@@ -72,6 +76,10 @@ class AuthToken(mongoengine.Document):
             {
                 'fields': ['_touched'],
                 'expireAfterSeconds': 60*60  # 1 Hour
+            },
+            # Token filter syncs (tokens issued since the last sync)
+            {
+                'fields': ['_issued']
             }
         ]
     }
@@ -83,6 +91,9 @@ class ConfirmToken(mongoengine.Document):
     created. Token will survive for a limited amount of time.
     """
 
+    # Seconds until an unused token expires
+    TTL = 15*60  # 15 minutes
+
     _key = TokenKeyField(
         primary_key=True, db_field='key', max_length=56)
     _user = mongoengine.CachedReferenceField(
@@ -109,9 +120,10 @@ class ConfirmToken(mongoengine.Document):
         return self._issued
 
     def confirm_user(self):
+        # Within a request both writes wait for the end of the request
         self.user.confirm()
-        self.user.save()
-        self.delete()
+        identity.save(self.user)
+        identity.delete(self)
         return self.user
 
     def clean(self):
@@ -123,7 +135,41 @@ class ConfirmToken(mongoengine.Document):
         'indexes': [
             {
                 'fields': ['_issued'],
-                'expireAfterSeconds': 15*60  # 15 minutes
+                'expireAfterSeconds': TTL
+            }
+        ]
+    }
+
+
+class TokenRevocation(mongoengine.Document):
+    """
+    A revoked signed token (keyed by `token:<nonce>`) or the time up to which
+    every signed token issued to a user is revoked (keyed by
+    `user:<userId>`). Revocations are deleted once the tokens they cover
+    have expired.
+    """
+
+    _key = mongoengine.StringField(primary_key=True, db_field='key')
+    _revoked = mongoengine.FloatField(db_field='revoked', required=True)
+    _expires = mongoengine.DateTimeField(db_field='expires', required=True)
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def revoked(self):
+        return self._revoked
+
+    @property
+    def expires(self):
+        return self._expires
+
+    meta = {
+        'indexes': [
+            {
+                'fields': ['_expires'],
+                'expireAfterSeconds': 0
             }
         ]
     }
@@ -0,0 +1,133 @@
+import atexit
+import logging
+import threading
+
+from pymongo import UpdateOne
+
+from .tokens import AuthToken
+
+
+_LOG = logging.getLogger(__name__)
+
+
+# Buffered touches must reach the database long before the `_touched` TTL
+# index (1 hour) could expire an active token
+MAX_INTERVAL = 5 * 60
+
+
+class TouchCoalescer(object):
+    """
+    Buffers :class:`~AuthToken` "touch" timestamps in memory and writes them
+    to the database as a single unordered `bulk_write` of `$max` updates every
+    `interval` seconds, or sooner once `max_batch` tokens are waiting.
+
+    An `interval` of `0` disables buffering and saves each token immediately.
+    """
+
+    def __init__(self, interval=0, max_batch=500):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._buffer = {}
+        self._thread = None
+        self.configure(interval, max_batch)
+
+    def configure(self, interval, max_batch):
+        interval, max_batch = float(interval), int(max_batch)
+        if not 0 <= interval <= MAX_INTERVAL:
+            msg = 'Touch interval must be between 0 and {} seconds'.format(
+                MAX_INTERVAL)
+            raise ValueError(msg)
+        if max_batch < 1:
+            raise ValueError('Touch batch size must be at least 1')
+        self.flush()
+        self.interval = interval
+        self.max_batch = max_batch
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def touch(self, token):
+        """
+        Touches a token and schedules the new timestamp to be written.
+        """
+        touched = token.touch()
+        if not self.enabled:
+            token.save()
+            return touched
+        with self._lock:
+            previous = self._buffer.get(token.key)
+            if previous is None or previous < touched:
+                self._buffer[token.key] = touched
+            full = len(self._buffer) >= self.max_batch
+        self._ensure_started()
+        if full:
+            self._wake.set()
+        return touched
+
+    def flush(self):
+        """
+        Writes all buffered timestamps to the database. Returns the number of
+        tokens written.
+        """
+        with self._lock:
+            buffer, self._buffer = self._buffer, {}
+        if not buffer:
+            return 0
+        field = AuthToken._fields['_touched'].db_field
+        requests = [
+            UpdateOne({'_id': key}, {'$max': {field: touched}})
+            for key, touched in buffer.items()]
+        try:
+            AuthToken._get_collection().bulk_write(requests, ordered=False)
+        except Exception:
+            _LOG.exception('Failed to flush {} token touches'.format(
+                len(requests)))
+            self._requeue(buffer)
+            return 0
+        return len(requests)
+
+    def _requeue(self, buffer):
+        with self._lock:
+            for key, touched in buffer.items():
+                previous = self._buffer.get(key)
+                if previous is None or previous < touched:
+                    self._buffer[key] = touched
+
+    def _ensure_started(self):
+        # Started lazily (and restarted after a fork) so that every process
+        # runs its own flusher
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name='touch-coalescer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval or None)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self):
+        """
+        Stops the background flusher and writes any buffered timestamps.
+        """
+        self._stopped.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.interval + 1)
+        self.flush()
+
+
+TOUCH_COALESCER = TouchCoalescer()
+atexit.register(TOUCH_COALESCER.stop)
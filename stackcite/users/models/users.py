@@ -1,12 +1,13 @@
-import bcrypt
 import mongoengine
 
+from collections import namedtuple
 from datetime import datetime
+from pymongo import ReturnDocument
 
 from stackcite.api import auth
 from stackcite.api import models
 from stackcite.api.models import validators
-from stackcite.users import exceptions
+from stackcite.users import exceptions, hashers, metrics
 
 
 class User(models.IDocument):
@@ -24,8 +25,11 @@ class User(models.IDocument):
     _confirmed = mongoengine.DateTimeField(db_field='confirmed')
     _last_login = mongoengine.DateTimeField(db_field='last_login')
     _prev_login = mongoengine.DateTimeField(db_field='prev_login')
-    _salt = mongoengine.StringField(required=True)
-    _hash = mongoengine.StringField(required=True)
+    _password = mongoengine.StringField(db_field='password', required=True)
+
+    # Legacy bcrypt salt and hash, moved to `_password` when next saved
+    _salt = mongoengine.StringField()
+    _hash = mongoengine.StringField()
 
     _validate_group = validators.GroupValidator()
     _validate_password = validators.PasswordValidator()
@@ -69,22 +73,48 @@ class User(models.IDocument):
         self._last_login = datetime.utcnow()
         return self.last_login
 
+    def record_login(self):
+        """
+        Performs :meth:`touch_login` directly in the database with a single
+        atomic update (instead of a full :meth:`save`) and mirrors the result
+        on this document.
+        """
+        last_login = self._fields['_last_login'].db_field
+        prev_login = self._fields['_prev_login'].db_field
+        now = datetime.utcnow()
+        result = self._get_collection().find_one_and_update(
+            {'_id': self.id},
+            [{'$set': {prev_login: '$' + last_login, last_login: now}}],
+            projection={prev_login: True, last_login: True},
+            return_document=ReturnDocument.AFTER)
+        if result is None:
+            raise self.DoesNotExist()
+        self._data['_prev_login'] = result.get(prev_login)
+        self._data['_last_login'] = result.get(last_login)
+        return self.last_login
+
     def set_password(self, new_password):
         self._validate_password(new_password)
-        self._salt = self._new_salt()
-        self._hash = self._encrypt(new_password)
+        self._password = hashers.HASHERS.hash(new_password)
+        self._salt = self._hash = None
 
     def check_password(self, password):
-        if self._salt and self._hash:
-            self._validate_password(password)
-            check = self._encrypt(password)
-            return self._hash == check
-        else:
+        """
+        Checks a password, rehashing it with the current algorithm and
+        parameters if needed (see
+        :meth:`~stackcite.users.hashers.HasherRegistry.needs_rehash`).
+        """
+        if not _check_password(password, self._password or self._hash):
             return False
+        rehashed = _rehash(self.id, password, self._password, self._hash)
+        if rehashed:
+            self._data['_password'] = rehashed
+            self._data['_salt'] = self._data['_hash'] = None
+        return True
 
     @property
     def password(self):
-        return bool(self._hash and self._salt)
+        return bool(self._password or self._hash)
 
     @password.setter
     def password(self, value):
@@ -98,23 +128,182 @@ class User(models.IDocument):
             user.save(cascade=True)
         return user
 
+    @staticmethod
+    def credentials(email):
+        """
+        Fetches only the fields needed to authenticate a user as a lightweight
+        :class:`Credentials` record, without building a :class:`User`.
+        """
+        fields = Credentials.db_fields()
+        son = User._get_collection().find_one(
+            {User._fields['email'].db_field: email},
+            projection=dict.fromkeys(fields, True))
+        if son is None:
+            raise User.DoesNotExist()
+        return Credentials(*(son.get(field) for field in fields))
+
     @staticmethod
     def authenticate(email, password):
-        user = User.objects.get(email=email)
-        if user.check_password(password):
-            return user
+        """
+        Returns a partially loaded user (`id`, `email` and groups) if the
+        password is correct. Use `User.objects.get(id=user.id)` if the full
+        document is needed.
+        """
+        credentials = User.credentials(email)
+        if credentials.check_password(password):
+            return credentials.to_user()
         else:
             raise exceptions.AuthenticationError()
 
     @staticmethod
-    def _new_salt():
-        return bcrypt.gensalt().decode('utf-8')
+    def hash_costs():
+        """
+        Returns the number of stored password hashes for each
+        `(algorithm, parameters)` pair, e.g. `('bcrypt', '12')` or
+        `('scrypt', 'ln=14,r=8,p=1')`.
+        """
+        password = User._fields['_password'].db_field
+        legacy = User._fields['_hash'].db_field
+        # Keep the `$<scheme>$<parameters>` head of each hash. bcrypt hashes
+        # have one field after it (salt and digest), the others have two.
+        parts = {'$split': [
+            {'$ifNull': ['$' + password, '$' + legacy]}, '$']}
+        scheme = {'$arrayElemAt': [parts, 1]}
+        head = {'$cond': [
+            {'$eq': [{'$substrCP': [scheme, 0, 1]}, '2']},
+            {'$subtract': [{'$size': parts}, 1]},
+            {'$subtract': [{'$size': parts}, 2]}]}
+        pipeline = [
+            {'$match': {'$or': [
+                {password: {'$type': 'string'}},
+                {legacy: {'$type': 'string'}}]}},
+            {'$group': {
+                '_id': {'$slice': [parts, head]},
+                'count': {'$sum': 1}}}
+        ]
+        result = {}
+        for row in User._get_collection().aggregate(pipeline):
+            head = row['_id'] or []
+            hasher = hashers.HASHERS.identify('$'.join(head + ['']))
+            if hasher is None or len(head) < 3:
+                continue
+            key = (hasher.name, '$'.join(head[2:]))
+            result[key] = result.get(key, 0) + row['count']
+        return result
 
-    def _encrypt(self, password):
-        salt = self._salt.encode('utf-8')
-        password = password.encode('utf-8')
-        return bcrypt.hashpw(password, salt).decode('utf-8')
+    @staticmethod
+    def migrate_passwords():
+        """
+        Moves every legacy bcrypt hash to the `password` field in a single
+        update (a bcrypt hash already includes its salt). Returns the number
+        of migrated users.
+        """
+        password = User._fields['_password'].db_field
+        salt = User._fields['_salt'].db_field
+        legacy = User._fields['_hash'].db_field
+        result = User._get_collection().update_many(
+            {password: {'$exists': False}, legacy: {'$type': 'string'}},
+            [{'$set': {password: '$' + legacy}}, {'$unset': [salt, legacy]}])
+        return result.modified_count
 
     def clean(self):
+        if not self._password and self._hash:
+            # A legacy bcrypt hash already includes its salt
+            self._password = self._hash
+            self._salt = self._hash = None
         if not self._joined:
             self._joined = datetime.utcnow()
+
+    meta = {
+        'indexes': [
+            # Cursor paging by join date
+            {
+                'fields': ['_joined', 'id']
+            }
+        ]
+    }
+
+
+class Credentials(namedtuple(
+        'Credentials', ('id', 'email', 'groups', 'password', 'hash'))):
+    """
+    The subset of a :class:`User` needed to authenticate them.
+    """
+
+    __slots__ = ()
+
+    # Maps each credential to the underlying :class:`User` field
+    _USER_FIELDS = ('id', 'email', '_groups', '_password', '_hash')
+
+    @classmethod
+    def db_fields(cls):
+        return [User._fields[name].db_field for name in cls._USER_FIELDS]
+
+    def check_password(self, password):
+        """
+        Checks a password, rehashing it if needed.
+        """
+        if not _check_password(password, self.password or self.hash):
+            return False
+        _rehash(self.id, password, self.password, self.hash)
+        return True
+
+    def to_user(self):
+        """
+        Builds a partially loaded :class:`User` from these credentials.
+        """
+        son = dict(zip(self.db_fields(), self))
+        son[User._fields['_groups'].db_field] = self.groups or []
+        return User._from_son(son)
+
+    def materialize(self):
+        """
+        Fetches the full :class:`User` these credentials belong to.
+        """
+        return User.objects.get(id=self.id)
+
+
+def _check_password(password, encoded):
+    if encoded:
+        User._validate_password(password)
+        return hashers.HASHERS.verify(password, encoded)
+    else:
+        return False
+
+
+def _rehash(user_id, password, encoded, legacy_hash=None):
+    """
+    Stores a verified password in the current format: a legacy `hash` is
+    moved to `password`, and a hash that
+    :meth:`~stackcite.users.hashers.HasherRegistry.needs_rehash` is replaced
+    by a new one. The update only applies if the stored hash is unchanged,
+    so a concurrent password change is never overwritten. Returns the new
+    encoded hash or `None`.
+    """
+    if user_id is None:
+        return None
+    rehash = hashers.HASHERS.needs_rehash(encoded or legacy_hash)
+    if encoded and not rehash:
+        return None
+    new_encoded = hashers.HASHERS.hash(password) if rehash else legacy_hash
+    password_field = User._fields['_password'].db_field
+    salt_field = User._fields['_salt'].db_field
+    hash_field = User._fields['_hash'].db_field
+    if encoded:
+        query = {'_id': user_id, password_field: encoded}
+        update = {'$set': {password_field: new_encoded}}
+    else:
+        query = {
+            '_id': user_id,
+            password_field: {'$exists': False},
+            hash_field: legacy_hash}
+        update = {
+            '$set': {password_field: new_encoded},
+            '$unset': {salt_field: '', hash_field: ''}}
+    result = User._get_collection().update_one(query, update)
+    if not result.modified_count:
+        metrics.PASSWORD_REHASHES.inc(result='conflict')
+        return None
+    metrics.PASSWORD_REHASHES.inc(
+        result='success' if rehash else 'migrated')
+    return new_encoded
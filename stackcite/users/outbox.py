@@ -0,0 +1,423 @@
+import atexit
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+import uuid
+
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from pyramid.settings import asbool
+
+from stackcite.users import db, metrics, models
+
+
+_LOG = logging.getLogger(__name__)
+
+
+_SUBJECTS = {
+    'confirmation': 'Confirm your Stackcite account'
+}
+
+_BODIES = {
+    'confirmation': 'Your account confirmation key is:\n\n{key}\n'
+}
+
+
+def render(message, sender):
+    """
+    Renders an :class:`~OutboxMessage` as an email.
+    """
+    email = EmailMessage()
+    email['From'] = sender
+    email['To'] = message.recipient
+    email['Subject'] = _SUBJECTS[message.kind]
+    email.set_content(_BODIES[message.kind].format(**message.payload))
+    return email
+
+
+class Transport(object):
+    """
+    Delivers batches of outbox messages. Subclasses implement :meth:`send`,
+    or :meth:`send_batch` to share a connection between the messages of a
+    batch.
+    """
+
+    def __init__(self, sender='noreply@stackcite.com', **options):
+        self.sender = sender
+
+    def send(self, message):
+        raise NotImplementedError()
+
+    def send_batch(self, messages):
+        """
+        Sends each message and returns a list with `None` for each message
+        that was delivered and the exception raised for each that was not.
+        """
+        results = []
+        for message in messages:
+            try:
+                self.send(message)
+                results.append(None)
+            except Exception as err:
+                results.append(err)
+        return results
+
+
+class LogTransport(Transport):
+    """
+    Logs messages instead of sending them (e.g. for development).
+    """
+
+    def send(self, message):
+        _LOG.info('Outbox {}: {} {}'.format(
+            message.kind, message.recipient, json.dumps(message.payload)))
+
+
+class FileTransport(Transport):
+    """
+    Appends each message to a file in mbox format, as a local stand-in for a
+    mail server.
+    """
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+
+    def send_batch(self, messages):
+        results = []
+        try:
+            with open(self.path, 'a') as mbox:
+                for message in messages:
+                    email = render(message, self.sender)
+                    mbox.write('From {} {}\n'.format(
+                        self.sender, time.asctime()))
+                    mbox.write(email.as_string() + '\n')
+                    mbox.flush()
+                    results.append(None)
+        except OSError as err:
+            results.extend([err] * (len(messages) - len(results)))
+        return results
+
+
+class SMTPTransport(Transport):
+    """
+    Sends messages through an SMTP server, with one connection per batch.
+    """
+
+    def __init__(self, host='localhost', port=25, username=None,
+                 password=None, starttls=False, timeout=10, **options):
+        super().__init__(**options)
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = float(timeout)
+
+    def send_batch(self, messages):
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        except (OSError, smtplib.SMTPException) as err:
+            return [err] * len(messages)
+        results = []
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for message in messages:
+                try:
+                    smtp.send_message(render(message, self.sender))
+                    results.append(None)
+                except (smtplib.SMTPRecipientsRefused,
+                        smtplib.SMTPDataError) as err:
+                    results.append(err)
+        except (OSError, smtplib.SMTPException) as err:
+            results.extend([err] * (len(messages) - len(results)))
+        finally:
+            try:
+                smtp.quit()
+            except (OSError, smtplib.SMTPException):
+                smtp.close()
+        return results
+
+
+TRANSPORTS = {
+    'log': LogTransport,
+    'file': FileTransport,
+    'smtp': SMTPTransport
+}
+
+
+def transport_from_settings(settings):
+    """
+    Creates the :class:`Transport` named by the `outbox.transport` setting
+    from its `outbox.<transport>.*` settings.
+    """
+    name = settings.get('outbox.transport', 'log')
+    if name not in TRANSPORTS:
+        msg = 'Invalid outbox transport: {}'.format(name)
+        raise ValueError(msg)
+    prefix = 'outbox.{}.'.format(name)
+    options = dict(
+        (key[len(prefix):], value) for key, value in settings.items()
+        if key.startswith(prefix) and value != '')
+    if 'starttls' in options:
+        options['starttls'] = asbool(options['starttls'])
+    sender = settings.get('outbox.sender')
+    if sender:
+        options['sender'] = sender
+    return TRANSPORTS[name](**options)
+
+
+def backoff(attempts, delay, max_delay):
+    """
+    Returns the number of seconds to wait before retrying a message that has
+    failed `attempts` times: `delay` doubled after every failure, up to
+    `max_delay`.
+    """
+    return min(delay * 2 ** (attempts - 1), max_delay)
+
+
+class OutboxDispatcher(object):
+    """
+    Delivers pending :class:`~OutboxMessage` documents in batches of up to
+    `batch_size` through a :class:`Transport`.
+
+    Every process may run a dispatcher. Each message is claimed for `lease`
+    seconds before it is sent, so only one dispatcher delivers it unless
+    delivery takes longer than the lease. A failed message is retried after
+    an exponential :func:`backoff`, and is marked as failed after
+    `max_attempts` attempts.
+
+    With `background` set, a thread polls for messages every `interval`
+    seconds and is woken up by :meth:`notify`. It is started by the first
+    :meth:`notify` in each process, so nothing runs (or touches the
+    database) before a server forks its workers. Otherwise messages are
+    only delivered by :meth:`dispatch` (e.g. from `stackcite-users-outbox`).
+    """
+
+    def __init__(self, transport=None, background=False, batch_size=100,
+                 interval=1, max_attempts=8, delay=5, max_delay=300,
+                 lease=60, clock=datetime.utcnow):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.configure(transport, background, batch_size, interval,
+                       max_attempts, delay, max_delay, lease)
+
+    def configure(self, transport=None, background=False, batch_size=100,
+                  interval=1, max_attempts=8, delay=5, max_delay=300,
+                  lease=60):
+        batch_size, max_attempts = int(batch_size), int(max_attempts)
+        interval, delay = float(interval), float(delay)
+        max_delay, lease = float(max_delay), float(lease)
+        if batch_size < 1 or max_attempts < 1 or interval <= 0 or lease <= 0:
+            msg = 'Invalid outbox dispatcher: batch_size={}, interval={}'
+            raise ValueError(msg.format(batch_size, interval))
+        self.transport = transport or LogTransport()
+        self.background = background
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.delay = delay
+        self.max_delay = max_delay
+        self.lease = lease
+
+    def claim(self):
+        """
+        Claims up to `batch_size` pending messages that are due, oldest
+        first, and returns them.
+        """
+        now = self._clock()
+        collection = models.OutboxMessage._get_collection()
+        due = {
+            'state': 'pending',
+            'available': {'$lte': now},
+            'expires': {'$gt': now}}
+        candidates = collection.find(due, {'_id': 1}).sort(
+            'available', 1).limit(self.batch_size)
+        ids = [son['_id'] for son in candidates]
+        if not ids:
+            return []
+        # Messages claimed by another dispatcher in the meantime are no
+        # longer due, so the update skips them
+        claim = uuid.uuid4().hex
+        due['_id'] = {'$in': ids}
+        collection.update_many(due, {
+            '$set': {
+                'available': now + timedelta(seconds=self.lease),
+                'claim': claim},
+            '$inc': {'attempts': 1}})
+        claimed = collection.find({'claim': claim}).sort('created', 1)
+        return [models.OutboxMessage._from_son(son) for son in claimed]
+
+    def dispatch(self):
+        """
+        Delivers one batch of messages and returns the number of messages
+        that were claimed.
+        """
+        messages = self.claim()
+        if messages:
+            results = self.transport.send_batch(messages)
+            self._record(messages, results)
+        self._report_backlog()
+        return len(messages)
+
+    def _record(self, messages, results):
+        now = self._clock()
+        requests = []
+        for message, error in zip(messages, results):
+            if error is None:
+                requests.append(UpdateOne(
+                    {'_id': message.pk},
+                    {'$set': {'state': 'sent', 'sent': now},
+                     '$unset': {'error': ''}}))
+                metrics.OUTBOX_DELIVERED.inc(kind=message.kind)
+                metrics.OUTBOX_DELIVERY_LAG.observe(
+                    (now - message.created).total_seconds(),
+                    kind=message.kind)
+                continue
+            update = {'error': str(error)[:1000]}
+            if message.attempts >= self.max_attempts:
+                update['state'] = 'failed'
+                result = 'failed'
+                _LOG.error('Outbox {} to {} failed after {} attempts: {}'
+                           .format(message.kind, message.recipient,
+                                   message.attempts, error))
+            else:
+                delay = backoff(message.attempts, self.delay, self.max_delay)
+                update['available'] = now + timedelta(seconds=delay)
+                result = 'retry'
+            requests.append(UpdateOne({'_id': message.pk}, {'$set': update}))
+            metrics.OUTBOX_FAILURES.inc(kind=message.kind, result=result)
+        collection = models.OutboxMessage._get_collection()
+        collection.bulk_write(requests, ordered=False)
+
+    def _report_backlog(self):
+        now = self._clock()
+        pending = models.OutboxMessage.objects(
+            _state='pending', _expires__gt=now)
+        metrics.OUTBOX_PENDING.set(pending.count())
+        oldest = pending.order_by('_available').only('_created').first()
+        age = (now - oldest.created).total_seconds() if oldest else 0
+        metrics.OUTBOX_OLDEST_PENDING.set(age)
+
+    def notify(self):
+        """
+        Tells the background dispatcher that a message is waiting, starting
+        it if needed.
+        """
+        if not self.background:
+            return
+        self._ensure_started()
+        self._wake.set()
+
+    def _ensure_started(self):
+        # Started lazily, and again in a forked process (which does not
+        # inherit the parent's thread), so every process runs its own
+        pid = os.getpid()
+        if self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != pid or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name='outbox-dispatcher', daemon=True)
+                self._thread.start()
+                self._pid = pid
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.run_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def run_once(self):
+        """
+        Delivers batches until no message is due, logging (rather than
+        raising) database errors so that a dispatcher loop keeps running.
+        """
+        try:
+            while self.dispatch() == self.batch_size:
+                if self._stopped.is_set():
+                    break
+        except Exception:
+            _LOG.exception('Outbox dispatch failed')
+
+    def run_forever(self):
+        """
+        Runs the dispatcher in the calling thread until :meth:`stop`.
+        """
+        self._stopped.clear()
+        self._run()
+
+    def stop(self):
+        """
+        Stops the background dispatcher. Undelivered messages stay in the
+        outbox.
+        """
+        self._stopped.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.interval + 1)
+
+
+DISPATCHER = OutboxDispatcher()
+atexit.register(DISPATCHER.stop)
+
+
+def issue_confirmations(users):
+    """
+    Saves a new :class:`~ConfirmToken` for each user and adds a confirmation
+    email for each token to the outbox, in one transaction where the server
+    supports them (see :meth:`~stackcite.users.db.Connection.transaction`).
+    Messages expire with their tokens. Returns the tokens.
+
+    Without a transaction, the tokens are deleted again if the messages
+    cannot be written, so a token is never left without its email.
+    """
+    tokens, messages = [], []
+    for user in users:
+        token = models.ConfirmToken.new(user)
+        token.validate()
+        tokens.append(token)
+        messages.append(models.OutboxMessage.new(
+            'confirmation', user.email, {'key': token.key},
+            ttl=models.ConfirmToken.TTL))
+    if not tokens:
+        return tokens
+    token_collection = models.ConfirmToken._get_collection()
+    message_collection = models.OutboxMessage._get_collection()
+    with db.CONNECTION.transaction() as session:
+        try:
+            token_collection.insert_many(
+                [token.to_mongo() for token in tokens], ordered=False,
+                session=session)
+            message_collection.insert_many(
+                [message.to_mongo() for message in messages], ordered=False,
+                session=session)
+        except PyMongoError:
+            if session is None:
+                keys = [token.key for token in tokens]
+                token_collection.delete_many({'_id': {'$in': keys}})
+            raise
+    DISPATCHER.notify()
+    return tokens
+
+
+def issue_confirmation(user):
+    """
+    Saves a new :class:`~ConfirmToken` for a user together with its
+    confirmation email (see :func:`issue_confirmations`).
+    """
+    return issue_confirmations([user])[0]
@@ -1,3 +1,5 @@
 from .auth import AuthResource
 from .conf import ConfirmResource
+from .imports import ImportResource
+from .metrics import MetricsResource
 from .users import UserCollection, UserDocument
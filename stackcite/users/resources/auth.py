@@ -1,14 +1,16 @@
 from pyramid import security as sec
 
 from stackcite.api import resources
-from stackcite.users import models, schema
+from stackcite.users import auth, models, schema
 
 
 class AuthResource(resources.APIIndexResource):
 
+    # `Everyone` comes first so that anonymous requests are authorized
+    # without resolving a token
     __acl__ = [
-        (sec.Allow, sec.Authenticated, ('retrieve', 'update', 'delete')),
         (sec.Allow, sec.Everyone, 'create'),
+        (sec.Allow, sec.Authenticated, ('retrieve', 'update', 'delete')),
         sec.DENY_ALL
     ]
 
@@ -23,10 +25,8 @@ class AuthResource(resources.APIIndexResource):
         email = data.get('email')
         password = data.get('password')
         user = models.User.authenticate(email, password)
-        token = models.AuthToken(_user=user)
-        token.save()
-        user.touch_login()
-        user.save()
+        token = auth.issue_token(user)
+        user.record_login()
         return token
 
     def retrieve(self, token):
@@ -37,9 +37,17 @@ class AuthResource(resources.APIIndexResource):
 
     def update(self, token):
         """
-        Updates an existing :class:`~AuthToken`.
+        Updates an existing :class:`~AuthToken`. The new "touched" timestamp
+        may be buffered and written in a later batch.
+
+        Signed tokens cannot be touched, so a fresh token is issued instead
+        and the old one is revoked.
         """
-        token.save()
+        if isinstance(token, auth.SignedToken):
+            refreshed = auth.issue_token(token.user)
+            auth.invalidate_token(token)
+            return refreshed
+        models.TOUCH_COALESCER.touch(token)
         return token
 
     def delete(self, token):
@@ -47,7 +55,9 @@ class AuthResource(resources.APIIndexResource):
         Deletes an existing :class:`~AuthToken`.
         """
         if token:
-            token.delete()
+            auth.invalidate_token(token)
+            if not isinstance(token, auth.SignedToken):
+                token.delete()
             return True
         else:
             return False
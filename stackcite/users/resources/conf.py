@@ -3,7 +3,7 @@ import mongoengine
 from pyramid import security as sec
 
 from stackcite.api import resources
-from stackcite.users import models
+from stackcite.users import auth, identity, models, outbox
 
 
 _LOG = logging.getLogger(__name__)
@@ -21,10 +21,8 @@ class ConfirmResource(resources.APIIndexResource):
         one already exists in the database.
         """
         email = data['email']
-        user = models.User.objects.get(email=email)
-        token = models.ConfirmToken.new(user, save=True)
-        _LOG.info('Confirmation key: {} {}'.format(user.email, token.key))
-        return token
+        user = identity.get(models.User, email=email)
+        return outbox.issue_confirmation(user)
 
     def update(self, data):
         """
@@ -33,5 +31,6 @@ class ConfirmResource(resources.APIIndexResource):
         key = data['key']
         token = models.ConfirmToken.objects.get(_key=key)
         user = token.confirm_user()
+        identity.after_flush(lambda: auth.invalidate_user(user.id))
         _LOG.info('Confirmation key: {} {}'.format(user.email, token.key))
         return token
@@ -0,0 +1,66 @@
+import base64
+import binascii
+
+from datetime import datetime
+
+from bson import ObjectId, json_util
+from bson.errors import InvalidBSON
+
+
+DIRECTIONS = ('next', 'prev')
+
+# Types a sort key value may take in a cursor. Anything else (e.g. a
+# document, which MongoDB would read as query operators) is rejected.
+VALUE_TYPES = (str, int, float, datetime, ObjectId, type(None))
+
+_JSON_OPTIONS = json_util.JSONOptions(
+    json_mode=json_util.JSONMode.CANONICAL, tz_aware=False)
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised for a cursor that cannot be decoded or that belongs to a
+    different sort order.
+    """
+
+
+def encode(sort, direction, values):
+    """
+    Encodes the sort key values of a page boundary as an opaque cursor.
+    """
+    data = {'s': sort, 'd': direction, 'v': list(values)}
+    data = json_util.dumps(data, json_options=_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode(cursor, sort, size):
+    """
+    Returns `(direction, values)` for a cursor issued for `sort`, which has
+    `size` sort keys.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        data = json_util.loads(data.decode('utf-8'), json_options=_JSON_OPTIONS)
+        direction, values = data['d'], data['v']
+        valid = data['s'] == sort and direction in DIRECTIONS
+    except (ValueError, KeyError, TypeError, binascii.Error, InvalidBSON):
+        raise InvalidCursor()
+    if not valid or not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor()
+    if not all(isinstance(v, VALUE_TYPES) for v in values):
+        raise InvalidCursor()
+    return direction, values
+
+
+def keyset_query(keys, values, direction):
+    """
+    Builds a query for the documents after (`next`) or before (`prev`) the
+    given sort key values, e.g. `a > x OR (a == x AND b > y)`.
+    """
+    op = '$gt' if direction == 'next' else '$lt'
+    clauses = []
+    for idx, key in enumerate(keys):
+        clause = dict(zip(keys[:idx], values[:idx]))
+        clause[key] = {op: values[idx]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
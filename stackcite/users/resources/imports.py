@@ -0,0 +1,19 @@
+from pyramid import security as sec
+
+from stackcite.api import auth, resources
+from stackcite.users import imports
+
+
+class ImportResource(resources.APIIndexResource):
+
+    __acl__ = [
+        (sec.Allow, auth.ADMIN, 'create'),
+        sec.DENY_ALL
+    ]
+
+    def create(self, lines):
+        """
+        Imports users from NDJSON lines. Returns an iterator of per-record
+        results; records are written as the iterator is consumed.
+        """
+        return imports.USER_IMPORTER.run(lines)
@@ -0,0 +1,20 @@
+from pyramid import security as sec
+
+from stackcite.api import auth, resources
+from stackcite.users import metrics
+
+
+class MetricsResource(resources.APIIndexResource):
+
+    # Scrapers authenticate with an admin's key
+    __acl__ = [
+        (sec.Allow, auth.ADMIN, 'retrieve'),
+        sec.DENY_ALL
+    ]
+
+    def retrieve(self):
+        """
+        Renders the service metrics in the Prometheus text format.
+        """
+        metrics.HASH_COSTS.ensure_started()
+        return metrics.REGISTRY.render()
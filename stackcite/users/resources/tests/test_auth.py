@@ -136,3 +136,32 @@ class AuthResourceIntegrationTests(unittest.TestCase):
         token.save()
         result = self.collection.delete(token)
         self.assertTrue(result)
+
+    def test_delete_invalidates_cached_token(self):
+        """AuthResource.delete() removes the token from the token cache
+        """
+        from stackcite.users import auth, models
+        auth.TOKEN_CACHE.configure(size=10, ttl=30)
+        self.addCleanup(auth.TOKEN_CACHE.configure, 0, 30)
+        user = testing.utils.create_user('test@email.com', 'T3stPa$$word')
+        user.save()
+        token = models.AuthToken(_user=user)
+        token.save()
+        auth.TOKEN_CACHE.set(token.key, token, user_id=user.id)
+        self.collection.delete(token)
+        result = auth.TOKEN_CACHE.get(token.key)
+        self.assertIsNone(result)
+
+    def test_update_revokes_refreshed_signed_token(self):
+        """AuthResource.update() revokes a signed token it replaces
+        """
+        from stackcite.users import auth, models
+        models.TokenRevocation.drop_collection()
+        auth.TOKEN_SIGNER.configure('x' * 32)
+        self.addCleanup(auth.TOKEN_SIGNER.configure, None)
+        user = testing.utils.create_user('test@email.com', 'T3stPa$$word')
+        user.save()
+        token = auth.TOKEN_SIGNER.issue(user)
+        refreshed = self.collection.update(token)
+        self.assertIsNone(auth.TOKEN_SIGNER.verify(token.key))
+        self.assertIsNotNone(auth.TOKEN_SIGNER.verify(refreshed.key))
@@ -0,0 +1,76 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class CursorTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_decode_returns_encoded_values(self):
+        """decode() returns the direction and values passed to encode()
+        """
+        from bson import ObjectId
+        from datetime import datetime
+        from ..cursors import encode, decode
+        values = [datetime(2020, 1, 1), ObjectId()]
+        cursor = encode('joined', 'next', values)
+        self.assertEqual(('next', values), decode(cursor, 'joined', 2))
+
+    def test_decode_rejects_garbage(self):
+        """decode() raises exception for a malformed cursor
+        """
+        from ..cursors import decode, InvalidCursor
+        with self.assertRaises(InvalidCursor):
+            decode('not a cursor', 'id', 1)
+
+    def test_decode_rejects_other_sort(self):
+        """decode() raises exception for a cursor issued for another sort order
+        """
+        from ..cursors import encode, decode, InvalidCursor
+        cursor = encode('id', 'next', [1])
+        with self.assertRaises(InvalidCursor):
+            decode(cursor, 'joined', 1)
+
+    def test_decode_rejects_missing_values(self):
+        """decode() raises exception for a cursor with fewer values than sort keys
+        """
+        from ..cursors import encode, decode, InvalidCursor
+        cursor = encode('joined', 'next', [1])
+        with self.assertRaises(InvalidCursor):
+            decode(cursor, 'joined', 2)
+
+    def test_decode_rejects_values_that_are_not_a_list(self):
+        """decode() raises exception for a cursor whose values are not a list
+        """
+        import base64
+        from ..cursors import decode, InvalidCursor
+        data = b'{"s": "id", "d": "next", "v": {"a": 1}}'
+        cursor = base64.urlsafe_b64encode(data).decode('ascii')
+        with self.assertRaises(InvalidCursor):
+            decode(cursor, 'id', 1)
+
+    def test_decode_rejects_operators(self):
+        """decode() raises exception for a cursor value that is a document
+        """
+        from ..cursors import encode, decode, InvalidCursor
+        cursor = encode('id', 'next', [{'$ne': None}])
+        with self.assertRaises(InvalidCursor):
+            decode(cursor, 'id', 1)
+
+    def test_keyset_query_single_key(self):
+        """keyset_query() compares a single key directly
+        """
+        from ..cursors import keyset_query
+        result = keyset_query(['_id'], [1], 'next')
+        self.assertEqual({'_id': {'$gt': 1}}, result)
+
+    def test_keyset_query_breaks_ties(self):
+        """keyset_query() breaks ties on the following keys
+        """
+        from ..cursors import keyset_query
+        result = keyset_query(['joined', '_id'], [1, 2], 'prev')
+        expected = {'$or': [
+            {'joined': {'$lt': 1}},
+            {'joined': 1, '_id': {'$lt': 2}}]}
+        self.assertEqual(expected, result)
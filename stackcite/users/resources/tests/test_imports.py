@@ -0,0 +1,18 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class ImportResourceTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_create_is_admin_only(self):
+        """ImportResource only allows admins to create
+        """
+        from pyramid import security as sec
+        from stackcite.api import auth
+        from stackcite.users import resources
+        resource = resources.ImportResource(None, 'import')
+        expected = [(sec.Allow, auth.ADMIN, 'create'), sec.DENY_ALL]
+        self.assertEqual(expected, resource.__acl__)
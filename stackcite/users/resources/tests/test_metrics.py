@@ -0,0 +1,60 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class MetricsResourceTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_retrieve_renders_registry(self):
+        """MetricsResource.retrieve() renders the metrics registry
+        """
+        from stackcite.users import resources
+        resource = resources.MetricsResource(None, 'metrics')
+        result = resource.retrieve()
+        self.assertIn('# TYPE stackcite_users_requests_total counter', result)
+
+    def test_retrieve_requires_admin(self):
+        """MetricsResource only allows admins to retrieve metrics
+        """
+        from pyramid.authorization import ACLAuthorizationPolicy
+        from pyramid import security as sec
+        from stackcite.api import auth
+        from stackcite.users import resources
+        resource = resources.MetricsResource(None, 'metrics')
+        policy = ACLAuthorizationPolicy()
+        self.assertFalse(
+            policy.permits(resource, [sec.Everyone], 'retrieve'))
+        self.assertTrue(
+            policy.permits(resource, [sec.Everyone, auth.ADMIN], 'retrieve'))
+
+
+class RootFactoryTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def make_request(self, settings):
+        from pyramid import testing as pyramid_testing
+        request = pyramid_testing.DummyRequest()
+        request.registry.settings = settings
+        return request
+
+    def test_metrics_mounted_if_enabled(self):
+        """root_factory() mounts /metrics/ if 'metrics.enabled' is set
+        """
+        from stackcite.users import resources, root_factory
+        request = self.make_request({'metrics.enabled': 'true'})
+        result = root_factory(request)['metrics']
+        self.assertIsInstance(result, resources.MetricsResource)
+
+    def test_metrics_not_mounted_if_disabled(self):
+        """root_factory() does not mount /metrics/ if metrics are disabled
+        """
+        from stackcite.users import resources, root_factory
+        request = self.make_request({})
+        try:
+            result = root_factory(request)['metrics']
+        except KeyError:
+            result = None
+        self.assertNotIsInstance(result, resources.MetricsResource)
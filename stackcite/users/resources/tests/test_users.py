@@ -154,3 +154,89 @@ class UserDocumentTests(UserResourceTests):
         import mongoengine
         with self.assertRaises(mongoengine.DoesNotExist):
             models.ConfirmToken.objects.get(_key=token.key)
+
+    def test_delete_user_invalidates_cached_tokens(self):
+        """UserDocument.delete() removes the user's tokens from the token cache
+        """
+        from stackcite.users import auth, models
+        auth.TOKEN_CACHE.configure(size=10, ttl=30)
+        self.addCleanup(auth.TOKEN_CACHE.configure, 0, 30)
+        user = self.doc_rec.retrieve()
+        token = models.AuthToken.new(user, save=True)
+        auth.TOKEN_CACHE.set(token.key, token, user_id=user.id)
+        self.doc_rec.delete()
+        result = auth.TOKEN_CACHE.get(token.key)
+        self.assertIsNone(result)
+
+
+class UserCollectionPageTests(UserResourceTests):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        super().setUp()
+        from stackcite.users import models
+        models.User.drop_collection()
+        self.emails = []
+        for idx in range(5):
+            email = 'test{}@email.com'.format(idx)
+            testing.utils.create_user(email, 'T3stPa$$word', save=True)
+            self.emails.append(email)
+
+    def _emails(self, page):
+        return [user.email for user in page['items']]
+
+    def test_page_returns_first_page(self):
+        """UserCollection.page() returns the first users without a cursor
+        """
+        page = self.col_rec.page(limit=2)
+        self.assertEqual(self.emails[:2], self._emails(page))
+
+    def test_page_follows_next_cursor(self):
+        """UserCollection.page() returns the following users for a next cursor
+        """
+        page = self.col_rec.page(limit=2)
+        page = self.col_rec.page(cursor=page['next'], limit=2)
+        self.assertEqual(self.emails[2:4], self._emails(page))
+
+    def test_page_follows_prev_cursor(self):
+        """UserCollection.page() returns the preceding users for a prev cursor
+        """
+        page = self.col_rec.page(limit=2)
+        page = self.col_rec.page(cursor=page['next'], limit=2)
+        page = self.col_rec.page(cursor=page['prev'], limit=2)
+        self.assertEqual(self.emails[:2], self._emails(page))
+
+    def test_last_page_has_no_next_cursor(self):
+        """UserCollection.page() returns no next cursor on the last page
+        """
+        page = self.col_rec.page(limit=3)
+        page = self.col_rec.page(cursor=page['next'], limit=3)
+        self.assertEqual((None, 2), (page['next'], len(page['items'])))
+
+    def test_first_page_has_no_prev_cursor(self):
+        """UserCollection.page() returns no prev cursor on the first page
+        """
+        page = self.col_rec.page(limit=2)
+        self.assertIsNone(page['prev'])
+
+    def test_page_sorts_by_join_date(self):
+        """UserCollection.page() pages by join date
+        """
+        page = self.col_rec.page(limit=2, sort='joined')
+        page = self.col_rec.page(cursor=page['next'], limit=2, sort='joined')
+        self.assertEqual(self.emails[2:4], self._emails(page))
+
+    def test_page_omits_count(self):
+        """UserCollection.page() omits the total count if not requested
+        """
+        page = self.col_rec.page(limit=2, count=False)
+        self.assertNotIn('count', page)
+
+    def test_page_rejects_cursor_for_other_sort(self):
+        """UserCollection.page() raises exception for a cursor of another sort
+        """
+        from stackcite.users.resources import cursors
+        page = self.col_rec.page(limit=2, sort='joined')
+        with self.assertRaises(cursors.InvalidCursor):
+            self.col_rec.page(cursor=page['next'], limit=2, sort='id')
@@ -1,10 +1,14 @@
+import functools
 import logging
 import mongoengine
 from contextlib import suppress
 from pyramid import security as sec
 
-from stackcite.api import auth, resources
-from stackcite.users import models, schema, exceptions as exc
+from stackcite.api import resources
+from stackcite.users import (
+    auth, db, identity, models, outbox, schema, exceptions as exc)
+
+from . import cursors
 
 
 _LOG = logging.getLogger(__name__)
@@ -12,6 +16,8 @@ _LOG = logging.getLogger(__name__)
 
 class UserDocument(resources.APIDocumentResource):
 
+    _SCHEMA = schema.User
+
     def __acl__(self):
         return [
             (sec.Allow, self.id, ('retrieve', 'update', 'delete')),
@@ -19,18 +25,40 @@ class UserDocument(resources.APIDocumentResource):
             sec.DENY_ALL
         ]
 
+    def retrieve(self, *args, **kwargs):
+        # Plain reads of the whole document follow the `user` read
+        # preference and are loaded once per request, anything else is
+        # left to the base resource
+        if args or kwargs:
+            return super().retrieve(*args, **kwargs)
+        if db.READS.on_primary('user'):
+            load = super().retrieve
+        else:
+            load = functools.partial(
+                db.READS.get, models.User, 'user', id=self.id)
+        return identity.get(models.User, load, id=self.id)
+
     def update(self, data):
         data = data.copy()
         if data.get('new_password'):
-            user = self.retrieve()
+            # Writes check the current password on the primary
+            user = identity.get(models.User, super().retrieve, id=self.id)
             password = data.pop('password')
             if user.check_password(password):
                 data['password'] = data.pop('new_password')
             else:
                 raise exc.AuthenticationError()
-        return super().update(data)
+        result = super().update(data)
+        # Written immediately rather than through the unit of work, so later
+        # lookups in this request must see the updated user
+        identity.add(result)
+        # Issued tokens carry a copy of the user's groups
+        if 'groups' in data:
+            auth.invalidate_user(self.id)
+        return result
 
     def delete(self):
+        auth.invalidate_user(self.id)
         # Delete associated CachedReferenceFields
         with suppress(mongoengine.DoesNotExist):
             models.AuthToken.objects(_user__id=self.id).delete()
@@ -40,9 +68,11 @@ class UserDocument(resources.APIDocumentResource):
 
 class UserCollection(resources.APICollectionResource):
 
+    # `Everyone` comes first so that anonymous requests are authorized
+    # without resolving a token
     __acl__ = [
-        (sec.Allow, auth.ADMIN, 'retrieve'),
         (sec.Allow, sec.Everyone, 'create'),
+        (sec.Allow, auth.ADMIN, 'retrieve'),
         sec.DENY_ALL
     ]
 
@@ -51,8 +81,57 @@ class UserCollection(resources.APICollectionResource):
 
     _SCHEMA = schema.User
 
+    # Indexed sort orders available for cursor paging (the last field
+    # breaks ties)
+    CURSOR_SORTS = {
+        'id': ('id',),
+        'joined': ('_joined', 'id')
+    }
+
+    def page(self, cursor=None, limit=20, sort='id', count=True):
+        """
+        Returns a page of users in a stable sort order, with opaque `next` and
+        `prev` cursors for the neighbouring pages. Every page is a single
+        indexed range query, however deep it is. Counting every user is
+        optional because it requires a collection scan.
+        """
+        if sort not in self.CURSOR_SORTS:
+            raise cursors.InvalidCursor()
+        fields = self.CURSOR_SORTS[sort]
+        keys = [models.User._fields[f].db_field for f in fields]
+        direction, query = 'next', {}
+        if cursor:
+            direction, values = cursors.decode(cursor, sort, len(keys))
+            query = cursors.keyset_query(keys, values, direction)
+        sign = '+' if direction == 'next' else '-'
+        queryset = db.READS.queryset(models.User, 'listing')
+        users = queryset(__raw__=query)
+        users = users.order_by(*(sign + f for f in fields)).limit(limit + 1)
+        users = list(users)
+        more = len(users) > limit
+        users = users[:limit]
+        if direction == 'prev':
+            users.reverse()
+
+        def boundary(user, direction):
+            values = [getattr(user, f) for f in fields]
+            return cursors.encode(sort, direction, values)
+
+        # A page reached backwards always has a next page and vice versa
+        has_next = more if direction == 'next' else bool(cursor)
+        has_prev = bool(cursor) if direction == 'next' else more
+        result = {
+            'items': users,
+            'limit': limit,
+            'next': boundary(users[-1], 'next') if users and has_next else None,
+            'prev': boundary(users[0], 'prev') if users and has_prev else None
+        }
+        if count:
+            result['count'] = queryset.count()
+        return result
+
     def create(self, data):
         user = super().create(data)
-        conf_token = models.ConfirmToken.new(user, save=True)
-        _LOG.info('New confirmation token: {}'.format(conf_token.key))
+        identity.add(user)
+        outbox.issue_confirmation(user)
         return user
@@ -1,3 +1,4 @@
-from .auth import AuthToken, Authenticate
+from .auth import AuthToken, SignedAuthToken, Authenticate
 from .conf import ConfirmToken, CreateConfirmationToken, UpdateConfirmationToken
+from .registry import SCHEMAS
 from .users import User
@@ -12,11 +12,20 @@ class AuthToken(Schema):
 
     key = api_fields.AuthTokenKeyField(required=True)
 
-    user = mm_fields.Nested(users.User(exclude=('email',)), dump_only=True)
+    user = mm_fields.Nested(users.User, exclude=('email',), dump_only=True)
     issued = mm_fields.DateTime(dump_only=True)
     touched = mm_fields.DateTime(dump_only=True)
 
 
+class SignedAuthToken(AuthToken):
+    """
+    A schema for serializing self-contained signed authentication tokens.
+    """
+
+    key = mm_fields.String(required=True)
+    expires = mm_fields.DateTime(dump_only=True)
+
+
 class Authenticate(Schema):
     """
     A specific schema used to deserialize authentication data.
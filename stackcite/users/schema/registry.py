@@ -0,0 +1,158 @@
+import threading
+
+from marshmallow import fields, missing, utils
+
+
+def _build(schema_cls, strict, method, exclude):
+    schm = schema_cls(strict=strict, exclude=exclude)
+    if method is not None:
+        schm.method = method
+    return schm
+
+
+def _datetime(value):
+    return utils.isoformat(value) if value is not None else None
+
+
+def _string(value):
+    return str(value) if value is not None else None
+
+
+def _compile_field(field):
+    """
+    Returns a function serializing a single attribute value the way `field`
+    does, skipping marshmallow's per-value bookkeeping for common types.
+    """
+    if isinstance(field, fields.Nested):
+        dump = compile_dump(field.schema)
+        if field.many:
+            return lambda value: [dump(v) for v in value] \
+                if value is not None else None
+        return lambda value: dump(value) if value is not None else None
+    if type(field) is fields.DateTime and not field.localtime and \
+            field.dateformat in (None, 'iso', 'isoformat'):
+        return _datetime
+    if type(field) in (fields.String, fields.Email):
+        return _string
+    return None
+
+
+def compile_dump(schm):
+    """
+    Generates a dump function for a schema instance, returning the same
+    result as `schm.dump(obj).data`.
+
+    Values are read with the schema's own accessor (`get_attribute`), so
+    dict-backed objects and dotted `attribute` paths are read the way
+    marshmallow reads them. Schemas with `pre_dump`/`post_dump` processors
+    are dumped by marshmallow itself, and fields with a `default` by the
+    field.
+    """
+    processors = getattr(schm, '__processors__', {})
+    if any(tag in ('pre_dump', 'post_dump') for tag, _ in processors):
+        return lambda obj: schm.dump(obj).data
+
+    accessor = schm.get_attribute
+    prefix = getattr(schm, 'prefix', '') or ''
+    getters = []
+    for name, field in schm.fields.items():
+        if field.load_only:
+            continue
+        attribute = field.attribute or name
+        key = prefix + (getattr(field, 'dump_to', None) or name)
+        serialize = _compile_field(field)
+        if field.default is not missing:
+            # Defaults are resolved by the field
+            serialize = None
+        if serialize is None:
+            # Fall back to the field's own serialization
+            getters.append((key, None, field.serialize, name))
+        else:
+            getters.append((key, serialize, None, attribute))
+
+    def dump(obj):
+        result = {}
+        for key, serialize, field_serialize, attribute in getters:
+            if serialize is None:
+                value = field_serialize(attribute, obj, accessor=accessor)
+            else:
+                value = accessor(attribute, obj, missing)
+                if value is not missing:
+                    value = serialize(value)
+            # Like marshmallow, leave out attributes the object doesn't have
+            if value is not missing:
+                result[key] = value
+        return result
+
+    return dump
+
+
+class SchemaRegistry(object):
+    """
+    Builds each schema once per thread and reuses it for every request
+    served by that thread (marshmallow schemas hold per-call state, so one
+    instance cannot be shared between threads).
+
+    If `compiled` is set, :meth:`dumper` returns a function generated from
+    the schema's fields by :func:`compile_dump`. A disabled registry builds
+    a new schema on every call.
+    """
+
+    def __init__(self, enabled=True, compiled=True):
+        self._local = threading.local()
+        self.configure(enabled, compiled)
+
+    def configure(self, enabled=True, compiled=True):
+        self.enabled = bool(enabled)
+        self.compiled = bool(compiled)
+        self._local = threading.local()
+
+    def _cache(self):
+        cache = getattr(self._local, 'cache', None)
+        if cache is None:
+            cache = self._local.cache = {}
+        return cache
+
+    def get(self, key, factory):
+        """
+        Returns the schema cached under `key`, building it with `factory()`
+        the first time the current thread asks for it.
+        """
+        if not self.enabled:
+            return factory()
+        cache = self._cache()
+        schm = cache.get(key)
+        if schm is None:
+            schm = cache[key] = factory()
+        return schm
+
+    def schema(self, schema_cls, strict=False, method=None, exclude=()):
+        """
+        Returns an instance of `schema_cls` for the given options.
+        """
+        exclude = tuple(exclude)
+        key = (schema_cls, strict, method, exclude)
+        return self.get(
+            key, lambda: _build(schema_cls, strict, method, exclude))
+
+    def dumper(self, key, factory):
+        """
+        Returns a function dumping objects with the schema cached under `key`.
+        """
+        schm = self.get(key, factory)
+        if not (self.enabled and self.compiled):
+            return lambda obj: schm.dump(obj).data
+        return self.get(('dump',) + tuple(key), lambda: compile_dump(schm))
+
+    def dump(self, schema_cls, obj, method=None, exclude=()):
+        """
+        Dumps an object with an instance of `schema_cls`.
+        """
+        exclude = tuple(exclude)
+        key = (schema_cls, False, method, exclude)
+        dump = self.dumper(
+            key, lambda: _build(schema_cls, False, method, exclude))
+        return dump(obj)
+
+
+SCHEMAS = SchemaRegistry()
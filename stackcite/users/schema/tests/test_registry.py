@@ -0,0 +1,159 @@
+import threading
+import unittest
+
+from stackcite.users import testing
+
+
+class SchemaRegistryTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from ..registry import SchemaRegistry
+        self.registry = SchemaRegistry()
+
+    def test_schema_reuses_instance(self):
+        """SchemaRegistry.schema() returns the same instance on one thread
+        """
+        from .. import auth
+        first = self.registry.schema(auth.Authenticate, strict=True)
+        second = self.registry.schema(auth.Authenticate, strict=True)
+        self.assertIs(first, second)
+
+    def test_schema_separates_options(self):
+        """SchemaRegistry.schema() builds separate instances for other options
+        """
+        from .. import auth
+        strict = self.registry.schema(auth.Authenticate, strict=True)
+        lenient = self.registry.schema(auth.Authenticate)
+        self.assertIsNot(strict, lenient)
+
+    def test_schema_separates_threads(self):
+        """SchemaRegistry.schema() builds separate instances per thread
+        """
+        from .. import auth
+        schemas = []
+
+        def get_schema():
+            schemas.append(self.registry.schema(auth.Authenticate))
+
+        get_schema()
+        thread = threading.Thread(target=get_schema)
+        thread.start()
+        thread.join()
+        self.assertIsNot(schemas[0], schemas[1])
+
+    def test_disabled_registry_builds_new_instances(self):
+        """SchemaRegistry.schema() builds a new instance if disabled
+        """
+        from .. import auth
+        self.registry.configure(enabled=False)
+        first = self.registry.schema(auth.Authenticate)
+        second = self.registry.schema(auth.Authenticate)
+        self.assertIsNot(first, second)
+
+    def test_schema_sets_method(self):
+        """SchemaRegistry.schema() sets the schema method
+        """
+        from .. import users
+        schm = self.registry.schema(users.User, method='POST')
+        self.assertEqual('POST', schm.method)
+
+
+class CompileDumpTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import models
+        models.User.drop_collection()
+        models.AuthToken.drop_collection()
+        user = testing.utils.create_user(
+            'test@email.com', 'T3stPa$$word', groups=('users',), save=True)
+        self.token = testing.utils.create_auth_token(user, save=True)
+
+    def test_auth_token_matches_marshmallow(self):
+        """compile_dump() dumps an AuthToken like marshmallow does
+        """
+        from .. import auth
+        from ..registry import compile_dump
+        expected = auth.AuthToken().dump(self.token).data
+        result = compile_dump(auth.AuthToken())(self.token)
+        self.assertEqual(expected, result)
+
+    def test_user_matches_marshmallow(self):
+        """compile_dump() dumps a User like marshmallow does
+        """
+        from .. import users
+        from ..registry import compile_dump
+        expected = users.User().dump(self.token.user).data
+        result = compile_dump(users.User())(self.token.user)
+        self.assertEqual(expected, result)
+
+    def test_signed_token_matches_marshmallow(self):
+        """compile_dump() dumps a signed token like marshmallow does
+        """
+        from stackcite.users.auth import signed
+        from .. import auth
+        from ..registry import compile_dump
+        signer = signed.TokenSigner(secret='s' * 32)
+        token = signer.issue(self.token.user)
+        expected = auth.SignedAuthToken().dump(token).data
+        result = compile_dump(auth.SignedAuthToken())(token)
+        self.assertEqual(expected, result)
+
+    def test_uses_field_default(self):
+        """compile_dump() dumps a field's default for a missing attribute
+        """
+        import marshmallow
+        from ..registry import compile_dump
+
+        class Schema(marshmallow.Schema):
+            name = marshmallow.fields.String(default='anonymous')
+
+        result = compile_dump(Schema())(object())
+        self.assertEqual({'name': 'anonymous'}, result)
+
+    def test_follows_dotted_attribute(self):
+        """compile_dump() dumps a field with a dotted attribute like marshmallow
+        """
+        import marshmallow
+        from ..registry import compile_dump
+
+        class Schema(marshmallow.Schema):
+            email = marshmallow.fields.String(attribute='user.email')
+
+        schm = Schema()
+        expected = schm.dump(self.token).data
+        result = compile_dump(schm)(self.token)
+        self.assertEqual(expected, result)
+
+    def test_matches_marshmallow_for_dicts(self):
+        """compile_dump() dumps a dict like marshmallow does
+        """
+        import marshmallow
+        from ..registry import compile_dump
+
+        class Schema(marshmallow.Schema):
+            email = marshmallow.fields.Email()
+            name = marshmallow.fields.String(attribute='profile.name')
+            joined = marshmallow.fields.DateTime()
+
+        schm = Schema()
+        obj = {
+            'email': 'test@email.com',
+            'profile': {'name': 'Test'},
+            'joined': self.token.issued}
+        expected = schm.dump(obj).data
+        result = compile_dump(schm)(obj)
+        self.assertEqual(expected, result)
+
+    def test_matches_marshmallow_with_prefix(self):
+        """compile_dump() prefixes keys like marshmallow does
+        """
+        from .. import users
+        from ..registry import compile_dump
+        schm = users.User(prefix='user_')
+        expected = schm.dump(self.token.user).data
+        result = compile_dump(schm)(self.token.user)
+        self.assertEqual(expected, result)
@@ -0,0 +1,237 @@
+import argparse
+import gzip
+import os
+import struct
+import sys
+import time
+
+from datetime import datetime, timedelta
+
+import bson
+import pymongo
+
+from bson import json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError
+
+from stackcite.users import db, models
+
+
+FORMATS = ('ndjson', 'bson')
+
+# Collections in restore order
+DOCUMENTS = (
+    ('users', models.User),
+    ('auth_tokens', models.AuthToken),
+    ('confirm_tokens', models.ConfirmToken)
+)
+
+# Canonical Extended JSON round-trips every BSON type; naive datetimes match
+# the documents mongoengine reads
+_JSON_OPTIONS = json_util.JSONOptions(
+    json_mode=json_util.JSONMode.CANONICAL, tz_aware=False)
+_RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def _ttl_fields(document_cls):
+    """
+    Returns `(db_field, seconds)` for every TTL index of a document class.
+    """
+    result = []
+    for index in document_cls._meta.get('indexes', ()):
+        if isinstance(index, dict) and 'expireAfterSeconds' in index:
+            for name in index['fields']:
+                db_field = document_cls._fields[name.lstrip('+-')].db_field
+                result.append((db_field, index['expireAfterSeconds']))
+    return result
+
+
+def expired_filter(document_cls, now=None):
+    """
+    Returns a query matching the documents that have not yet been removed by
+    their TTL indexes as of `now`, or `{}` if the collection never expires.
+    """
+    now = now or datetime.utcnow()
+    return {
+        db_field: {'$gt': now - timedelta(seconds=seconds)}
+        for db_field, seconds in _ttl_fields(document_cls)}
+
+
+def _is_live(document, ttl_query):
+    for db_field, condition in ttl_query.items():
+        value = document.get(db_field)
+        if value is None or value <= condition['$gt']:
+            return False
+    return True
+
+
+def count_bson(data):
+    """
+    Counts the BSON documents in a buffer of concatenated documents.
+    """
+    count, offset = 0, 0
+    while offset < len(data):
+        offset += struct.unpack_from('<i', data, offset)[0]
+        count += 1
+    return count
+
+
+class Report(object):
+    """
+    Throughput of a dump or restore of one collection.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.documents = 0
+        self.skipped = 0
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.start
+        return self
+
+    def __str__(self):
+        rate = self.documents / self.elapsed if self.elapsed else 0.0
+        return '{}: {} documents, {} skipped in {:.2f}s ({:.0f}/s)'.format(
+            self.name, self.documents, self.skipped, self.elapsed, rate)
+
+
+def _path(directory, name, fmt):
+    return os.path.join(directory, '{}.{}.gz'.format(name, fmt))
+
+
+def dump_collection(collection, path, fmt='ndjson', query=None,
+                    batch_size=10000):
+    """
+    Streams a collection to a gzipped NDJSON or BSON file with raw cursor
+    batches (no documents are built for BSON dumps).
+    """
+    report = Report(collection.name)
+    query = query or {}
+    with gzip.open(path, 'wb') as out:
+        if fmt == 'bson':
+            batches = collection.find_raw_batches(query, batch_size=batch_size)
+            for batch in batches:
+                out.write(batch)
+                report.documents += count_bson(batch)
+        else:
+            cursor = collection.find(query, batch_size=batch_size)
+            for document in cursor:
+                line = json_util.dumps(document, json_options=_JSON_OPTIONS)
+                out.write(line.encode('utf-8') + b'\n')
+                report.documents += 1
+    if query:
+        total = collection.estimated_document_count()
+        report.skipped = max(total - report.documents, 0)
+    return report.stop()
+
+
+def _read(path, fmt):
+    with gzip.open(path, 'rb') as source:
+        if fmt == 'bson':
+            yield from bson.decode_file_iter(source, _RAW_OPTIONS)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json_util.loads(line, json_options=_JSON_OPTIONS)
+
+
+def restore_collection(collection, path, fmt='ndjson', query=None,
+                       batch_size=10000):
+    """
+    Restores a dumped collection with unordered `insert_many` batches.
+    Documents that already exist are skipped.
+    """
+    report = Report(collection.name)
+    query = query or {}
+
+    def insert(batch):
+        try:
+            result = collection.insert_many(batch, ordered=False)
+            report.documents += len(result.inserted_ids)
+        except BulkWriteError as err:
+            report.documents += err.details['nInserted']
+            report.skipped += len(err.details['writeErrors'])
+            if any(e['code'] != 11000 for e in err.details['writeErrors']):
+                raise
+
+    batch = []
+    for document in _read(path, fmt):
+        if query and not _is_live(document, query):
+            report.skipped += 1
+            continue
+        batch.append(document)
+        if len(batch) >= batch_size:
+            insert(batch)
+            batch = []
+    if batch:
+        insert(batch)
+    return report.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Dumps or restores the users, auth_tokens and '
+                    'confirm_tokens collections.')
+    parser.add_argument(
+        'command', choices=('dump', 'restore'))
+    parser.add_argument(
+        'config', help='Application .ini file')
+    parser.add_argument(
+        'directory', help='Directory holding the dump files')
+    parser.add_argument(
+        '--format', choices=FORMATS, default='ndjson',
+        help='Dump file format (default: ndjson)')
+    parser.add_argument(
+        '--skip-expired', action='store_true',
+        help='Leave out tokens their TTL index would already have removed')
+    parser.add_argument(
+        '--drop', action='store_true',
+        help='Delete existing documents before restoring (indexes are kept)')
+    parser.add_argument(
+        '--batch-size', type=int, default=10000,
+        help='Documents per cursor batch or insert (default: 10000)')
+    parser.add_argument(
+        '--mongo-host', help='Overrides mongo.host')
+    parser.add_argument(
+        '--mongo-db', help='Overrides mongo.db')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Dumps the service's collections to, or restores them from, a directory
+    of gzipped NDJSON or BSON files and reports the throughput.
+    """
+    from pyramid import paster
+    args = parse_args(argv)
+    settings = paster.get_appsettings(args.config)
+    client = pymongo.MongoClient(
+        args.mongo_host or settings['mongo.host'],
+        **db.client_options(settings))
+    database = client[args.mongo_db or settings['mongo.db']]
+    if args.command == 'dump':
+        os.makedirs(args.directory, exist_ok=True)
+    try:
+        for name, document_cls in DOCUMENTS:
+            collection = database[document_cls._get_collection_name()]
+            path = _path(args.directory, name, args.format)
+            query = None
+            if args.skip_expired:
+                query = expired_filter(document_cls)
+            if args.command == 'dump':
+                report = dump_collection(
+                    collection, path, args.format, query, args.batch_size)
+            elif os.path.exists(path):
+                if args.drop:
+                    collection.delete_many({})
+                report = restore_collection(
+                    collection, path, args.format, query, args.batch_size)
+            else:
+                continue
+            sys.stderr.write('{}\n'.format(report))
+    finally:
+        client.close()
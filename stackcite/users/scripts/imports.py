@@ -0,0 +1,50 @@
+import argparse
+import json
+import sys
+
+from pyramid import paster
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Imports users from NDJSON records (one JSON object with '
+                    '"email" and "password" per line).')
+    parser.add_argument(
+        'config', help='Application .ini file')
+    parser.add_argument(
+        'input', nargs='?', default='-',
+        help='NDJSON file to import (default: standard input)')
+    parser.add_argument(
+        '--workers', type=int,
+        help='Password hashing processes (default: import.workers)')
+    parser.add_argument(
+        '--batch-size', type=int,
+        help='Records per database write (default: import.batch_size)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Imports users from an NDJSON file and writes one JSON result per record
+    to standard output.
+    """
+    args = parse_args(argv)
+    paster.setup_logging(args.config)
+    env = paster.bootstrap(args.config)
+    from stackcite.users import imports
+    importer = imports.USER_IMPORTER
+    importer.configure(
+        workers=args.workers if args.workers is not None else importer.workers,
+        batch_size=args.batch_size or importer.batch_size)
+    counts = {'created': 0, 'failed': 0}
+    source = sys.stdin if args.input == '-' else open(args.input, 'rb')
+    try:
+        for result in importer.run(source):
+            counts[result['status']] += 1
+            sys.stdout.write(json.dumps(result) + '\n')
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        importer.shutdown()
+        env['closer']()
+    sys.stderr.write('{created} created, {failed} failed\n'.format(**counts))
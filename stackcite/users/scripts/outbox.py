@@ -0,0 +1,41 @@
+import argparse
+import signal
+
+from pyramid import paster
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Delivers pending outbox messages (e.g. confirmation '
+                    'emails).')
+    parser.add_argument(
+        'config', help='Application .ini file')
+    parser.add_argument(
+        '--once', action='store_true',
+        help='Deliver the messages that are due now, then exit')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Runs the outbox dispatcher in the foreground until it is interrupted.
+    Set `outbox.dispatcher = none` for the web workers when running this.
+    """
+    args = parse_args(argv)
+    paster.setup_logging(args.config)
+    env = paster.bootstrap(args.config)
+    from stackcite.users import outbox
+    dispatcher = outbox.DISPATCHER
+    # Deliver from this thread only, even if the settings enable a
+    # background dispatcher
+    dispatcher.background = False
+    try:
+        if args.once:
+            dispatcher.run_once()
+        else:
+            signal.signal(signal.SIGTERM, lambda *_: dispatcher.stop())
+            dispatcher.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env['closer']()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime, timedelta
+
+from stackcite.users import testing
+
+
+class BackupUnitTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_expired_filter_uses_ttl_index(self):
+        """expired_filter() matches auth tokens touched within the last hour
+        """
+        from stackcite.users import models
+        from ..backup import expired_filter
+        now = datetime(2020, 1, 1, 12)
+        result = expired_filter(models.AuthToken, now)
+        expected = {'touched': {'$gt': datetime(2020, 1, 1, 11)}}
+        self.assertEqual(expected, result)
+
+    def test_expired_filter_empty_without_ttl_index(self):
+        """expired_filter() returns an empty query for users
+        """
+        from stackcite.users import models
+        from ..backup import expired_filter
+        self.assertEqual({}, expired_filter(models.User))
+
+    def test_count_bson_counts_documents(self):
+        """count_bson() counts concatenated BSON documents
+        """
+        import bson
+        from ..backup import count_bson
+        data = b''.join(bson.encode({'n': n}) for n in range(3))
+        self.assertEqual(3, count_bson(data))
+
+
+class BackupIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import models
+        models.User.drop_collection()
+        models.AuthToken.drop_collection()
+        self.directory = tempfile.mkdtemp()
+        user = testing.utils.create_user(
+            'test@email.com', 'T3stPa$$word', save=True)
+        self.live = testing.utils.create_auth_token(user, save=True)
+        self.expired = testing.utils.create_auth_token(user, save=True)
+        models.AuthToken._get_collection().update_one(
+            {'_id': self.expired.key},
+            {'$set': {'touched': datetime.utcnow() - timedelta(hours=2)}})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _round_trip(self, document_cls, fmt, query=None):
+        from ..backup import dump_collection, restore_collection
+        collection = document_cls._get_collection()
+        path = os.path.join(self.directory, 'dump.' + fmt + '.gz')
+        dump_collection(collection, path, fmt, query)
+        collection.delete_many({})
+        return restore_collection(collection, path, fmt)
+
+    def test_ndjson_round_trip_restores_users(self):
+        """dump_collection() and restore_collection() round-trip NDJSON
+        """
+        from stackcite.users import models
+        self._round_trip(models.User, 'ndjson')
+        user = models.User.authenticate('test@email.com', 'T3stPa$$word')
+        self.assertEqual('test@email.com', user.email)
+
+    def test_bson_round_trip_restores_tokens(self):
+        """dump_collection() and restore_collection() round-trip BSON
+        """
+        from stackcite.users import models
+        report = self._round_trip(models.AuthToken, 'bson')
+        self.assertEqual(2, report.documents)
+
+    def test_dump_skips_expired_tokens(self):
+        """dump_collection() leaves out tokens matched by an expired filter
+        """
+        from stackcite.users import models
+        from ..backup import expired_filter
+        query = expired_filter(models.AuthToken)
+        self._round_trip(models.AuthToken, 'ndjson', query)
+        keys = [t.key for t in models.AuthToken.objects]
+        self.assertEqual([self.live.key], keys)
+
+    def test_restore_skips_existing_documents(self):
+        """restore_collection() skips documents that already exist
+        """
+        from stackcite.users import models
+        from ..backup import dump_collection, restore_collection
+        collection = models.AuthToken._get_collection()
+        path = os.path.join(self.directory, 'tokens.ndjson.gz')
+        dump_collection(collection, path)
+        report = restore_collection(collection, path)
+        self.assertEqual((0, 2), (report.documents, report.skipped))
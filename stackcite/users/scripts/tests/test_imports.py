@@ -0,0 +1,24 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class ParseArgsTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_input_defaults_to_stdin(self):
+        """parse_args() reads from standard input by default
+        """
+        from ..imports import parse_args
+        args = parse_args(['development.ini'])
+        self.assertEqual('-', args.input)
+
+    def test_parses_overrides(self):
+        """parse_args() parses worker and batch size overrides
+        """
+        from ..imports import parse_args
+        args = parse_args([
+            'development.ini', 'users.ndjson',
+            '--workers', '8', '--batch-size', '1000'])
+        self.assertEqual((8, 1000), (args.workers, args.batch_size))
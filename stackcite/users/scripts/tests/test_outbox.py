@@ -0,0 +1,22 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class ParseArgsTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_runs_forever_by_default(self):
+        """parse_args() keeps the dispatcher running by default
+        """
+        from ..outbox import parse_args
+        args = parse_args(['development.ini'])
+        self.assertFalse(args.once)
+
+    def test_parses_once(self):
+        """parse_args() parses '--once'
+        """
+        from ..outbox import parse_args
+        args = parse_args(['development.ini', '--once'])
+        self.assertTrue(args.once)
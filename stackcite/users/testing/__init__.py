@@ -1,5 +1,7 @@
 from stackcite.api import testing as _testing
 
+from . import asgi
+from . import benchmarks
 from . import endpoints
 from . import layers
 from . import utils
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+from urllib.parse import quote
+
+
+def build_scope(environ):
+    """
+    Builds an ASGI HTTP scope for a WSGI environ.
+    """
+    headers = []
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            name = key[5:].replace('_', '-').lower()
+        elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = key.replace('_', '-').lower()
+        else:
+            continue
+        if value:
+            headers.append((name.encode('latin-1'), value.encode('latin-1')))
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': environ.get('SERVER_PROTOCOL', 'HTTP/1.1')[5:],
+        'method': environ['REQUEST_METHOD'],
+        'scheme': environ.get('wsgi.url_scheme', 'http'),
+        'root_path': environ.get('SCRIPT_NAME', ''),
+        'path': environ.get('PATH_INFO', '') or '/',
+        'raw_path': quote(environ.get('PATH_INFO', '')).encode('latin-1'),
+        'query_string': environ.get('QUERY_STRING', '').encode('latin-1'),
+        'headers': headers,
+        'server': (environ.get('SERVER_NAME', 'localhost'),
+                   int(environ.get('SERVER_PORT', 80))),
+        'client': (environ.get('REMOTE_ADDR', ''), 0)
+    }
+
+
+class ASGIBridge(object):
+    """
+    Exposes an ASGI application as a WSGI application so that the endpoint
+    tests (via `webtest`) can be run against the ASGI deployment mode.
+
+    Requests are run on a single event loop in a background thread, which
+    keeps loop-bound resources (e.g. the asyncio database client) valid
+    across requests.
+    """
+
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name='asgi-bridge', daemon=True)
+        self._thread.start()
+
+    def __call__(self, environ, start_response):
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length) if length else b''
+        scope = build_scope(environ)
+        future = asyncio.run_coroutine_threadsafe(
+            self._call(scope, body), self.loop)
+        status, headers, content = future.result()
+        start_response(status, headers)
+        return [content]
+
+    async def _call(self, scope, body):
+        response = {'body': []}
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = [
+                    (k.decode('latin-1'), v.decode('latin-1'))
+                    for k, v in message.get('headers', ())]
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+
+        await self.asgi_app(scope, receive, send)
+        status = '{} {}'.format(
+            response['status'], _REASONS.get(response['status'], ''))
+        return status.strip(), response['headers'], b''.join(response['body'])
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+def _reasons():
+    from http import HTTPStatus
+    return {s.value: s.phrase for s in HTTPStatus}
+
+
+_REASONS = _reasons()
@@ -0,0 +1,253 @@
+import argparse
+import json
+import math
+import platform
+import sys
+import threading
+import time
+
+from concurrent import futures
+from datetime import datetime
+
+
+SCENARIOS = ('create_auth', 'retrieve_auth', 'update_auth', 'retrieve_user')
+
+
+def percentile(samples, pct):
+    """
+    Returns the `pct` percentile of a list of samples using the nearest-rank
+    method.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = int(math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+def summarize(samples, elapsed, errors=0):
+    """
+    Summarizes a list of request latencies (in seconds) measured over
+    `elapsed` seconds of wall-clock time. Latencies are reported in
+    milliseconds.
+    """
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    count = len(samples)
+    return {
+        'requests': count,
+        'errors': errors,
+        'elapsed': round(elapsed, 3),
+        'rps': round(count / elapsed, 2) if elapsed else None,
+        'mean': ms(sum(samples) / count) if count else None,
+        'p50': ms(percentile(samples, 50)),
+        'p95': ms(percentile(samples, 95)),
+        'p99': ms(percentile(samples, 99)),
+    }
+
+
+class AuthBenchmark(object):
+    """
+    Runs each scenario in :data:`SCENARIOS` against a `webtest.TestApp` using
+    a pool of `concurrency` client threads and reports latency percentiles
+    and throughput per scenario.
+    """
+
+    EMAIL = 'bench.{}@email.com'
+    PASSWORD = 'B3nchPa$$word'
+
+    def __init__(self, test_app, users=10, concurrency=1):
+        self.test_app = test_app
+        self.users = users
+        self.concurrency = concurrency
+        self._user_ids = []
+        self._keys = []
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        """
+        A `webtest.TestApp` for the current client thread.
+        """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            import webtest
+            client = self._local.client = webtest.TestApp(self.test_app.app)
+        return client
+
+    def setup(self):
+        """
+        Replaces the users and tokens collections with a fresh set of
+        confirmed benchmark users and one token per user.
+        """
+        from stackcite.users import auth, models
+        from . import utils
+        models.User.drop_collection()
+        models.AuthToken.drop_collection()
+        models.ConfirmToken.drop_collection()
+        for idx in range(self.users):
+            user = utils.create_user(
+                self.EMAIL.format(idx), self.PASSWORD,
+                groups=(auth.USERS,), save=True)
+            self._user_ids.append(str(user.id))
+            response = self.test_app.post_json(
+                '/auth/', params=self._credentials(idx))
+            self._keys.append(response.json_body['key'])
+
+    def _credentials(self, idx):
+        return {
+            'email': self.EMAIL.format(idx % self.users),
+            'password': self.PASSWORD
+        }
+
+    def _headers(self, idx):
+        key = self._keys[idx % self.users]
+        return {'Authorization': 'key {}'.format(key)}
+
+    def create_auth(self, idx):
+        return self.client.post_json(
+            '/auth/', params=self._credentials(idx), expect_errors=True)
+
+    def retrieve_auth(self, idx):
+        return self.client.get(
+            '/auth/', headers=self._headers(idx), expect_errors=True)
+
+    def update_auth(self, idx):
+        return self.client.put(
+            '/auth/', headers=self._headers(idx), expect_errors=True)
+
+    def retrieve_user(self, idx):
+        user_id = self._user_ids[idx % self.users]
+        return self.client.get(
+            '/{}/'.format(user_id), headers=self._headers(idx),
+            expect_errors=True)
+
+    def _timed(self, request, idx):
+        start = time.perf_counter()
+        response = request(idx)
+        return time.perf_counter() - start, response.status_code >= 400
+
+    def run_scenario(self, name, requests, warmup=0):
+        """
+        Issues `requests` requests for a single scenario and returns a
+        summary of the measured latencies.
+        """
+        request = getattr(self, name)
+        for idx in range(warmup):
+            request(idx)
+        samples, errors = [], 0
+        start = time.perf_counter()
+        with futures.ThreadPoolExecutor(self.concurrency) as executor:
+            for latency, failed in executor.map(
+                    lambda idx: self._timed(request, idx), range(requests)):
+                samples.append(latency)
+                errors += failed
+        elapsed = time.perf_counter() - start
+        return summarize(samples, elapsed, errors)
+
+    def run(self, scenarios=SCENARIOS, requests=100, warmup=10):
+        return {
+            name: self.run_scenario(name, requests, warmup)
+            for name in scenarios
+        }
+
+
+def benchmark_serializers(token, iterations=10000):
+    """
+    Times dumping an :class:`~AuthToken` with a schema built per call (as
+    views used to), with a schema cached by the registry and with a
+    compiled dump function. Returns microseconds per dump for each.
+    """
+    from mongoengine import context_managers
+    from stackcite.users import models, schema
+    from stackcite.users.schema import registry
+
+    cached = registry.SchemaRegistry(compiled=False)
+    compiled = registry.SchemaRegistry(compiled=True)
+    candidates = {
+        'per_request': lambda: schema.AuthToken().dump(token).data,
+        'cached': lambda: cached.dump(schema.AuthToken, token),
+        'compiled': lambda: compiled.dump(schema.AuthToken, token)
+    }
+    results = {}
+    with context_managers.no_dereference(models.AuthToken):
+        for name, dump in candidates.items():
+            dump()
+            start = time.perf_counter()
+            for _ in range(iterations):
+                dump()
+            elapsed = time.perf_counter() - start
+            results[name] = round(elapsed / iterations * 1e6, 3)
+    return results
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the stackcite.users authentication endpoints.')
+    parser.add_argument(
+        '--config', default='development.ini',
+        help='Application settings (default: %(default)s)')
+    parser.add_argument(
+        '--mongo-host',
+        help='Override "mongo.host", e.g. a disposable local mongod')
+    parser.add_argument(
+        '--mongo-db', default='stackcite_users_benchmark',
+        help='Database to benchmark against (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument(
+        '--rounds', type=int, default=12, help='bcrypt cost factor')
+    parser.add_argument(
+        '--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+        help='Run only the given scenario (may be repeated)')
+    parser.add_argument(
+        '--serializers', type=int, default=0, metavar='ITERATIONS',
+        help='Also time AuthToken serialization (microseconds per dump)')
+    parser.add_argument(
+        '--output', help='Write JSON results to a file instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv if argv is not None else sys.argv[1:])
+
+    from .endpoints import APIEndpointTests
+    settings = {
+        'mongo.db': args.mongo_db,
+        'hashing.rounds': args.rounds
+    }
+    if args.mongo_host:
+        settings['mongo.host'] = args.mongo_host
+    test_app = APIEndpointTests.make_app(config=args.config, **settings)
+
+    benchmark = AuthBenchmark(
+        test_app, users=args.users, concurrency=args.concurrency)
+    benchmark.setup()
+    results = benchmark.run(
+        scenarios=args.scenarios or SCENARIOS,
+        requests=args.requests, warmup=args.warmup)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'users': args.users,
+            'rounds': args.rounds
+        },
+        'results': results
+    }
+    if args.serializers:
+        from stackcite.users import models
+        token = models.AuthToken.objects.first()
+        report['serializers'] = benchmark_serializers(token, args.serializers)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
@@ -1,8 +1,13 @@
+import os
 import unittest
 
 from . import layers
 
 
+# Set to "asgi" to run the endpoint tests against the ASGI application
+APP_MODE_VARIABLE = 'STACKCITE_USERS_APP_MODE'
+
+
 class APIEndpointTests(unittest.TestCase):
 
     layer = layers.WSGITestLayer
@@ -11,13 +16,24 @@ class APIEndpointTests(unittest.TestCase):
         self.test_app = self.make_app()
 
     @staticmethod
-    def make_app():
+    def make_app(config='development.ini', **overrides):
         """
-        Instantiates a WSGI application object.
+        Instantiates a WSGI application object. Any keyword arguments override
+        the settings read from `config`.
+
+        If the `STACKCITE_USERS_APP_MODE` environment variable is `asgi`, the
+        ASGI application is instantiated instead and served through an
+        :class:`~ASGIBridge`.
         """
         from pyramid import paster
         import stackcite.users
         import webtest
-        settings = paster.get_appsettings('development.ini')
-        app = stackcite.users.main(global_config=None, **settings)
+        settings = dict(paster.get_appsettings(config))
+        settings.update(overrides)
+        if os.environ.get(APP_MODE_VARIABLE) == 'asgi':
+            from stackcite.users import asgi
+            from .asgi import ASGIBridge
+            app = ASGIBridge(asgi.main(global_config=None, **settings))
+        else:
+            app = stackcite.users.main(global_config=None, **settings)
         return webtest.TestApp(app)
@@ -0,0 +1,46 @@
+import unittest
+
+from stackcite.users import testing
+
+
+async def _asgi_app(scope, receive, send):
+    message = await receive()
+    await send({
+        'type': 'http.response.start',
+        'status': 201,
+        'headers': [(b'content-type', b'text/plain')]
+    })
+    body = scope['method'].encode('ascii') + b' ' + message['body']
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class ASGIBridgeTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from ..asgi import ASGIBridge
+        self.bridge = ASGIBridge(_asgi_app)
+
+    def tearDown(self):
+        self.bridge.close()
+
+    def test_returns_asgi_response(self):
+        """ASGIBridge() returns the ASGI application's status and body
+        """
+        import webtest
+        test_app = webtest.TestApp(self.bridge)
+        response = test_app.post('/users/', params=b'data', status=201)
+        self.assertEqual(b'POST data', response.body)
+
+    def test_build_scope_sets_headers(self):
+        """build_scope() converts CGI-style keys to ASGI headers
+        """
+        from ..asgi import build_scope
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': '/auth/',
+            'HTTP_AUTHORIZATION': 'key abc'
+        }
+        scope = build_scope(environ)
+        self.assertIn((b'authorization', b'key abc'), scope['headers'])
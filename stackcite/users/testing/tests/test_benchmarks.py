@@ -0,0 +1,84 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class PercentileTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_percentile_returns_nearest_rank(self):
+        """percentile() returns the nearest-rank percentile
+        """
+        from .. import benchmarks
+        samples = list(range(1, 101))
+        self.assertEqual(50, benchmarks.percentile(samples, 50))
+        self.assertEqual(95, benchmarks.percentile(samples, 95))
+        self.assertEqual(99, benchmarks.percentile(samples, 99))
+
+    def test_percentile_of_single_sample(self):
+        """percentile() returns the only sample for a single-sample list
+        """
+        from .. import benchmarks
+        result = benchmarks.percentile([7], 99)
+        self.assertEqual(7, result)
+
+    def test_percentile_of_no_samples_returns_none(self):
+        """percentile() returns None for an empty list
+        """
+        from .. import benchmarks
+        result = benchmarks.percentile([], 50)
+        self.assertIsNone(result)
+
+
+class SummarizeTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_summarize_reports_milliseconds(self):
+        """summarize() reports latencies in milliseconds
+        """
+        from .. import benchmarks
+        result = benchmarks.summarize([0.001, 0.002, 0.003], 1.0)
+        self.assertEqual(2.0, result['p50'])
+
+    def test_summarize_reports_requests_per_second(self):
+        """summarize() reports requests per second
+        """
+        from .. import benchmarks
+        result = benchmarks.summarize([0.1] * 10, 2.0)
+        self.assertEqual(5.0, result['rps'])
+
+    def test_summarize_reports_errors(self):
+        """summarize() reports the number of failed requests
+        """
+        from .. import benchmarks
+        result = benchmarks.summarize([0.1], 1.0, errors=1)
+        self.assertEqual(1, result['errors'])
+
+    def test_summarize_is_json_serializable(self):
+        """summarize() returns JSON-serializable results
+        """
+        import json
+        from .. import benchmarks
+        result = benchmarks.summarize([], 0)
+        json.dumps(result)
+
+
+class BenchmarkSerializersTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def test_reports_each_serializer(self):
+        """benchmark_serializers() reports a timing for every serializer
+        """
+        from stackcite.users import models
+        from .. import benchmarks
+        models.User.drop_collection()
+        models.AuthToken.drop_collection()
+        user = testing.utils.create_user(
+            'test@email.com', 'T3stPa$$word', save=True)
+        token = testing.utils.create_auth_token(user, save=True)
+        result = benchmarks.benchmark_serializers(token, iterations=10)
+        expected = {'per_request', 'cached', 'compiled'}
+        self.assertEqual(expected, set(result))
@@ -33,3 +33,16 @@ def create_request(key=None):
     request = pyramid_testing.DummyRequest()
     request.headers.update(api_header)
     return request
+
+
+class FakeClock(object):
+    """
+    A clock for time-dependent tests. Pass it where a `clock` is accepted and
+    set `now` to move time forward.
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
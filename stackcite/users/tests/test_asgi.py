@@ -0,0 +1,297 @@
+import asyncio
+import unittest
+
+from stackcite.users import testing
+
+
+def _wsgi_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    start_response('202 Accepted', [('Content-Type', 'text/plain')])
+    return [environ['REQUEST_METHOD'].encode('ascii'), b' ', body]
+
+
+class _TokenStore(object):
+
+    def __init__(self):
+        self.keys = []
+        self.closed = False
+
+    async def get(self, key):
+        self.keys.append(key)
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+class _StreamedBody(object):
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def _request(app, scope, body=b'', chunks=None):
+    messages = []
+    chunks = list(chunks) if chunks is not None else [body]
+    received = []
+
+    async def receive():
+        received.append(chunks[len(received)])
+        return {
+            'type': 'http.request',
+            'body': received[-1],
+            'more_body': len(received) < len(chunks)}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+
+def _scope(method, path, headers=()):
+    return {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(k.encode(), v.encode()) for k, v in headers]
+    }
+
+
+class BuildEnvironTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_sets_request_line(self):
+        """build_environ() sets the method, path and query string
+        """
+        from ..asgi import build_environ
+        scope = _scope('PUT', '/users/')
+        scope['query_string'] = b'limit=10'
+        environ = build_environ(scope, b'')
+        result = (
+            environ['REQUEST_METHOD'],
+            environ['PATH_INFO'],
+            environ['QUERY_STRING'])
+        self.assertEqual(('PUT', '/users/', 'limit=10'), result)
+
+    def test_sets_headers(self):
+        """build_environ() converts headers to CGI-style keys
+        """
+        from ..asgi import build_environ
+        scope = _scope('GET', '/', [
+            ('Authorization', 'key abc'),
+            ('Content-Type', 'application/json')])
+        environ = build_environ(scope, b'')
+        result = (environ['HTTP_AUTHORIZATION'], environ['CONTENT_TYPE'])
+        self.assertEqual(('key abc', 'application/json'), result)
+
+    def test_sets_body(self):
+        """build_environ() exposes the body as `wsgi.input`
+        """
+        from ..asgi import build_environ
+        environ = build_environ(_scope('POST', '/'), b'{"a": 1}')
+        result = environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
+        self.assertEqual(b'{"a": 1}', result)
+
+
+class AsyncTokenStoreTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from stackcite.users import auth
+        auth.TOKEN_CACHE.configure(size=10, ttl=30)
+        auth.NEGATIVE_CACHE.configure(size=10, ttl=5)
+        self.finds = []
+
+    def tearDown(self):
+        from stackcite.users import auth
+        auth.TOKEN_CACHE.configure(size=0, ttl=30)
+        auth.NEGATIVE_CACHE.configure(size=0, ttl=5)
+
+    def make_store(self, son=None):
+        from ..asgi import AsyncTokenStore
+        finds = self.finds
+
+        class FakeStore(AsyncTokenStore):
+
+            async def _find(self, key):
+                finds.append(key)
+                await asyncio.sleep(0)
+                return son
+
+        return FakeStore('localhost', 'test')
+
+    def test_invalid_key_is_not_looked_up(self):
+        """AsyncTokenStore.get() does not query for an invalid key
+        """
+        result = asyncio.run(self.make_store().get('abc'))
+        self.assertIsNone(result)
+        self.assertEqual([], self.finds)
+
+    def test_missing_key_is_negatively_cached(self):
+        """AsyncTokenStore.get() queries once for a key that does not exist
+        """
+        from stackcite.users.auth import utils
+        key = utils.gen_key()
+        store = self.make_store()
+
+        async def lookups():
+            await store.get(key)
+            await store.get(key)
+
+        asyncio.run(lookups())
+        self.assertEqual([key], self.finds)
+
+    def test_concurrent_lookups_share_a_query(self):
+        """AsyncTokenStore.get() shares one query between concurrent lookups
+        """
+        from stackcite.users.auth import utils
+        key = utils.gen_key()
+        store = self.make_store()
+
+        async def lookups():
+            return await asyncio.gather(store.get(key), store.get(key))
+
+        self.assertEqual([None, None], asyncio.run(lookups()))
+        self.assertEqual([key], self.finds)
+
+    def test_concurrent_lookups_get_own_token(self):
+        """AsyncTokenStore.get() returns a different token to each caller sharing a query
+        """
+        from datetime import datetime
+        from bson import ObjectId
+        from stackcite.users.auth import utils
+        key = utils.gen_key()
+        now = datetime.utcnow().replace(microsecond=0)
+        store = self.make_store({
+            '_id': key,
+            'user': {'_id': ObjectId(), 'groups': ['users']},
+            'issued': now,
+            'touched': now})
+
+        async def lookups():
+            return await asyncio.gather(store.get(key), store.get(key))
+
+        first, second = asyncio.run(lookups())
+        self.assertEqual([key], self.finds)
+        self.assertEqual(key, first.key)
+        self.assertEqual(key, second.key)
+        self.assertIsNot(first, second)
+
+
+class ASGIApplicationTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from ..asgi import ASGIApplication
+        self.token_store = _TokenStore()
+        self.app = ASGIApplication(_wsgi_app, self.token_store, workers=2)
+
+    def tearDown(self):
+        self.app.executor.shutdown()
+
+    def test_proxies_requests_to_wsgi_app(self):
+        """ASGIApplication() hands non-token requests to the WSGI app
+        """
+        messages = _request(self.app, _scope('POST', '/users/'), b'data')
+        body = b''.join(m['body'] for m in messages[1:])
+        self.assertEqual((202, b'POST data'), (messages[0]['status'], body))
+
+    def test_streams_wsgi_response(self):
+        """ASGIApplication() sends each chunk of a WSGI response as it comes
+        """
+        body = _StreamedBody([b'{"a": 1}\n', b'{"b": 2}\n'])
+
+        def wsgi_app(environ, start_response):
+            headers = [('Content-Type', 'application/x-ndjson')]
+            start_response('200 OK', headers)
+            return body
+
+        self.app.wsgi_app = wsgi_app
+        messages = _request(self.app, _scope('POST', '/import/'))
+        result = [(m['body'], m.get('more_body', False))
+                  for m in messages[1:]]
+        expected = [
+            (b'{"a": 1}\n', True),
+            (b'{"b": 2}\n', True),
+            (b'', False)]
+        self.assertEqual(expected, result)
+        self.assertTrue(body.closed)
+
+    def test_rejects_large_body_early(self):
+        """ASGIApplication() answers 413 once the body passes json.max_body_size
+        """
+        from stackcite.users import codec
+        codec.CODEC.configure(max_body_size=4)
+        self.addCleanup(codec.CODEC.configure)
+
+        chunks = [b'{"a":', b' 1', b'}']
+        received, messages = [], []
+
+        async def receive():
+            received.append(chunks[len(received)])
+            return {
+                'type': 'http.request',
+                'body': received[-1],
+                'more_body': len(received) < len(chunks)}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.app(_scope('POST', '/users/'), receive, send))
+        self.assertEqual(413, messages[0]['status'])
+        self.assertEqual(1, len(received))
+
+    def test_does_not_limit_import_body(self):
+        """ASGIApplication() passes import bodies of any size to the WSGI app
+        """
+        from stackcite.users import codec
+        codec.CODEC.configure(max_body_size=4)
+        self.addCleanup(codec.CODEC.configure)
+        messages = _request(self.app, _scope('POST', '/import/'),
+                            chunks=[b'{"a":', b' 1}'])
+        body = b''.join(m['body'] for m in messages[1:])
+        self.assertEqual((202, b'POST {"a": 1}'),
+                         (messages[0]['status'], body))
+
+    def test_unknown_token_falls_back_to_wsgi_app(self):
+        """ASGIApplication() hands unknown tokens to the WSGI app
+        """
+        scope = _scope('GET', '/auth/', [('Authorization', 'key abc')])
+        messages = _request(self.app, scope)
+        self.assertEqual(202, messages[0]['status'])
+
+    def test_looks_up_token_on_event_loop(self):
+        """ASGIApplication() looks up `GET /auth/` tokens asynchronously
+        """
+        scope = _scope('GET', '/auth/', [('Authorization', 'key abc')])
+        _request(self.app, scope)
+        self.assertEqual(['abc'], self.token_store.keys)
+
+    def test_lifespan_shutdown_closes_token_store(self):
+        """ASGIApplication() closes the token store on shutdown
+        """
+        events = iter([
+            {'type': 'lifespan.startup'},
+            {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(events)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.app({'type': 'lifespan'}, receive, send))
+        self.assertTrue(self.token_store.closed)
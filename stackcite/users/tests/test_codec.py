@@ -0,0 +1,128 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class CodecTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import codec
+        self.codecs = [codec.StdlibCodec()]
+        if codec.orjson is not None:
+            self.codecs.append(codec.OrjsonCodec())
+
+    def test_dumps_object_ids(self):
+        """Codec.dumps() encodes ObjectIds as strings
+        """
+        from bson import ObjectId
+        oid = ObjectId()
+        for codec in self.codecs:
+            result = codec.loads(codec.dumps({'id': oid}))
+            self.assertEqual({'id': str(oid)}, result)
+
+    def test_dumps_naive_datetimes_as_utc(self):
+        """Codec.dumps() encodes naive datetimes as UTC ISO 8601 strings
+        """
+        from datetime import datetime
+        value = datetime(2020, 1, 2, 3, 4, 5)
+        for codec in self.codecs:
+            result = codec.loads(codec.dumps([value]))
+            self.assertEqual(['2020-01-02T03:04:05+00:00'], result)
+
+    def test_loads_rejects_invalid_json(self):
+        """Codec.loads() raises ValueError for invalid JSON
+        """
+        for codec in self.codecs:
+            with self.assertRaises(ValueError):
+                codec.loads(b'{"a": ')
+
+    def test_configure_rejects_unknown_codec(self):
+        """Codec.configure() raises exception for an unknown codec
+        """
+        from .. import codec
+        with self.assertRaises(ValueError):
+            codec.Codec('yaml')
+
+    def test_configure_json_uses_stdlib(self):
+        """Codec.configure() selects the standard library for 'json'
+        """
+        from .. import codec
+        self.assertEqual('json', codec.Codec('json').name)
+
+
+class JSONBodyTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import codec
+        codec.CODEC.configure('auto', max_body_size=16)
+
+    def tearDown(self):
+        from .. import codec
+        codec.CODEC.configure('auto')
+
+    def _request(self, body):
+        from pyramid.request import Request
+        return Request.blank('/', method='POST', body=body)
+
+    def test_parses_body(self):
+        """json_body() parses the request body
+        """
+        from ..codec import json_body
+        result = json_body(self._request(b'{"a": 1}'))
+        self.assertEqual({'a': 1}, result)
+
+    def test_rejects_oversized_body(self):
+        """json_body() raises 413 for a body above max_body_size
+        """
+        from pyramid import httpexceptions
+        from ..codec import json_body
+        with self.assertRaises(httpexceptions.HTTPRequestEntityTooLarge):
+            json_body(self._request(b'{"a": "' + b'x' * 32 + b'"}'))
+
+
+class JSONRendererTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_renders_json_bytes(self):
+        """JSONRenderer() renders values as JSON with a JSON content type
+        """
+        from pyramid import testing as pyramid_testing
+        from ..codec import JSONRenderer
+        request = pyramid_testing.DummyRequest()
+        render = JSONRenderer()(None)
+        result = render({'a': 1}, {'request': request})
+        self.assertEqual(b'{"a":1}', result.replace(b' ', b''))
+        self.assertEqual('application/json', request.response.content_type)
+
+    def test_renders_json_method(self):
+        """JSONRenderer() renders objects with a __json__() method
+        """
+        from pyramid import testing as pyramid_testing
+        from ..codec import JSONRenderer
+
+        class Thing(object):
+            def __json__(self, request):
+                return {'thing': True}
+
+        render = JSONRenderer()(None)
+        result = render(
+            {'a': Thing()}, {'request': pyramid_testing.DummyRequest()})
+        self.assertEqual(b'{"a":{"thing":true}}', result.replace(b' ', b''))
+
+    def test_renders_with_adapter(self):
+        """JSONRenderer() renders objects with an adapter for their type
+        """
+        from decimal import Decimal
+        from pyramid import testing as pyramid_testing
+        from ..codec import JSONRenderer
+        renderer = JSONRenderer()
+        renderer.add_adapter(Decimal, lambda obj, request: str(obj))
+        render = renderer(None)
+        result = render(
+            {'a': Decimal('1.5')}, {'request': pyramid_testing.DummyRequest()})
+        self.assertEqual(b'{"a":"1.5"}', result.replace(b' ', b''))
@@ -0,0 +1,115 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class ClientOptionsTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_maps_settings_to_client_options(self):
+        """client_options() converts 'mongo.*' settings to MongoClient options
+        """
+        from .. import db
+        settings = {
+            'mongo.max_pool_size': '50',
+            'mongo.wait_queue_timeout_ms': '2000',
+            'mongo.appname': 'stackcite-users'}
+        expected = {
+            'maxPoolSize': 50,
+            'waitQueueTimeoutMS': 2000,
+            'appname': 'stackcite-users'}
+        self.assertEqual(expected, db.client_options(settings))
+
+    def test_splits_compressors(self):
+        """client_options() accepts comma or space separated compressors
+        """
+        from .. import db
+        settings = {'mongo.compressors': 'zstd, zlib'}
+        result = db.client_options(settings)
+        self.assertEqual(['zstd', 'zlib'], result['compressors'])
+
+    def test_skips_unset_options(self):
+        """client_options() leaves out options that are not set
+        """
+        from .. import db
+        settings = {'mongo.host': 'mongodb://localhost', 'mongo.appname': ''}
+        self.assertEqual({}, db.client_options(settings))
+
+
+class ReadRouterTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_reads_default_to_primary(self):
+        """ReadRouter routes every operation to the primary by default
+        """
+        from .. import db
+        router = db.ReadRouter()
+        for operation in db.READ_OPERATIONS:
+            self.assertTrue(router.on_primary(operation))
+
+    def test_configure_sets_max_staleness(self):
+        """ReadRouter.configure() bounds secondary reads by max_staleness
+        """
+        from .. import db
+        router = db.ReadRouter(
+            preferences={'token': 'secondaryPreferred'}, max_staleness=90)
+        self.assertFalse(router.on_primary('token'))
+        result = router.read_preference('token').max_staleness
+        self.assertEqual(90, result)
+
+    def test_configure_rejects_unknown_mode(self):
+        """ReadRouter.configure() raises exception for an unknown mode
+        """
+        from .. import db
+        with self.assertRaises(ValueError):
+            db.ReadRouter(preferences={'token': 'secondaries'})
+
+    def test_configure_rejects_small_max_staleness(self):
+        """ReadRouter.configure() raises exception for max_staleness below 90
+        """
+        from .. import db
+        with self.assertRaises(ValueError):
+            db.ReadRouter(max_staleness=30)
+
+
+class ReadRouterIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from .. import db, models
+        models.User.drop_collection()
+        self.router = db.ReadRouter(preferences={'user': 'secondaryPreferred'})
+
+    def test_get_returns_document(self):
+        """ReadRouter.get() fetches a document with a secondary read preference
+        """
+        from .. import models
+        user = models.User.new('test@email.com', 'T3stPa$$word', save=True)
+        result = self.router.get(models.User, 'user', id=user.id)
+        self.assertEqual(user.id, result.id)
+
+    def test_get_falls_back_to_primary_on_miss(self):
+        """ReadRouter.get() repeats a missed read on the primary
+        """
+        import mongoengine
+        from .. import metrics, models
+        before = metrics.REPLICA_READ_FALLBACKS.value(operation='user')
+        with self.assertRaises(mongoengine.DoesNotExist):
+            self.router.get(models.User, 'user', email='none@email.com')
+        result = metrics.REPLICA_READ_FALLBACKS.value(operation='user')
+        self.assertEqual(before + 1, result)
+
+    def test_get_without_fallback_raises_on_miss(self):
+        """ReadRouter.get() does not repeat reads if fallback is disabled
+        """
+        import mongoengine
+        from .. import metrics, models
+        self.router.configure({'user': 'secondaryPreferred'}, fallback=False)
+        before = metrics.REPLICA_READ_FALLBACKS.value(operation='user')
+        with self.assertRaises(mongoengine.DoesNotExist):
+            self.router.get(models.User, 'user', email='none@email.com')
+        result = metrics.REPLICA_READ_FALLBACKS.value(operation='user')
+        self.assertEqual(before, result)
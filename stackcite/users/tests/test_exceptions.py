@@ -13,3 +13,21 @@ class AuthenticationErrorBaseTests(unittest.TestCase):
         error = AuthenticationError()
         result = error.message
         self.assertEqual(expected, result)
+
+
+class ServiceUnavailableErrorTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_default_message(self):
+        from ..exceptions import ServiceUnavailableError
+        expected = 'Service temporarily unavailable'
+        error = ServiceUnavailableError()
+        result = error.message
+        self.assertEqual(expected, result)
+
+    def test_retry_after(self):
+        from ..exceptions import ServiceUnavailableError
+        error = ServiceUnavailableError(retry_after=5)
+        result = error.retry_after
+        self.assertEqual(5, result)
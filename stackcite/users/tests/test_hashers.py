@@ -0,0 +1,132 @@
+import unittest
+
+from stackcite.api import testing
+
+
+class ScryptHasherTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import hashers
+        self.hasher = hashers.ScryptHasher(n=2 ** 4)
+
+    def test_encode_is_self_describing(self):
+        """ScryptHasher.encode() includes the algorithm and parameters
+        """
+        encoded = self.hasher.encode('T3stPa$$word', self.hasher.salt())
+        self.assertTrue(encoded.startswith('$scrypt$ln=4,r=8,p=1$'))
+
+    def test_verify_accepts_correct_password(self):
+        """ScryptHasher.verify() returns True for the correct password
+        """
+        encoded = self.hasher.encode('T3stPa$$word', self.hasher.salt())
+        self.assertTrue(self.hasher.verify('T3stPa$$word', encoded))
+
+    def test_verify_rejects_wrong_password(self):
+        """ScryptHasher.verify() returns False for a wrong password
+        """
+        encoded = self.hasher.encode('T3stPa$$word', self.hasher.salt())
+        self.assertFalse(self.hasher.verify('Wr0ngPa$$word', encoded))
+
+    def test_verify_uses_stored_parameters(self):
+        """ScryptHasher.verify() checks hashes made with other parameters
+        """
+        encoded = self.hasher.encode('T3stPa$$word', self.hasher.salt())
+        self.hasher.configure(n=2 ** 5)
+        self.assertTrue(self.hasher.verify('T3stPa$$word', encoded))
+        self.assertTrue(self.hasher.needs_rehash(encoded))
+
+    def test_verify_rejects_malformed_hash(self):
+        """ScryptHasher.verify() returns False for a malformed hash
+        """
+        self.assertFalse(self.hasher.verify('T3stPa$$word', '$scrypt$x'))
+
+    def test_configure_rejects_invalid_n(self):
+        """ScryptHasher.configure() raises exception if n is not a power of 2
+        """
+        with self.assertRaises(ValueError):
+            self.hasher.configure(n=1000)
+
+
+class Argon2HasherTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    ENCODED = '$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$ZGlnZXN0'
+
+    def setUp(self):
+        from .. import hashers
+        self.hasher = hashers.Argon2Hasher()
+        # As if argon2-cffi were not installed
+        argon2, hashers.argon2 = hashers.argon2, None
+        self.addCleanup(setattr, hashers, 'argon2', argon2)
+
+    def test_verify_without_argon2_returns_false(self):
+        """Argon2Hasher.verify() returns False without argon2-cffi
+        """
+        self.assertFalse(self.hasher.verify('T3stPa$$word', self.ENCODED))
+
+    def test_needs_rehash_without_argon2_returns_false(self):
+        """Argon2Hasher.needs_rehash() returns False without argon2-cffi
+        """
+        self.assertFalse(self.hasher.needs_rehash(self.ENCODED))
+
+
+class HasherRegistryTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import hashers, hashing
+        hashing.set_rounds(4)
+        self.registry = hashers.HasherRegistry(
+            hashers.BcryptHasher(), hashers.ScryptHasher(n=2 ** 4))
+
+    def tearDown(self):
+        from .. import hashing
+        hashing.set_rounds(12)
+        hashing.set_rehash_policy('upgrade')
+
+    def test_hash_uses_default_algorithm(self):
+        """HasherRegistry.hash() uses the configured algorithm
+        """
+        self.registry.configure('scrypt')
+        encoded = self.registry.hash('T3stPa$$word')
+        self.assertEqual('scrypt', self.registry.identify(encoded).name)
+
+    def test_verify_identifies_algorithm(self):
+        """HasherRegistry.verify() checks hashes made by any algorithm
+        """
+        encoded = self.registry.hash('T3stPa$$word')
+        self.registry.configure('scrypt')
+        self.assertTrue(self.registry.verify('T3stPa$$word', encoded))
+        self.assertFalse(self.registry.verify('Wr0ngPa$$word', encoded))
+
+    def test_verify_rejects_unknown_algorithm(self):
+        """HasherRegistry.verify() returns False for an unknown hash format
+        """
+        self.assertFalse(self.registry.verify('T3stPa$$word', '$md5$abc'))
+
+    def test_needs_rehash_for_other_algorithm(self):
+        """HasherRegistry.needs_rehash() is True for another algorithm
+        """
+        encoded = self.registry.hash('T3stPa$$word')
+        self.assertFalse(self.registry.needs_rehash(encoded))
+        self.registry.configure('scrypt')
+        self.assertTrue(self.registry.needs_rehash(encoded))
+
+    def test_needs_rehash_never_policy(self):
+        """HasherRegistry.needs_rehash() is False under the 'never' policy
+        """
+        from .. import hashing
+        encoded = self.registry.hash('T3stPa$$word')
+        self.registry.configure('scrypt')
+        hashing.set_rehash_policy('never')
+        self.assertFalse(self.registry.needs_rehash(encoded))
+
+    def test_configure_rejects_unknown_algorithm(self):
+        """HasherRegistry.configure() raises exception for unknown algorithms
+        """
+        with self.assertRaises(ValueError):
+            self.registry.configure('md5')
@@ -0,0 +1,168 @@
+import threading
+import unittest
+
+from stackcite.users import testing
+
+
+class HashingPoolTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import hashing
+        self.pool = hashing.HashingPool(
+            kind='thread', workers=1, queue_depth=0, retry_after=3)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_submit_runs_on_worker_thread(self):
+        """HashingPool.submit() runs work on a pool thread and returns its result
+        """
+        result = self.pool.submit(threading.get_ident)
+        self.assertNotEqual(threading.get_ident(), result)
+
+    def test_inline_pool_runs_on_calling_thread(self):
+        """HashingPool of kind 'none' runs work on the calling thread
+        """
+        self.pool.configure('none', 1, 0)
+        result = self.pool.submit(threading.get_ident)
+        self.assertEqual(threading.get_ident(), result)
+
+    def test_saturated_pool_raises_exception(self):
+        """HashingPool.submit() raises exception when the pool is saturated
+        """
+        from stackcite.users import exceptions as exc
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=self.pool.submit, args=(block,))
+        worker.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(exc.ServiceUnavailableError) as ctx:
+                self.pool.submit(int)
+            self.assertEqual(3, ctx.exception.retry_after)
+        finally:
+            release.set()
+            worker.join(5)
+
+    def test_pending_returns_to_zero(self):
+        """HashingPool.pending returns to 0 once work completes
+        """
+        self.pool.submit(int)
+        self.pool.shutdown()
+        self.assertEqual(0, self.pool.pending)
+
+    def test_configure_rejects_invalid_kind(self):
+        """HashingPool.configure() raises exception for an invalid kind
+        """
+        with self.assertRaises(ValueError):
+            self.pool.configure('invalid', 1, 0)
+
+
+class SetRoundsTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def tearDown(self):
+        from .. import hashing
+        hashing.set_rounds(12)
+
+    def test_gensalt_uses_configured_rounds(self):
+        """gensalt() generates a salt at the configured cost factor
+        """
+        from .. import hashing
+        hashing.set_rounds(5)
+        result = hashing.gensalt()
+        self.assertTrue(result.startswith(b'$2b$05$'))
+
+    def test_set_rounds_rejects_invalid_cost(self):
+        """set_rounds() raises exception for an invalid cost factor
+        """
+        from .. import hashing
+        with self.assertRaises(ValueError):
+            hashing.set_rounds(3)
+
+
+class RehashTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def tearDown(self):
+        from .. import hashing
+        hashing.set_rounds(12)
+        hashing.set_rehash_policy('upgrade')
+
+    def test_cost_parses_salt(self):
+        """cost() returns the cost factor of a bcrypt salt
+        """
+        from .. import hashing
+        self.assertEqual(12, hashing.cost('$2b$12$abcdefghijklmnopqrstuv'))
+
+    def test_cost_of_invalid_salt_returns_none(self):
+        """cost() returns None for a value that is not a bcrypt salt
+        """
+        from .. import hashing
+        self.assertIsNone(hashing.cost('invalid'))
+
+    def test_upgrade_rehashes_lower_cost(self):
+        """needs_rehash() is True for a lower cost under the 'upgrade' policy
+        """
+        from .. import hashing
+        hashing.set_rounds(12)
+        self.assertTrue(hashing.needs_rehash('$2b$10$abc'))
+        self.assertFalse(hashing.needs_rehash('$2b$13$abc'))
+
+    def test_always_rehashes_other_cost(self):
+        """needs_rehash() is True for any other cost under the 'always' policy
+        """
+        from .. import hashing
+        hashing.set_rounds(12)
+        hashing.set_rehash_policy('always')
+        self.assertTrue(hashing.needs_rehash('$2b$13$abc'))
+        self.assertFalse(hashing.needs_rehash('$2b$12$abc'))
+
+    def test_never_rehashes(self):
+        """needs_rehash() is always False under the 'never' policy
+        """
+        from .. import hashing
+        hashing.set_rounds(12)
+        hashing.set_rehash_policy('never')
+        self.assertFalse(hashing.needs_rehash('$2b$04$abc'))
+
+    def test_set_rehash_policy_rejects_invalid_policy(self):
+        """set_rehash_policy() raises exception for an unknown policy
+        """
+        from .. import hashing
+        with self.assertRaises(ValueError):
+            hashing.set_rehash_policy('sometimes')
+
+
+class CalibrateTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_unreachable_target_returns_min_rounds(self):
+        """calibrate() returns min_rounds if even that is slower than the target
+        """
+        from .. import hashing
+        result = hashing.calibrate(0.001, min_rounds=4, max_rounds=6)
+        self.assertEqual(4, result)
+
+    def test_generous_target_returns_max_rounds(self):
+        """calibrate() returns max_rounds if that is faster than the target
+        """
+        from .. import hashing
+        result = hashing.calibrate(60000, min_rounds=4, max_rounds=6)
+        self.assertEqual(6, result)
+
+    def test_calibrate_rejects_invalid_range(self):
+        """calibrate() raises exception for an invalid cost range
+        """
+        from .. import hashing
+        with self.assertRaises(ValueError):
+            hashing.calibrate(100, min_rounds=12, max_rounds=10)
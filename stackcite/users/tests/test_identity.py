@@ -0,0 +1,257 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class FakeField(object):
+
+    def __init__(self, unique=False, primary_key=False):
+        self.unique = unique
+        self.primary_key = primary_key
+
+
+class FakeQuerySet(object):
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = 0
+
+    def get(self, **query):
+        self.queries += 1
+        (name, value), = query.items()
+        name = 'pk' if name == 'id' else name
+        for document in self.documents:
+            if getattr(document, name) == value:
+                return document
+        raise LookupError(value)
+
+
+class FakeDocument(object):
+
+    _fields = {
+        'id': FakeField(primary_key=True),
+        'email': FakeField(unique=True),
+        'name': FakeField()}
+
+    def __init__(self, pk, email, name='', log=None):
+        self.pk = pk
+        self.email = email
+        self.name = name
+        self.log = log if log is not None else []
+
+    def save(self):
+        self.log.append(('save', self.pk))
+
+    def delete(self):
+        self.log.append(('delete', self.pk))
+
+
+class IdentityMapTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        self.document = FakeDocument(1, 'test@email.com', 'Test')
+        FakeDocument.objects = FakeQuerySet([self.document])
+
+    def test_repeated_lookups_by_id_query_once(self):
+        """IdentityMap.get() loads a document once per id
+        """
+        from .. import identity
+        identity_map = identity.IdentityMap()
+        identity_map.get(FakeDocument, id=1)
+        result = identity_map.get(FakeDocument, id=1)
+        self.assertIs(self.document, result)
+        self.assertEqual(1, FakeDocument.objects.queries)
+        self.assertEqual(1, identity_map.hits)
+
+    def test_lookup_by_unique_field_matches_id(self):
+        """IdentityMap.get() serves lookups by id after a lookup by email
+        """
+        from .. import identity
+        identity_map = identity.IdentityMap()
+        identity_map.get(FakeDocument, email='test@email.com')
+        identity_map.get(FakeDocument, id=1)
+        self.assertEqual(1, FakeDocument.objects.queries)
+
+    def test_other_fields_always_query(self):
+        """IdentityMap.get() queries every time for fields that are not unique
+        """
+        from .. import identity
+        identity_map = identity.IdentityMap()
+        identity_map.get(FakeDocument, name='Test')
+        identity_map.get(FakeDocument, name='Test')
+        self.assertEqual(2, FakeDocument.objects.queries)
+        self.assertEqual(0, identity_map.hits)
+
+    def test_uses_given_loader(self):
+        """IdentityMap.get() loads documents with 'load' if it is given
+        """
+        from .. import identity
+        identity_map = identity.IdentityMap()
+        result = identity_map.get(
+            FakeDocument, lambda: self.document, email='test@email.com')
+        self.assertIs(self.document, result)
+        self.assertEqual(0, FakeDocument.objects.queries)
+
+    def test_flush_applies_changes_once_in_order(self):
+        """IdentityMap.flush() saves and deletes each document once, in order
+        """
+        from .. import identity
+        log = []
+        user = FakeDocument(1, 'test@email.com', log=log)
+        token = FakeDocument(2, 'token@email.com', log=log)
+        identity_map = identity.IdentityMap()
+        identity_map.schedule('save', user)
+        identity_map.schedule('delete', token)
+        identity_map.schedule('save', user)
+        identity_map.flush()
+        self.assertEqual([('save', 1), ('delete', 2)], log)
+
+    def test_flush_runs_callbacks_after_writes(self):
+        """IdentityMap.flush() runs 'after_flush' callbacks after writing
+        """
+        from .. import identity
+        log = []
+        identity_map = identity.IdentityMap()
+        identity_map.after_flush(lambda: log.append('callback'))
+        identity_map.schedule('save', FakeDocument(1, '', log=log))
+        identity_map.flush()
+        self.assertEqual([('save', 1), 'callback'], log)
+
+    def test_add_replaces_loaded_document(self):
+        """IdentityMap.add() replaces the copy of a document loaded before
+        """
+        from .. import identity
+        identity_map = identity.IdentityMap()
+        identity_map.get(FakeDocument, id=1)
+        updated = FakeDocument(1, 'new@email.com', 'Test')
+        identity_map.add(updated)
+        self.assertIs(updated, identity_map.get(FakeDocument, id=1))
+        self.assertIs(
+            updated, identity_map.get(FakeDocument, email='new@email.com'))
+        self.assertEqual(1, FakeDocument.objects.queries)
+
+    def test_add_forgets_old_unique_values(self):
+        """IdentityMap.add() drops lookups by unique values a document no longer has
+        """
+        from .. import identity
+        identity_map = identity.IdentityMap()
+        identity_map.get(FakeDocument, id=1)
+        identity_map.add(FakeDocument(1, 'new@email.com', 'Test'))
+        identity_map.get(FakeDocument, email='test@email.com')
+        self.assertEqual(2, FakeDocument.objects.queries)
+
+    def test_deleted_documents_leave_the_map(self):
+        """IdentityMap.flush() forgets documents it deleted
+        """
+        from .. import identity
+        identity_map = identity.IdentityMap()
+        identity_map.get(FakeDocument, id=1)
+        identity_map.schedule('delete', self.document)
+        identity_map.flush()
+        identity_map.get(FakeDocument, id=1)
+        self.assertEqual(2, FakeDocument.objects.queries)
+
+
+class IdentityFunctionTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_writes_immediately_outside_a_request(self):
+        """save() and delete() write immediately without an identity map
+        """
+        from .. import identity
+        log = []
+        document = FakeDocument(1, '', log=log)
+        identity.save(document)
+        identity.delete(document)
+        self.assertEqual([('save', 1), ('delete', 1)], log)
+
+
+class IdentityMapTweenTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def make_tween(self, status_code, log, document=None):
+        from pyramid import testing as pyramid_testing
+        from pyramid.response import Response
+        from .. import identity
+
+        def handler(request):
+            identity.save(document or FakeDocument(1, '', log=log))
+            identity.after_flush(lambda: log.append('callback'))
+            log.append('handled')
+            return Response(status=status_code)
+
+        tween = identity.identity_map_tween_factory(handler, None)
+        return tween, pyramid_testing.DummyRequest()
+
+    def test_flushes_successful_requests(self):
+        """identity_map_tween() writes scheduled changes after the view
+        """
+        log = []
+        tween, request = self.make_tween(200, log)
+        tween(request)
+        self.assertEqual(['handled', ('save', 1), 'callback'], log)
+
+    def test_discards_failed_requests(self):
+        """identity_map_tween() drops scheduled changes of failed requests
+        """
+        log = []
+        tween, request = self.make_tween(400, log)
+        tween(request)
+        self.assertEqual(['handled'], log)
+
+    def test_failed_flush_fails_request(self):
+        """identity_map_tween() raises the flush error instead of the response
+        """
+        log = []
+
+        class FailingDocument(FakeDocument):
+            def save(self):
+                raise OSError('Connection refused')
+
+        document = FailingDocument(1, '', log=log)
+        tween, request = self.make_tween(200, log, document)
+        with self.assertRaises(OSError):
+            tween(request)
+        self.assertEqual(['handled'], log)
+
+    def test_removes_map_after_request(self):
+        """identity_map_tween() clears the current identity map when done
+        """
+        from .. import identity
+        tween, request = self.make_tween(200, [])
+        tween(request)
+        self.assertIsNone(identity.current())
+
+
+class IdentityMapIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import models
+        models.User.drop_collection()
+        models.ConfirmToken.drop_collection()
+        self.user = models.User.new(
+            'test@email.com', 'T3stPa$$word', save=True)
+
+    def tearDown(self):
+        from .. import identity
+        identity._LOCAL.identity_map = None
+
+    def test_confirm_user_waits_for_flush(self):
+        """ConfirmToken.confirm_user() writes on flush within a request
+        """
+        from stackcite.users import models
+        from .. import identity
+        token = models.ConfirmToken.new(self.user, save=True)
+        identity_map = identity._LOCAL.identity_map = identity.IdentityMap()
+        token.confirm_user()
+        self.assertFalse(models.User.objects.get(id=self.user.id).confirmed)
+        identity_map.flush()
+        self.assertTrue(models.User.objects.get(id=self.user.id).confirmed)
+        self.assertEqual(
+            0, models.ConfirmToken.objects(_key=token.key).count())
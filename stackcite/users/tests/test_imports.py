@@ -0,0 +1,105 @@
+import json
+import unittest
+
+from stackcite.users import testing
+
+
+def _lines(*records):
+    return [json.dumps(r) for r in records]
+
+
+class UserImporterUnitTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_configure_rejects_negative_workers(self):
+        """UserImporter.configure() raises exception for negative workers
+        """
+        from ..imports import UserImporter
+        with self.assertRaises(ValueError):
+            UserImporter(workers=-1)
+
+    def test_configure_rejects_empty_batch(self):
+        """UserImporter.configure() raises exception for a batch size below 1
+        """
+        from ..imports import UserImporter
+        with self.assertRaises(ValueError):
+            UserImporter(batch_size=0)
+
+
+class UserImporterIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import hashing, models
+        from ..imports import UserImporter
+        models.User.drop_collection()
+        models.ConfirmToken.drop_collection()
+        hashing.set_rounds(4)
+        self.importer = UserImporter(workers=0, batch_size=2)
+
+    def tearDown(self):
+        from stackcite.users import hashing
+        hashing.set_rounds(12)
+
+    def test_run_creates_users(self):
+        """UserImporter.run() creates a user for every valid record
+        """
+        from stackcite.users import models
+        lines = _lines(
+            {'email': 'one@email.com', 'password': 'T3stPa$$word'},
+            {'email': 'two@email.com', 'password': 'T3stPa$$word'},
+            {'email': 'three@email.com', 'password': 'T3stPa$$word'})
+        list(self.importer.run(lines))
+        self.assertEqual(3, models.User.objects.count())
+
+    def test_run_creates_confirmation_tokens(self):
+        """UserImporter.run() creates a confirmation token for every new user
+        """
+        from stackcite.users import models
+        lines = _lines(
+            {'email': 'one@email.com', 'password': 'T3stPa$$word'},
+            {'email': 'two@email.com', 'password': 'T3stPa$$word'})
+        results = list(self.importer.run(lines))
+        for result in results:
+            token = models.ConfirmToken.objects.get(_user__id=result['id'])
+            self.assertIsNotNone(token.key)
+
+    def test_imported_user_password_checks(self):
+        """UserImporter.run() stores a password that can be authenticated
+        """
+        from stackcite.users import models
+        lines = _lines({'email': 'one@email.com', 'password': 'T3stPa$$word'})
+        list(self.importer.run(lines))
+        user = models.User.authenticate('one@email.com', 'T3stPa$$word')
+        self.assertEqual('one@email.com', user.email)
+
+    def test_run_reports_duplicate_email(self):
+        """UserImporter.run() reports an existing email without aborting the batch
+        """
+        testing.utils.create_user('one@email.com', 'T3stPa$$word', save=True)
+        lines = _lines(
+            {'email': 'one@email.com', 'password': 'T3stPa$$word'},
+            {'email': 'two@email.com', 'password': 'T3stPa$$word'})
+        results = [r['status'] for r in self.importer.run(lines)]
+        self.assertEqual(['failed', 'created'], results)
+
+    def test_run_reports_invalid_records(self):
+        """UserImporter.run() reports invalid JSON and schema errors by line
+        """
+        lines = [
+            'not json',
+            json.dumps({'email': 'not an email', 'password': 'T3stPa$$word'}),
+            json.dumps({'email': 'one@email.com', 'password': 'T3stPa$$word'})]
+        results = [(r['line'], r['status']) for r in self.importer.run(lines)]
+        expected = [(1, 'failed'), (2, 'failed'), (3, 'created')]
+        self.assertEqual(expected, results)
+
+    def test_run_skips_blank_lines(self):
+        """UserImporter.run() ignores blank lines
+        """
+        lines = ['', json.dumps(
+            {'email': 'one@email.com', 'password': 'T3stPa$$word'}), '\n']
+        results = [r['line'] for r in self.importer.run(lines)]
+        self.assertEqual([2], results)
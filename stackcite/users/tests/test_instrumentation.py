@@ -0,0 +1,93 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class TimingsTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import instrumentation
+        self.timings = instrumentation.Timings()
+
+    def test_add_counts_calls(self):
+        """Timings.add() counts calls per category
+        """
+        self.timings.add('db', 0.001)
+        self.timings.add('db', 0.002)
+        self.assertEqual(2, self.timings.count('db'))
+
+    def test_total_returns_milliseconds(self):
+        """Timings.total() returns the total time in milliseconds
+        """
+        self.timings.add('db', 0.001)
+        self.timings.add('db', 0.002)
+        self.assertAlmostEqual(3.0, self.timings.total('db'))
+
+    def test_server_timing_formats_header(self):
+        """Timings.server_timing() formats a Server-Timing header value
+        """
+        self.timings.add('hash', 0.25)
+        result = self.timings.server_timing(total=300)
+        expected = 'hash;dur=250.00;desc="1 calls", total;dur=300.00'
+        self.assertEqual(expected, result)
+
+
+class TimedTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def tearDown(self):
+        from .. import instrumentation
+        instrumentation._local.timings = None
+
+    def test_timed_records_time_in_request(self):
+        """timed() adds time to the current request's timings
+        """
+        from .. import instrumentation
+        timings = instrumentation._local.timings = instrumentation.Timings()
+        with instrumentation.timed('serialize'):
+            pass
+        self.assertEqual(1, timings.count('serialize'))
+
+    def test_timed_outside_request_does_nothing(self):
+        """timed() does nothing outside of an instrumented request
+        """
+        from .. import instrumentation
+        result = instrumentation.timed('serialize')
+        self.assertIs(instrumentation._NULL_TIMER, result)
+
+
+class TimingTweenTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_tween_sets_server_timing_header(self):
+        """timing_tween_factory() adds a Server-Timing header to the response
+        """
+        from pyramid.response import Response
+        from pyramid.testing import DummyRequest
+        from .. import instrumentation
+
+        def handler(request):
+            with instrumentation.timed('db'):
+                pass
+            return Response()
+
+        tween = instrumentation.timing_tween_factory(handler, None)
+        response = tween(DummyRequest())
+        result = response.headers['Server-Timing']
+        self.assertIn('db;dur=', result)
+        self.assertIn('total;dur=', result)
+
+    def test_tween_clears_timings(self):
+        """timing_tween_factory() clears the timings after the request
+        """
+        from pyramid.response import Response
+        from pyramid.testing import DummyRequest
+        from .. import instrumentation
+        tween = instrumentation.timing_tween_factory(
+            lambda request: Response(), None)
+        tween(DummyRequest())
+        self.assertIsNone(instrumentation.current())
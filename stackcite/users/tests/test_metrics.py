@@ -0,0 +1,241 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class CounterTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import metrics
+        self.registry = metrics.Registry()
+        self.counter = metrics.Counter(
+            'test_total', 'A test counter.', ('result',),
+            registry=self.registry)
+
+    def test_inc_increments_value(self):
+        """Counter.inc() increments the value for a set of labels
+        """
+        self.counter.inc(result='success')
+        self.counter.inc(2, result='success')
+        result = self.counter.value(result='success')
+        self.assertEqual(3, result)
+
+    def test_inc_rejects_negative_amount(self):
+        """Counter.inc() raises exception for a negative amount
+        """
+        with self.assertRaises(ValueError):
+            self.counter.inc(-1, result='success')
+
+    def test_inc_rejects_unknown_labels(self):
+        """Counter.inc() raises exception for unexpected labels
+        """
+        with self.assertRaises(ValueError):
+            self.counter.inc(outcome='success')
+
+    def test_render_includes_sample(self):
+        """Registry.render() renders counter samples
+        """
+        self.counter.inc(result='success')
+        result = self.registry.render()
+        self.assertIn('# TYPE test_total counter', result)
+        self.assertIn('test_total{result="success"} 1.0', result)
+
+    def test_set_function_reports_cumulative_count(self):
+        """Counter.set_function() reports the function's count as a counter
+        """
+        from .. import metrics
+        registry = metrics.Registry()
+        counter = metrics.Counter(
+            'test_hits_total', 'A test counter.', registry=registry)
+        counter.set_function(lambda: 3)
+        result = registry.render()
+        self.assertIn('# TYPE test_hits_total counter', result)
+        self.assertIn('test_hits_total 3.0', result)
+
+
+class GaugeTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_set_function_reports_function_value(self):
+        """Gauge.set_function() reports the function's value when collected
+        """
+        from .. import metrics
+        registry = metrics.Registry()
+        gauge = metrics.Gauge('test_depth', 'A test gauge.', registry=registry)
+        gauge.set_function(lambda: 7)
+        self.assertIn('test_depth 7.0', registry.render())
+
+    def test_set_function_rejects_labelled_gauge(self):
+        """Gauge.set_function() raises exception for a labelled gauge
+        """
+        from .. import metrics
+        gauge = metrics.Gauge('test_depth', 'A test gauge.', ('pool',))
+        with self.assertRaises(ValueError):
+            gauge.set_function(lambda: 7)
+
+
+class HashCostsReporterTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_disabled_reporter_starts_no_thread(self):
+        """HashCostsReporter.ensure_started() does nothing with an interval of 0
+        """
+        from .. import metrics
+        reporter = metrics.HashCostsReporter(interval=0)
+        reporter.ensure_started()
+        self.assertIsNone(reporter._thread)
+
+    def test_configure_rejects_negative_interval(self):
+        """HashCostsReporter.configure() raises exception for a negative interval
+        """
+        from .. import metrics
+        with self.assertRaises(ValueError):
+            metrics.HashCostsReporter(interval=-1)
+
+
+class HistogramTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import metrics
+        self.registry = metrics.Registry()
+        self.histogram = metrics.Histogram(
+            'test_seconds', 'A test histogram.', buckets=(0.1, 1),
+            registry=self.registry)
+
+    def test_render_includes_cumulative_buckets(self):
+        """Registry.render() renders cumulative histogram buckets
+        """
+        self.histogram.observe(0.05)
+        self.histogram.observe(0.5)
+        self.histogram.observe(5)
+        result = self.registry.render()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1.0', result)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2.0', result)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3.0', result)
+        self.assertIn('test_seconds_count 3.0', result)
+
+
+class RegistryTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_register_rejects_duplicate_metric(self):
+        """Registry.register() raises exception for a duplicate metric name
+        """
+        from .. import metrics
+        registry = metrics.Registry()
+        metrics.Counter('test_total', 'A test counter.', registry=registry)
+        with self.assertRaises(ValueError):
+            metrics.Counter('test_total', 'A test counter.', registry=registry)
+
+
+class MultiprocessRegistryTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        import tempfile
+        from .. import metrics
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = metrics.Registry(self.directory.name)
+        self.counter = metrics.Counter(
+            'test_total', 'A test counter.', registry=self.registry)
+        self.gauge = metrics.Gauge(
+            'test_depth', 'A test gauge.', registry=self.registry)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_snapshot(self, pid, snapshot):
+        import json
+        import os
+        path = os.path.join(self.directory.name, '{}.json'.format(pid))
+        with open(path, 'w') as f:
+            json.dump(snapshot, f)
+
+    def test_render_sums_counters_across_processes(self):
+        """Registry.render() sums counters written by other processes
+        """
+        import os
+        self.counter.inc(2)
+        self.write_snapshot(os.getppid(), {'test_total': [['test_total', {}, 3]]})
+        result = self.registry.render()
+        self.assertIn('test_total 5.0', result)
+
+    def test_render_ignores_gauges_of_dead_processes(self):
+        """Registry.render() ignores gauges written by processes that exited
+        """
+        self.gauge.set(1)
+        # PIDs are far below 2 ** 22 on every supported platform
+        self.write_snapshot(2 ** 22 + 1, {'test_depth': [['test_depth', {}, 5]]})
+        result = self.registry.render()
+        self.assertIn('test_depth 1.0', result)
+
+
+class _PoolEvent(object):
+
+    def __init__(self, **kwargs):
+        self.address = ('localhost', 27017)
+        self.__dict__.update(kwargs)
+
+
+class PoolMetricsListenerTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from .. import metrics
+        self.listener = metrics.PoolMetricsListener()
+        metrics._reset_pool_metrics()
+
+    def tearDown(self):
+        from .. import metrics
+        metrics._reset_pool_metrics()
+
+    def value(self, gauge):
+        return dict((labels['address'], value)
+                    for _, labels, value in gauge.samples())
+
+    def test_tracks_open_connections(self):
+        """PoolMetricsListener counts created and closed connections
+        """
+        from .. import metrics
+        self.listener.connection_created(_PoolEvent())
+        self.listener.connection_created(_PoolEvent())
+        self.listener.connection_closed(_PoolEvent())
+        result = self.value(metrics.MONGO_POOL_CONNECTIONS)
+        self.assertEqual({'localhost:27017': 1}, result)
+
+    def test_tracks_checked_out_connections(self):
+        """PoolMetricsListener counts checked out connections
+        """
+        from .. import metrics
+        self.listener.connection_checked_out(_PoolEvent())
+        self.listener.connection_checked_out(_PoolEvent())
+        self.listener.connection_checked_in(_PoolEvent())
+        result = self.value(metrics.MONGO_POOL_CHECKED_OUT)
+        self.assertEqual({'localhost:27017': 1}, result)
+
+    def test_pool_created_sets_max_size(self):
+        """PoolMetricsListener reports the pool's maximum size
+        """
+        from .. import metrics
+        self.listener.pool_created(_PoolEvent(options={'maxPoolSize': 50}))
+        result = self.value(metrics.MONGO_POOL_MAX_SIZE)
+        self.assertEqual(50, result['localhost:27017'])
+
+    def test_counts_checkout_failures(self):
+        """PoolMetricsListener counts failed checkouts by reason
+        """
+        from .. import metrics
+        before = metrics.MONGO_POOL_CHECKOUT_FAILURES.value(reason='timeout')
+        self.listener.connection_check_out_failed(
+            _PoolEvent(reason='timeout'))
+        result = metrics.MONGO_POOL_CHECKOUT_FAILURES.value(reason='timeout')
+        self.assertEqual(before + 1, result)
@@ -0,0 +1,290 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class FakeMessage(object):
+
+    kind = 'confirmation'
+    recipient = 'test@email.com'
+    payload = {'key': 'abc123'}
+
+
+class FakeTransport(object):
+
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = []
+
+    def send_batch(self, messages):
+        self.batches.append([m.recipient for m in messages])
+        return [self.error] * len(messages)
+
+
+class BackoffTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_doubles_delay_after_each_failure(self):
+        """backoff() doubles the delay after every failed attempt
+        """
+        from ..outbox import backoff
+        result = [backoff(attempts, 5, 300) for attempts in (1, 2, 3)]
+        self.assertEqual([5, 10, 20], result)
+
+    def test_caps_delay(self):
+        """backoff() never returns more than 'max_delay'
+        """
+        from ..outbox import backoff
+        self.assertEqual(300, backoff(10, 5, 300))
+
+
+class TransportTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_render_includes_key(self):
+        """render() writes the confirmation key to the email body
+        """
+        from ..outbox import render
+        email = render(FakeMessage(), 'noreply@stackcite.com')
+        self.assertEqual('test@email.com', email['To'])
+        self.assertIn('abc123', email.get_content())
+
+    def test_file_transport_appends_messages(self):
+        """FileTransport.send_batch() appends every message to its file
+        """
+        import os
+        import tempfile
+        from ..outbox import FileTransport
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            transport = FileTransport(path)
+            result = transport.send_batch([FakeMessage(), FakeMessage()])
+            with open(path) as mbox:
+                content = mbox.read()
+        finally:
+            os.remove(path)
+        self.assertEqual([None, None], result)
+        self.assertEqual(2, content.count('abc123'))
+
+    def test_file_transport_reports_write_errors(self):
+        """FileTransport.send_batch() returns an error per message if it cannot write
+        """
+        import tempfile
+        from ..outbox import FileTransport
+        with tempfile.TemporaryDirectory() as path:
+            transport = FileTransport(path)
+            result = transport.send_batch([FakeMessage(), FakeMessage()])
+        self.assertEqual(2, len(result))
+        for error in result:
+            self.assertIsInstance(error, OSError)
+
+    def test_smtp_transport_reports_connection_errors(self):
+        """SMTPTransport.send_batch() returns an error per message if it cannot connect
+        """
+        import socket
+        from ..outbox import SMTPTransport
+        listener = socket.socket()
+        listener.bind(('localhost', 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        transport = SMTPTransport(port=port, timeout=1)
+        result = transport.send_batch([FakeMessage(), FakeMessage()])
+        self.assertEqual(2, len(result))
+        for error in result:
+            self.assertIsInstance(error, Exception)
+
+    def test_transport_from_settings(self):
+        """transport_from_settings() configures the selected transport
+        """
+        from ..outbox import SMTPTransport, transport_from_settings
+        transport = transport_from_settings({
+            'outbox.transport': 'smtp',
+            'outbox.sender': 'test@stackcite.com',
+            'outbox.smtp.port': '8025',
+            'outbox.smtp.starttls': 'true',
+            'outbox.smtp.username': ''})
+        self.assertIsInstance(transport, SMTPTransport)
+        self.assertEqual(
+            ('test@stackcite.com', 8025, True, None),
+            (transport.sender, transport.port, transport.starttls,
+             transport.username))
+
+    def test_transport_from_settings_rejects_unknown_transport(self):
+        """transport_from_settings() raises exception for an unknown transport
+        """
+        from ..outbox import transport_from_settings
+        with self.assertRaises(ValueError):
+            transport_from_settings({'outbox.transport': 'pigeon'})
+
+
+class OutboxDispatcherTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def test_configure_does_not_start_dispatcher(self):
+        """OutboxDispatcher.configure() only stores settings
+        """
+        from ..outbox import OutboxDispatcher
+        dispatcher = OutboxDispatcher(interval=60)
+        dispatcher.configure(background=True, interval=60)
+        self.assertIsNone(dispatcher._thread)
+
+    def test_notify_starts_background_dispatcher(self):
+        """OutboxDispatcher.notify() starts the thread with 'background' set
+        """
+        from ..outbox import OutboxDispatcher
+        dispatcher = OutboxDispatcher(background=True, interval=60)
+        dispatcher.run_once = lambda: None
+        dispatcher.notify()
+        self.addCleanup(dispatcher.stop)
+        self.assertTrue(dispatcher._thread.is_alive())
+
+    def test_restarts_in_forked_process(self):
+        """OutboxDispatcher.notify() starts a new thread in a forked process
+        """
+        from ..outbox import OutboxDispatcher
+        dispatcher = OutboxDispatcher(background=True, interval=60)
+        dispatcher.run_once = lambda: None
+        dispatcher.notify()
+        self.addCleanup(dispatcher.stop)
+        inherited = dispatcher._thread
+        # As if this process had been forked after the thread was started
+        dispatcher._pid = -1
+        dispatcher.notify()
+        self.assertIsNot(inherited, dispatcher._thread)
+
+
+class OutboxDispatcherIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from datetime import datetime, timedelta
+        from stackcite.users import models
+        models.OutboxMessage.drop_collection()
+        # Messages written during the test are already due
+        self.now = datetime.utcnow() + timedelta(seconds=1)
+        self.transport = FakeTransport()
+
+    def make_dispatcher(self, **kwargs):
+        from ..outbox import OutboxDispatcher
+        return OutboxDispatcher(
+            transport=self.transport, clock=lambda: self.now, **kwargs)
+
+    def enqueue(self, recipient='test@email.com', ttl=900):
+        from stackcite.users import models
+        return models.OutboxMessage.new(
+            'confirmation', recipient, {'key': 'abc123'}, ttl=ttl, save=True)
+
+    def test_dispatch_delivers_pending_messages(self):
+        """OutboxDispatcher.dispatch() delivers pending messages and marks them sent
+        """
+        message = self.enqueue()
+        self.make_dispatcher().dispatch()
+        message.reload()
+        self.assertEqual(['test@email.com'], self.transport.batches[0])
+        self.assertEqual('sent', message.state)
+
+    def test_dispatch_sends_batches(self):
+        """OutboxDispatcher.dispatch() sends at most 'batch_size' messages at once
+        """
+        for idx in range(3):
+            self.enqueue('test{}@email.com'.format(idx))
+        dispatcher = self.make_dispatcher(batch_size=2)
+        self.assertEqual(2, dispatcher.dispatch())
+        self.assertEqual(1, dispatcher.dispatch())
+        self.assertEqual([2, 1], [len(b) for b in self.transport.batches])
+
+    def test_sent_messages_are_not_sent_again(self):
+        """OutboxDispatcher.dispatch() delivers each message once
+        """
+        self.enqueue()
+        dispatcher = self.make_dispatcher()
+        dispatcher.dispatch()
+        self.assertEqual(0, dispatcher.dispatch())
+
+    def test_failed_delivery_is_retried_after_backoff(self):
+        """OutboxDispatcher.dispatch() retries a failed message after its backoff
+        """
+        from datetime import timedelta
+        message = self.enqueue()
+        self.transport.error = OSError('Connection refused')
+        dispatcher = self.make_dispatcher(delay=5)
+        dispatcher.dispatch()
+        self.assertEqual(0, dispatcher.dispatch())
+        self.now += timedelta(seconds=5)
+        self.transport.error = None
+        self.assertEqual(1, dispatcher.dispatch())
+        message.reload()
+        self.assertEqual(('sent', 2), (message.state, message.attempts))
+
+    def test_gives_up_after_max_attempts(self):
+        """OutboxDispatcher.dispatch() marks a message failed after 'max_attempts'
+        """
+        message = self.enqueue()
+        self.transport.error = OSError('Connection refused')
+        self.make_dispatcher(max_attempts=1).dispatch()
+        message.reload()
+        self.assertEqual('failed', message.state)
+        self.assertEqual('Connection refused', message.error)
+
+    def test_skips_expired_messages(self):
+        """OutboxDispatcher.dispatch() does not deliver expired messages
+        """
+        from datetime import timedelta
+        self.enqueue(ttl=60)
+        self.now += timedelta(seconds=61)
+        self.assertEqual(0, self.make_dispatcher().dispatch())
+
+    def test_claimed_messages_are_skipped_until_lease_expires(self):
+        """OutboxDispatcher.claim() skips messages claimed by another dispatcher
+        """
+        from datetime import timedelta
+        self.enqueue()
+        self.assertEqual(1, len(self.make_dispatcher(lease=60).claim()))
+        self.assertEqual([], self.make_dispatcher().claim())
+        self.now += timedelta(seconds=60)
+        self.assertEqual(1, len(self.make_dispatcher().claim()))
+
+
+class IssueConfirmationIntegrationTests(unittest.TestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    def setUp(self):
+        from stackcite.users import models
+        models.User.drop_collection()
+        models.ConfirmToken.drop_collection()
+        models.OutboxMessage.drop_collection()
+        self.user = models.User.new(
+            'test@email.com', 'T3stPa$$word', save=True)
+
+    def test_writes_token_and_message(self):
+        """issue_confirmation() saves a token and an outbox message with its key
+        """
+        from stackcite.users import models
+        from ..outbox import issue_confirmation
+        token = issue_confirmation(self.user)
+        saved = models.ConfirmToken.objects.get(_key=token.key)
+        message = models.OutboxMessage.objects.get()
+        self.assertEqual(self.user.id, saved.user.id)
+        self.assertEqual({'key': token.key}, message.payload)
+
+    def test_failed_message_removes_token(self):
+        """issue_confirmation() leaves no token behind if its message is not written
+        """
+        from pymongo.errors import PyMongoError
+        from stackcite.users import models
+        from ..outbox import issue_confirmation
+        # The message collection rejects every document
+        collection = models.OutboxMessage._get_collection()
+        collection.database.command(
+            'collMod', collection.name,
+            validator={'never': {'$exists': True}})
+        self.addCleanup(models.OutboxMessage.drop_collection)
+        with self.assertRaises(PyMongoError):
+            issue_confirmation(self.user)
+        self.assertEqual(0, models.ConfirmToken.objects.count())
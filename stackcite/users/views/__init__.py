@@ -1,3 +1,18 @@
+from stackcite.users import resources
+
 from .auth import AuthViews
 from .conf import ConfirmationViews
+from .imports import ImportViews
+from .metrics import MetricsViews
 from .users import UserCollectionViews, UserDocumentViews
+
+
+# Labels used to report per-view metrics
+VIEW_LABELS = {
+    resources.AuthResource: AuthViews.__name__,
+    resources.ConfirmResource: ConfirmationViews.__name__,
+    resources.ImportResource: ImportViews.__name__,
+    resources.MetricsResource: MetricsViews.__name__,
+    resources.UserCollection: UserCollectionViews.__name__,
+    resources.UserDocument: UserDocumentViews.__name__
+}
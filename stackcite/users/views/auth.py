@@ -5,7 +5,23 @@ from mongoengine import context_managers
 from pyramid.view import view_defaults, view_config
 
 from stackcite.api import views, exceptions as api_exc
-from stackcite.users import models, exceptions as exc, resources, schema
+from stackcite.users import (
+    auth,
+    instrumentation,
+    metrics,
+    models,
+    exceptions as exc,
+    resources,
+    schema
+)
+
+from . import utils
+
+
+def _dump_token(token):
+    if isinstance(token, auth.SignedToken):
+        return schema.SCHEMAS.dump(schema.SignedAuthToken, token)
+    return schema.SCHEMAS.dump(schema.AuthToken, token)
 
 
 @view_defaults(context=resources.AuthResource, renderer='json')
@@ -13,14 +29,26 @@ class AuthViews(views.BaseView):
 
     @view_config(request_method='POST', permission='create')
     def create(self):
+        email = None
         try:
+            # Over-limit clients are rejected before any password is hashed;
+            # only failed attempts count against an email address
+            limiter = auth.LOGIN_LIMITER
+            limiter.check('address', limiter.client_address(self.request))
             auth_data = self.request.json_body
-            auth_schm = schema.Authenticate(strict=True)
-            auth_data = auth_schm.load(auth_data).data
+            if isinstance(auth_data, dict):
+                email = auth_data.get('email')
+                if isinstance(email, str):
+                    limiter.check('email', email, count=False)
+            with instrumentation.timed('serialize'):
+                auth_schm = schema.SCHEMAS.schema(
+                    schema.Authenticate, strict=True)
+                auth_data = auth_schm.load(auth_data).data
             auth_token = self.context.create(auth_data)
+            metrics.AUTH_ATTEMPTS.inc(result='success')
             with context_managers.no_dereference(models.AuthToken):
-                token_schm = schema.AuthToken()
-                auth_token = token_schm.dump(auth_token).data
+                with instrumentation.timed('serialize'):
+                    auth_token = _dump_token(auth_token)
             self.request.response.status_code = 201
             return auth_token
 
@@ -32,22 +60,31 @@ class AuthViews(views.BaseView):
             raise api_exc.APIValidationError(detail=errors)
 
         except (mongoengine.DoesNotExist, exc.AuthenticationError):
+            metrics.AUTH_ATTEMPTS.inc(result='failure')
+            if isinstance(email, str):
+                auth.LOGIN_LIMITER.add('email', email)
             raise api_exc.APIAuthenticationFailed()
 
+        except exc.ServiceUnavailableError as err:
+            raise utils.service_unavailable(err)
+
+        except exc.RateLimitedError as err:
+            raise utils.too_many_requests(err)
+
     @view_config(request_method='GET', permission='retrieve')
     def retrieve(self):
         token = self.request.token
         auth_token = self.context.retrieve(token)
-        schm = schema.AuthToken()
-        auth_token, errors = schm.dump(auth_token)
+        with instrumentation.timed('serialize'):
+            auth_token = _dump_token(auth_token)
         return auth_token
 
     @view_config(request_method='PUT', permission='update')
     def update(self):
         token = self.request.token
         auth_token = self.context.update(token)
-        schm = schema.AuthToken()
-        auth_token, errors = schm.dump(auth_token)
+        with instrumentation.timed('serialize'):
+            auth_token = _dump_token(auth_token)
         return auth_token
 
     @view_config(request_method='DELETE', permission='delete')
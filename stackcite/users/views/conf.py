@@ -2,7 +2,8 @@ from mongoengine import context_managers
 from pyramid.view import view_defaults, view_config
 
 from stackcite.api import views, exceptions as exc
-from stackcite.users import auth, models, resources, schema
+from stackcite.users import (
+    auth, identity, instrumentation, models, resources, schema)
 
 
 @view_defaults(context=resources.ConfirmResource, renderer='json')
@@ -12,11 +13,13 @@ class ConfirmationViews(views.BaseView):
     @views.managed_view
     def create(self):
         data = self.request.json_body
-        schm = schema.CreateConfirmationToken(strict=True)
-        data = schm.load(data).data
+        with instrumentation.timed('serialize'):
+            schm = schema.SCHEMAS.schema(
+                schema.CreateConfirmationToken, strict=True)
+            data = schm.load(data).data
 
         # Forbid creating new tokens for confirmed users
-        user = models.User.objects.get(email=data['email'])
+        user = identity.get(models.User, email=data['email'])
         if auth.USERS in user.groups:
             msg = 'User is already confirmed.'
             raise exc.APIForbidden(detail=msg)
@@ -28,8 +31,10 @@ class ConfirmationViews(views.BaseView):
     @views.managed_view
     def update(self):
         data = self.request.json_body
-        schm = schema.UpdateConfirmationToken(strict=True)
-        data = schm.load(data).data
+        with instrumentation.timed('serialize'):
+            schm = schema.SCHEMAS.schema(
+                schema.UpdateConfirmationToken, strict=True)
+            data = schm.load(data).data
         conf_token = self.context.update(data)
         with context_managers.no_dereference(models.ConfirmToken):
             return {
@@ -0,0 +1,26 @@
+from pyramid.response import Response
+from pyramid.view import view_defaults, view_config
+
+from stackcite.api import views
+from stackcite.users import codec, resources
+
+
+def _ndjson(results):
+    for result in results:
+        yield codec.CODEC.dumps(result) + b'\n'
+
+
+@view_defaults(context=resources.ImportResource)
+class ImportViews(views.BaseView):
+
+    CONTENT_TYPE = 'application/x-ndjson'
+
+    @view_config(request_method='POST', permission='create')
+    def create(self):
+        # Records are read from the request body and results are written to
+        # the response as the import progresses
+        results = self.context.create(self.request.body_file)
+        return Response(
+            app_iter=_ndjson(results),
+            content_type=self.CONTENT_TYPE,
+            charset='utf-8')
@@ -0,0 +1,19 @@
+from pyramid.response import Response
+from pyramid.view import view_defaults, view_config
+
+from stackcite.api import views
+from stackcite.users import resources
+
+
+@view_defaults(context=resources.MetricsResource)
+class MetricsViews(views.BaseView):
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+    @view_config(request_method='GET', permission='retrieve')
+    def retrieve(self):
+        body = self.context.retrieve()
+        return Response(
+            body=body.encode('utf-8'),
+            content_type=self.CONTENT_TYPE,
+            charset='utf-8')
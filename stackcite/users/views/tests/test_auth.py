@@ -71,6 +71,42 @@ class AuthViewsTests(testing.views.CollectionViewTestCase):
         with(self.assertRaises(exc.APIAuthenticationFailed)):
             view.create()
 
+    def test_create_over_rate_limit_returns_429(self):
+        """AuthViews.create() over the rate limit raises 429 TOO MANY REQUESTS
+        """
+        from pyramid import httpexceptions
+        from stackcite.api import exceptions as exc
+        from stackcite.users import auth
+        auth.LOGIN_LIMITER.configure(per_email=1)
+        self.addCleanup(auth.LOGIN_LIMITER.configure)
+        data = {
+            'email': 'test@email.com',
+            'password': 'T3stPa$$word'}
+        testing.utils.create_user(data['email'], 'B4dPa$$word', save=True)
+        view = self.make_view()
+        view.request.json_body = data
+        with self.assertRaises(exc.APIAuthenticationFailed):
+            view.create()
+        view = self.make_view()
+        view.request.json_body = data
+        with self.assertRaises(httpexceptions.HTTPTooManyRequests):
+            view.create()
+
+    def test_successful_logins_do_not_count_against_email(self):
+        """AuthViews.create() only counts failed logins against an email limit
+        """
+        from stackcite.users import auth
+        auth.LOGIN_LIMITER.configure(per_email=1)
+        self.addCleanup(auth.LOGIN_LIMITER.configure)
+        data = {
+            'email': 'test@email.com',
+            'password': 'T3stPa$$word'}
+        testing.utils.create_user(data['email'], data['password'], save=True)
+        for _ in range(3):
+            view = self.make_view()
+            view.request.json_body = data
+            view.create()
+
     def test_retrieve_returns_token_key(self):
         """AuthViews.retrieve() returns an auth token with key
         """
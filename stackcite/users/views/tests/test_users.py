@@ -65,6 +65,50 @@ class UserCollectionCreateViewTests(testing.views.CollectionViewTestCase):
             self.fail(msg.format(err))
 
 
+class UserCollectionRetrieveViewTests(testing.views.CollectionViewTestCase):
+
+    layer = testing.layers.MongoTestLayer
+
+    from stackcite.users import resources
+    from stackcite.users import views
+    RESOURCE_CLASS = resources.UserCollection
+    VIEW_CLASS = views.UserCollectionViews
+
+    def setUp(self):
+        from stackcite.users import models
+        models.User.drop_collection()
+        for idx in range(3):
+            email = 'test{}@email.com'.format(idx)
+            testing.utils.create_user(email, 'T3stPa$$word', save=True)
+
+    def test_cursor_returns_page(self):
+        """UserCollectionViews.retrieve() returns a page for an empty cursor
+        """
+        view = self.make_view()
+        view.request.params = {'cursor': '', 'limit': '2'}
+        result = view.retrieve()
+        self.assertEqual(2, len(result['items']))
+        self.assertIsNotNone(result['next'])
+
+    def test_invalid_cursor_raises_exception(self):
+        """UserCollectionViews.retrieve() rejects an invalid cursor
+        """
+        view = self.make_view()
+        view.request.params = {'cursor': 'garbage'}
+        from stackcite.api import exceptions as exc
+        with self.assertRaises(exc.APIBadRequest):
+            view.retrieve()
+
+    def test_invalid_limit_raises_exception(self):
+        """UserCollectionViews.retrieve() rejects a limit above MAX_LIMIT
+        """
+        view = self.make_view()
+        view.request.params = {'cursor': '', 'limit': '1000'}
+        from stackcite.api import exceptions as exc
+        with self.assertRaises(exc.APIBadRequest):
+            view.retrieve()
+
+
 class UserDocumentViewTests(testing.views.DocumentViewTestCase):
 
     layer = testing.layers.MongoTestLayer
@@ -0,0 +1,63 @@
+import unittest
+
+from stackcite.users import testing
+
+
+class SchemaDumperTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from stackcite.users import schema
+        schema.SCHEMAS.configure()
+        self.addCleanup(schema.SCHEMAS.configure)
+
+    def test_schemas_with_other_options_dump_differently(self):
+        """schema_dumper() does not reuse a dump function for other schema options
+        """
+        from stackcite.users import schema
+        from .. import utils
+        user = testing.utils.create_user('test@email.com')
+        full = utils.schema_dumper(schema.User())(user)
+        result = utils.schema_dumper(schema.User(exclude=('email',)))(user)
+        self.assertIn('email', full)
+        self.assertNotIn('email', result)
+
+    def test_reuses_dump_function_for_same_options(self):
+        """schema_dumper() returns one dump function per set of schema options
+        """
+        from stackcite.users import schema
+        from .. import utils
+        first = utils.schema_dumper(schema.User())
+        second = utils.schema_dumper(schema.User())
+        self.assertIs(first, second)
+
+
+class ResourceSchemaTests(unittest.TestCase):
+
+    layer = testing.layers.UnitTestLayer
+
+    def setUp(self):
+        from stackcite.users import schema
+        schema.SCHEMAS.configure()
+        self.addCleanup(schema.SCHEMAS.configure)
+
+    def test_reuses_schema(self):
+        """resource_schema() returns one schema per resource schema and method
+        """
+        from stackcite.users import resources
+        from .. import utils
+        first = utils.resource_schema(resources.UserCollection, 'POST')
+        second = utils.resource_schema(resources.UserCollection, 'POST')
+        other = utils.resource_schema(resources.UserCollection, 'PUT')
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_sets_interned_method(self):
+        """resource_schema() sets a method that compares with 'is' to the literal
+        """
+        from stackcite.users import resources
+        from .. import utils
+        method = ''.join(['PO', 'ST'])
+        schm = utils.resource_schema(resources.UserCollection, method)
+        self.assertIs('POST', schm.method)
@@ -1,7 +1,9 @@
+from pyramid.settings import asbool
 from pyramid.view import view_defaults, view_config
 
 from stackcite.api import views as api_views, exceptions as api_exc
-from stackcite.users import resources
+from stackcite.users import instrumentation, resources
+from stackcite.users.resources import cursors
 
 from . import utils
 
@@ -13,8 +15,9 @@ class UserDocumentViews(api_views.APIDocumentViews):
     @utils.managed_view
     def update(self):
         data = self.request.json_body
-        schm = self.context.schema(strict=True)
-        data = schm.load(data).data
+        with instrumentation.timed('serialize'):
+            schm = utils.resource_schema(self.context, self.request.method)
+            data = schm.load(data).data
 
         # Forbid changing own group
         auth_id = str(self.request.user.id) if self.request.user else ''
@@ -23,7 +26,8 @@ class UserDocumentViews(api_views.APIDocumentViews):
             raise api_exc.APIForbidden(detail=msg)
 
         result = self.context.update(data)
-        result = schm.dump(result).data
+        with instrumentation.timed('serialize'):
+            result = utils.schema_dumper(schm)(result)
         return result
 
 
@@ -34,9 +38,47 @@ class UserCollectionViews(api_views.APICollectionViews):
     @utils.managed_view
     def create(self):
         data = self.request.json_body
-        schm = self.context.schema(strict=True)
-        data = schm.load(data).data
+        with instrumentation.timed('serialize'):
+            schm = utils.resource_schema(self.context, self.request.method)
+            data = schm.load(data).data
         user = self.context.create(data)
-        result = schm.dump(user).data
+        with instrumentation.timed('serialize'):
+            result = utils.schema_dumper(schm)(user)
         self.request.response.status = 201
         return result
+
+    # Largest page size for cursor paging
+    MAX_LIMIT = 100
+
+    @view_config(request_method='GET', permission='retrieve')
+    def retrieve(self):
+        """
+        Lists users. Passing a `cursor` parameter (empty for the first page)
+        switches from offset paging to cursor paging, with optional `limit`,
+        `sort` (`id` or `joined`) and `count` (`false` omits the total)
+        parameters.
+        """
+        params = self.request.params
+        if 'cursor' not in params:
+            return super().retrieve()
+        try:
+            limit = int(params.get('limit', 20))
+            if not 0 < limit <= self.MAX_LIMIT:
+                raise ValueError()
+        except ValueError:
+            msg = 'Limit must be between 1 and {}.'.format(self.MAX_LIMIT)
+            raise api_exc.APIValidationError(detail={'limit': [msg]})
+        try:
+            page = self.context.page(
+                cursor=params['cursor'],
+                limit=limit,
+                sort=params.get('sort', 'id'),
+                count=asbool(params.get('count', True)))
+        except cursors.InvalidCursor:
+            msg = 'Invalid cursor or sort order.'
+            raise api_exc.APIValidationError(detail={'cursor': [msg]})
+        with instrumentation.timed('serialize'):
+            schm = utils.resource_schema(self.context, self.request.method)
+            dump = utils.schema_dumper(schm)
+            page['items'] = [dump(user) for user in page['items']]
+        return page
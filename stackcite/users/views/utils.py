@@ -1,7 +1,78 @@
 import functools
+import sys
+
+from pyramid import httpexceptions
 
 from stackcite.api import views as api_views, exceptions as api_exc
-from stackcite.users import exceptions as exc
+from stackcite.users import schema, exceptions as exc
+
+
+def service_unavailable(err):
+    """
+    Converts a :class:`~ServiceUnavailableError` into a `503 SERVICE
+    UNAVAILABLE` response with a `Retry-After` header.
+    """
+    headers = {'Retry-After': str(err.retry_after)}
+    return httpexceptions.HTTPServiceUnavailable(
+        detail=err.message, headers=headers)
+
+
+def too_many_requests(err):
+    """
+    Converts a :class:`~RateLimitedError` into a `429 TOO MANY REQUESTS`
+    response with a `Retry-After` header.
+    """
+    headers = {'Retry-After': str(err.retry_after)}
+    return httpexceptions.HTTPTooManyRequests(
+        detail=err.message, headers=headers)
+
+
+def _names(names):
+    return tuple(sorted(names)) if names is not None else None
+
+
+def _schema_key(schm):
+    # Everything a built schema's output depends on besides its fields, or
+    # `None` if that cannot be told (e.g. a schema with a `context`)
+    if getattr(schm, 'context', None):
+        return None
+    return (
+        type(schm),
+        getattr(schm, 'strict', False),
+        getattr(schm, 'many', False),
+        getattr(schm, 'prefix', ''),
+        getattr(schm, 'method', None),
+        _names(getattr(schm, 'only', None)),
+        _names(getattr(schm, 'exclude', ())),
+        _names(getattr(schm, 'dump_only', ())),
+        _names(getattr(schm, 'load_only', ())))
+
+
+def resource_schema(resource, method, strict=True):
+    """
+    Returns an instance of a resource's schema class (its `_SCHEMA`) for a
+    request method from :data:`~stackcite.users.schema.SCHEMAS`, keyed by
+    the class and options like :func:`schema_dumper`, instead of building a
+    new one per request.
+    """
+    # Schemas compare their method with `is`, so it must be the interned
+    # string rather than the one parsed from the request
+    return schema.SCHEMAS.schema(
+        resource._SCHEMA, strict=strict, method=sys.intern(method))
+
+
+def schema_dumper(schm):
+    """
+    Returns a function dumping objects with a schema built by a resource.
+
+    A resource's schema may depend on the resource, so the dump function is
+    cached by :data:`~stackcite.users.schema.SCHEMAS` under the schema's
+    options rather than under the resource type.
+    """
+    key = _schema_key(schm)
+    if key is None:
+        return lambda obj: schm.dump(obj).data
+    return schema.SCHEMAS.dumper(key, lambda: schm)
 
 
 def managed_view(view_method):
@@ -17,4 +88,10 @@ def managed_view(view_method):
         except exc.AuthenticationError:
             raise api_exc.APIAuthenticationFailed()
 
+        except exc.ServiceUnavailableError as err:
+            raise service_unavailable(err)
+
+        except exc.RateLimitedError as err:
+            raise too_many_requests(err)
+
     return wrapper